@@ -0,0 +1,76 @@
+"""
+Benchmarks run with `make benchmark` (or `pytest benchmarks/`).
+
+The `benchmark` fixture comes from pytest-benchmark when it is installed. Otherwise a minimal
+fixture with the same calling convention is used, so the benchmarks run without extra
+dependencies and still print a summary table.
+
+The `fake_saml2aws` fixture puts the configurable fake saml2aws of tests/fake_saml2aws.py first on
+PATH, so benchmarks exercise Saml2AwsHelper end to end with real subprocesses.
+"""
+
+import statistics
+import time
+
+import pytest
+
+from tests.conftest import fake_saml2aws  # noqa: F401 - fixture
+
+try:
+    import pytest_benchmark  # noqa: F401
+
+    HAS_PYTEST_BENCHMARK = True
+except ImportError:
+    HAS_PYTEST_BENCHMARK = False
+
+DEFAULT_ROUNDS = 5
+_results = []
+
+
+class SimpleBenchmark:
+    def __init__(self, name):
+        self.name = name
+        self.extra_info = {}
+        self.timings = []
+
+    def __call__(self, func, *args, **kwargs):
+        return self.pedantic(func, args=args, kwargs=kwargs)
+
+    def pedantic(self, func, args=(), kwargs=None, setup=None, rounds=DEFAULT_ROUNDS, iterations=1):
+        kwargs = kwargs or {}
+        result = None
+        for _ in range(rounds):
+            if setup is not None:
+                setup_result = setup()
+                if setup_result is not None:
+                    args, kwargs = setup_result
+            start = time.perf_counter()
+            for _ in range(iterations):
+                result = func(*args, **kwargs)
+            self.timings.append((time.perf_counter() - start) / iterations)
+        _results.append(self)
+        return result
+
+
+if not HAS_PYTEST_BENCHMARK:
+
+    @pytest.fixture
+    def benchmark(request):
+        return SimpleBenchmark(request.node.name)
+
+    def pytest_terminal_summary(terminalreporter):
+        if not _results:
+            return
+        terminalreporter.section("benchmark")
+        terminalreporter.write_line(
+            f"{'Name':<56} {'Min (ms)':>10} {'Mean (ms)':>10} {'Median (ms)':>12} "
+            f"{'Max (ms)':>10} {'Rounds':>6}"
+        )
+        for bench in _results:
+            t = [s * 1000 for s in bench.timings]
+            terminalreporter.write_line(
+                f"{bench.name:<56} {min(t):>10.3f} {statistics.mean(t):>10.3f} "
+                f"{statistics.median(t):>12.3f} {max(t):>10.3f} {len(t):>6}"
+            )
+            for key, value in bench.extra_info.items():
+                terminalreporter.write_line(f"    {key}: {value}")
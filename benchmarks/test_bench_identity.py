@@ -0,0 +1,48 @@
+"""
+Creating the STS clients of 20 profiles: one boto3 Session per profile, as `whoami` does, versus
+StsClientFactory's sessions sharing one botocore data loader.
+"""
+
+import pytest
+
+from saml2awsmulti.identity import StsClientFactory
+
+NUM_PROFILES = 20
+
+
+@pytest.fixture(scope="module")
+def profiles(tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp("aws")
+    profiles = [f"profile-{i}" for i in range(NUM_PROFILES)]
+    cred_file = tmp_path / "credentials"
+    cred_file.write_text(
+        "".join(
+            f"[{profile}]\naws_access_key_id = AKIA{i}\naws_secret_access_key = secret\n"
+            for i, profile in enumerate(profiles)
+        )
+    )
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("AWS_SHARED_CREDENTIALS_FILE", str(cred_file))
+        monkeypatch.setenv("AWS_CONFIG_FILE", str(tmp_path / "config"))
+        yield profiles
+
+
+def _boto3_session_clients(profiles):
+    from boto3.session import Session
+
+    return [
+        Session(profile_name=profile).client("sts", region_name="us-east-1") for profile in profiles
+    ]
+
+
+def _factory_clients(profiles):
+    client_factory = StsClientFactory(region="us-east-1")
+    return [client_factory(profile) for profile in profiles]
+
+
+def test_boto3_session_per_profile(benchmark, profiles):
+    benchmark(_boto3_session_clients, profiles)
+
+
+def test_sts_client_factory(benchmark, profiles):
+    benchmark(_factory_clients, profiles)
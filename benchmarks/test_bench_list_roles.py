@@ -0,0 +1,72 @@
+"""
+Parsing a synthetic 100k-line `saml2aws list-roles` output (10k accounts, 9 roles each): the
+previous parser, which decoded the whole buffered output and split each line with replace/split,
+versus parse_list_roles_lines streaming the lines through precompiled patterns.
+"""
+
+import io
+import logging
+import tracemalloc
+
+import pytest
+
+from saml2awsmulti.saml2aws_helper import parse_list_roles_lines
+
+NUM_ACCOUNTS = 10_000
+ROLES_PER_ACCOUNT = 9
+
+
+@pytest.fixture(scope="module")
+def list_roles_output():
+    lines = []
+    for i in range(NUM_ACCOUNTS):
+        account_id = 100000000000 + i
+        lines.append(f"Account: acct-{i} ({account_id})")
+        lines.extend(f"arn:aws:iam::{account_id}:role/role-{j}" for j in range(ROLES_PER_ACCOUNT))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _buffered_parse(stdout):
+    roles = []
+    accounts_dict = {}
+    for line in stdout.decode("utf-8").splitlines():
+        logging.debug(line)
+        if line.startswith("Account:"):
+            if "(" in line:
+                acc_name, acc_id = line.replace("(", "").replace(")", "").split(" ")[1:]
+            else:
+                acc_name, acc_id = "None", line.split(" ")[1]
+            accounts_dict[acc_id] = acc_name
+        elif line.startswith("arn:"):
+            acc_id = line.split(":")[4]
+            roles.append((line, accounts_dict.get(acc_id, acc_id)))
+    return roles
+
+
+def _streaming_parse(stdout):
+    return list(parse_list_roles_lines(io.BytesIO(stdout)))
+
+
+def _peak_memory(func, stdout):
+    tracemalloc.start()
+    try:
+        func(stdout)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_buffered_parse(benchmark, list_roles_output):
+    roles = benchmark(_buffered_parse, list_roles_output)
+    assert len(roles) == NUM_ACCOUNTS * ROLES_PER_ACCOUNT
+    benchmark.extra_info["peak_mib"] = round(
+        _peak_memory(_buffered_parse, list_roles_output) / 2**20, 1
+    )
+
+
+def test_streaming_parse(benchmark, list_roles_output):
+    roles = benchmark(_streaming_parse, list_roles_output)
+    assert roles == _buffered_parse(list_roles_output)
+    benchmark.extra_info["peak_mib"] = round(
+        _peak_memory(_streaming_parse, list_roles_output) / 2**20, 1
+    )
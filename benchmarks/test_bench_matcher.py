@@ -0,0 +1,71 @@
+"""
+Keyword filtering of 50k roles against 100 keywords: one substring test per keyword and role
+versus one compiled KeywordMatcher scan per role.
+"""
+
+import random
+import string
+
+import pytest
+
+from saml2awsmulti.aws_login import to_profile_rolearn_dict
+from saml2awsmulti.matcher import KeywordMatcher
+
+NUM_ROLES = 50_000
+NUM_KEYWORDS = 100
+
+
+def _random_word(rng, length):
+    return "".join(rng.choices(string.ascii_lowercase, k=length))
+
+
+@pytest.fixture(scope="module")
+def roles():
+    rng = random.Random(42)
+    teams = [_random_word(rng, 6) for _ in range(200)]
+    envs = ["dev", "tst", "stg", "prd", "sandbox"]
+    return [
+        (
+            f"arn:aws:iam::{100000000000 + i // 10}:role/"
+            f"{rng.choice(teams)}-{rng.choice(envs)}-{_random_word(rng, 5)}",
+            f"acct-{i // 10}",
+        )
+        for i in range(NUM_ROLES)
+    ]
+
+
+@pytest.fixture(scope="module")
+def keywords():
+    rng = random.Random(7)
+    # Mostly misses, so both approaches have to test every keyword for most roles
+    return [_random_word(rng, rng.randint(4, 8)) for _ in range(NUM_KEYWORDS - 1)] + ["prd-a"]
+
+
+@pytest.fixture(scope="module")
+def profile_names(roles):
+    return [role_arn.split("role/")[-1] for role_arn, _ in roles]
+
+
+def _naive_filter(names, keywords):
+    return [name for name in names if any(k in name for k in keywords)]
+
+
+def _matcher_filter(names, keywords):
+    matcher = KeywordMatcher(keywords)
+    return [name for name in names if matcher.matches(name)]
+
+
+def test_naive_substring_filter(benchmark, profile_names, keywords):
+    result = benchmark(_naive_filter, profile_names, keywords)
+    benchmark.extra_info["matched"] = len(result)
+
+
+def test_keyword_matcher_filter(benchmark, profile_names, keywords):
+    result = benchmark(_matcher_filter, profile_names, keywords)
+    benchmark.extra_info["matched"] = len(result)
+    assert result == _naive_filter(profile_names, keywords)
+
+
+def test_to_profile_rolearn_dict(benchmark, roles, keywords):
+    result = benchmark(to_profile_rolearn_dict, roles, "RoleName", keywords, ["sandbox"])
+    benchmark.extra_info["matched"] = len(result)
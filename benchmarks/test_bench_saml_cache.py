@@ -0,0 +1,62 @@
+"""
+Serial logins to 10 roles with a fake saml2aws spending 300ms authenticating against the IdP and
+20ms per login: every login authenticating, versus `--cache-saml` reusing the first login's SAML
+assertion.
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from saml2awsmulti.login_executor import run_logins
+from saml2awsmulti.saml2aws_helper import Saml2AwsHelper
+from tests.fake_saml2aws import make_saml_assertion
+
+NUM_ROLES = 10
+IDP_DELAY = 0.3
+LOGIN_DELAY = 0.02
+
+PROFILE_ROLEARN_DICT = {
+    f"role-{i}": f"arn:aws:iam::{100000000000 + i}:role/role-{i}" for i in range(NUM_ROLES)
+}
+
+
+@pytest.fixture
+def helper(fake_saml2aws, tmp_path, monkeypatch):
+    not_on_or_after = datetime.now(timezone.utc) + timedelta(minutes=5)
+    fake_saml2aws(
+        idp_delay=IDP_DELAY,
+        login_delay=LOGIN_DELAY,
+        assertion=make_saml_assertion({}, not_on_or_after.isoformat()),
+    )
+    monkeypatch.setenv("AWS_SHARED_CREDENTIALS_FILE", str(tmp_path / "credentials"))
+    helper = Saml2AwsHelper("config_file", None, False)
+    helper._uname, helper._upass = "user", "password"
+    helper.get_capabilities()
+    return helper
+
+
+def _login(helper, aws_cred_file, cache_saml, durations):
+    start = time.perf_counter()
+    if cache_saml:
+        with helper.saml_cache():
+            results = run_logins(
+                helper, PROFILE_ROLEARN_DICT, list(PROFILE_ROLEARN_DICT), aws_cred_file
+            )
+    else:
+        results = run_logins(
+            helper, PROFILE_ROLEARN_DICT, list(PROFILE_ROLEARN_DICT), aws_cred_file
+        )
+    durations.append(time.perf_counter() - start)
+    return results
+
+
+@pytest.mark.parametrize("cache_saml", [False, True], ids=["full_auth", "cache_saml"])
+def test_serial_logins(benchmark, helper, tmp_path, cache_saml):
+    durations = []
+    results = benchmark.pedantic(
+        _login, args=(helper, str(tmp_path / "credentials"), cache_saml, durations), rounds=3
+    )
+    assert all(r.returncode == 0 for r in results)
+    benchmark.extra_info["ms_per_role"] = round(min(durations) * 1000 / NUM_ROLES, 1)
@@ -0,0 +1,157 @@
+"""
+End-to-end scenarios against the fake saml2aws, so regressions in Saml2AwsHelper and file_io
+show up in `make benchmark`:
+
+- loading the roles with a cold role cache (saml2aws list-roles for 100 accounts) and a warm one
+- logging in to 1, 10 and 100 roles in parallel, with login latency and jitter, and with failures
+- updating and indexing a credentials file holding 5000 profiles
+"""
+
+import os
+import shutil
+import time
+from unittest.mock import patch
+
+import pytest
+
+from saml2awsmulti import aws_login
+from saml2awsmulti.credentials_index import get_profile_entries, index_filename
+from saml2awsmulti.file_io import update_aws_profiles
+from saml2awsmulti.login_executor import run_logins
+from saml2awsmulti.saml2aws_helper import Saml2AwsHelper
+
+NUM_ACCOUNTS = 100
+ROLES_PER_ACCOUNT = 5
+LOGIN_DELAY = 0.02
+LOGIN_JITTER = 0.02
+PARALLEL = 10
+NUM_CRED_PROFILES = 5000
+
+
+def _profile_rolearn_dict(num_roles):
+    return {f"role-{i}": f"arn:aws:iam::{100000000000 + i}:role/role-{i}" for i in range(num_roles)}
+
+
+def _credentials_section(i):
+    return {
+        "aws_access_key_id": f"ASIA{i:016d}",
+        "aws_secret_access_key": "secret" * 7,
+        "aws_session_token": "token" * 160,
+        "x_security_token_expires": "2099-01-01T00:00:00+00:00",
+    }
+
+
+@pytest.fixture
+def helper(fake_saml2aws, tmp_path, monkeypatch):
+    fake_saml2aws(
+        num_accounts=NUM_ACCOUNTS,
+        roles_per_account=ROLES_PER_ACCOUNT,
+        login_delay=LOGIN_DELAY,
+        login_jitter=LOGIN_JITTER,
+    )
+    monkeypatch.setenv("AWS_SHARED_CREDENTIALS_FILE", str(tmp_path / "credentials"))
+    helper = Saml2AwsHelper("config_file", None, False)
+    helper._uname, helper._upass = "user", "password"
+    helper.get_capabilities()
+    return helper
+
+
+@pytest.fixture
+def user_data(tmp_path):
+    with patch.multiple(
+        aws_login,
+        ALL_ROLES_FILE=str(tmp_path / "aws_login_roles.csv"),
+        ALL_ROLES_META_FILE=str(tmp_path / "aws_login_roles_meta.json"),
+        LAST_SELECTED_FILE=str(tmp_path / "aws_login_last_selected.txt"),
+        SAML2AWS_CONFIG_FILE=str(tmp_path / "saml2aws"),
+    ):
+        yield tmp_path
+
+
+@pytest.mark.parametrize("refresh", [True, False], ids=["cold_role_cache", "warm_role_cache"])
+def test_load_roles(benchmark, helper, user_data, refresh):
+    # Fill the cache first, so the warm scenario reads it and the cold one diffs against it
+    aws_login.create_profile_rolearn_dict(helper, "RoleName-AccountAlias", True, [])
+
+    profile_rolearn_dict = benchmark.pedantic(
+        aws_login.create_profile_rolearn_dict,
+        args=(helper, "RoleName-AccountAlias", refresh, []),
+        rounds=5,
+    )
+    assert len(profile_rolearn_dict) == NUM_ACCOUNTS * ROLES_PER_ACCOUNT
+    benchmark.extra_info["roles"] = len(profile_rolearn_dict)
+
+
+@pytest.mark.parametrize("num_roles", [1, 10, 100])
+def test_logins(benchmark, helper, tmp_path, num_roles):
+    profile_rolearn_dict = _profile_rolearn_dict(num_roles)
+    aws_cred_file = str(tmp_path / "credentials")
+
+    durations = []
+
+    def login():
+        start = time.perf_counter()
+        results = run_logins(
+            helper, profile_rolearn_dict, list(profile_rolearn_dict), aws_cred_file, PARALLEL
+        )
+        durations.append(time.perf_counter() - start)
+        return results
+
+    results = benchmark.pedantic(login, rounds=3)
+    assert all(r.returncode == 0 for r in results)
+    benchmark.extra_info["ms_per_role"] = round(min(durations) * 1000 / num_roles, 1)
+
+
+def test_logins_with_failures(benchmark, helper, fake_saml2aws, tmp_path):
+    fake_saml2aws(login_delay=LOGIN_DELAY, login_jitter=LOGIN_JITTER, failure_rate=0.2)
+    profile_rolearn_dict = _profile_rolearn_dict(100)
+
+    results = benchmark.pedantic(
+        run_logins,
+        args=(
+            helper,
+            profile_rolearn_dict,
+            list(profile_rolearn_dict),
+            str(tmp_path / "credentials"),
+            PARALLEL,
+        ),
+        rounds=3,
+    )
+    failed = sum(r.returncode != 0 for r in results)
+    assert 0 < failed < len(results)
+    benchmark.extra_info["failed"] = failed
+
+
+@pytest.fixture(scope="module")
+def large_cred_file(tmp_path_factory):
+    cred_file = tmp_path_factory.mktemp("large") / "credentials"
+    update_aws_profiles(
+        str(cred_file), {f"profile-{i}": _credentials_section(i) for i in range(NUM_CRED_PROFILES)}
+    )
+    return cred_file
+
+
+def test_update_large_credentials_file(benchmark, large_cred_file, tmp_path):
+    cred_file = str(tmp_path / "credentials")
+    updates = {f"profile-{i}": _credentials_section(-i) for i in range(0, NUM_CRED_PROFILES, 500)}
+
+    def setup():
+        shutil.copy(large_cred_file, cred_file)
+
+    benchmark.pedantic(update_aws_profiles, args=(cred_file, updates), setup=setup, rounds=5)
+    benchmark.extra_info["profiles"] = NUM_CRED_PROFILES
+    benchmark.extra_info["updated"] = len(updates)
+
+
+@pytest.mark.parametrize("warm_index", [False, True], ids=["cold_index", "warm_index"])
+def test_profile_entries_large_credentials_file(benchmark, large_cred_file, tmp_path, warm_index):
+    cred_file = str(tmp_path / "credentials")
+    shutil.copy2(large_cred_file, cred_file)
+    get_profile_entries(cred_file)
+
+    def setup():
+        if not warm_index:
+            os.remove(index_filename(cred_file))
+
+    entries = benchmark.pedantic(get_profile_entries, args=(cred_file,), setup=setup, rounds=5)
+    assert len(entries) == NUM_CRED_PROFILES
@@ -0,0 +1,59 @@
+"""
+Fuzzy filtering of the role prompt over 10k and 50k roles: typing a query one keystroke at a
+time, and deleting it again, with FuzzyFilter (created when the prompt opens, then narrowing the
+previous matches) versus a regex scan of every role per keystroke.
+"""
+
+import random
+import re
+import string
+
+import pytest
+
+from saml2awsmulti.fuzzy_filter import FuzzyFilter
+
+QUERY = "prdadm"
+KEYSTROKES = [QUERY[:n] for n in range(1, len(QUERY) + 1)]
+KEYSTROKES += KEYSTROKES[-2::-1] + [""]  # then backspace
+
+
+def _random_word(rng, length):
+    return "".join(rng.choices(string.ascii_lowercase, k=length))
+
+
+@pytest.fixture(scope="module", params=[10_000, 50_000], ids=["10k", "50k"])
+def texts(request):
+    rng = random.Random(42)
+    teams = [_random_word(rng, 6) for _ in range(200)]
+    envs = ["dev", "tst", "stg", "prd", "sandbox"]
+    roles = ["admin", "readonly", "poweruser", "developer", "billing"]
+    return [
+        f"{rng.choice(teams)}-{rng.choice(envs)}-{rng.choice(roles)} "
+        f"acct-{i // 10} ({100000000000 + i // 10})"
+        for i in range(request.param)
+    ]
+
+
+def _full_scan(texts, query):
+    search = re.compile(".*?".join(map(re.escape, query))).search
+    return [i for i, text in enumerate(texts) if search(text.lower())]
+
+
+def _type_with_full_scan(texts):
+    return [_full_scan(texts, query) for query in KEYSTROKES]
+
+
+def _type_with_fuzzy_filter(texts):
+    fuzzy_filter = FuzzyFilter(texts)
+    return [fuzzy_filter.search(query) for query in KEYSTROKES]
+
+
+def test_full_scan_per_keystroke(benchmark, texts):
+    results = benchmark(_type_with_full_scan, texts)
+    benchmark.extra_info["matched"] = len(results[len(QUERY) - 1])
+
+
+def test_fuzzy_filter(benchmark, texts):
+    results = benchmark(_type_with_fuzzy_filter, texts)
+    benchmark.extra_info["matched"] = len(results[len(QUERY) - 1])
+    assert [sorted(r) for r in results] == _type_with_full_scan(texts)
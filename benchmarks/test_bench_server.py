@@ -0,0 +1,86 @@
+"""
+Load test of `awslogin serve`: concurrent clients, each reusing a keep-alive connection, fetch
+cached credentials from the server; reports the throughput and the p99 latency.
+"""
+
+import http.client
+import statistics
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import pytest
+
+from saml2awsmulti.credential_process import CredentialCache, cache_key
+from saml2awsmulti.server import CredentialsServer, ProfileCredentialsProvider
+
+NUM_PROFILES = 100
+NUM_CLIENTS = 8
+REQUESTS_PER_CLIENT = 250
+TOKEN = "bench-token"
+
+
+class CachedCredentialsHelper:
+    """Stands in for Saml2AwsHelper; never called once the cache is warm."""
+
+
+@pytest.fixture(scope="module")
+def server():
+    profiles = OrderedDict(
+        (f"profile-{i}", f"arn:aws:iam::{100000000000 + i}:role/bench") for i in range(NUM_PROFILES)
+    )
+    expiration = datetime(2099, 1, 1, tzinfo=timezone.utc).isoformat()
+    # Warm the cache so the benchmark measures the server, not saml2aws
+    cache = CredentialCache(None)
+    for profile, role_arn in profiles.items():
+        cache.put(
+            cache_key(role_arn),
+            {
+                "Version": 1,
+                "AccessKeyId": f"ASIA{profile}",
+                "SecretAccessKey": "secret",
+                "SessionToken": "token",
+                "Expiration": expiration,
+            },
+        )
+    provider = ProfileCredentialsProvider(CachedCredentialsHelper(), profiles, cache)
+    server = CredentialsServer(provider, TOKEN)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _client(server, client_id):
+    host, port = server.server_address[:2]
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    latencies = []
+    try:
+        for i in range(REQUESTS_PER_CLIENT):
+            profile = f"profile-{(client_id * REQUESTS_PER_CLIENT + i) % NUM_PROFILES}"
+            start = time.perf_counter()
+            conn.request("GET", f"/profiles/{profile}", headers={"Authorization": TOKEN})
+            response = conn.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - start)
+            assert response.status == 200
+    finally:
+        conn.close()
+    return latencies
+
+
+def _load_test(server):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(NUM_CLIENTS) as executor:
+        results = executor.map(lambda client_id: _client(server, client_id), range(NUM_CLIENTS))
+        latencies = [latency for client_latencies in results for latency in client_latencies]
+    return latencies, time.perf_counter() - start
+
+
+def test_serve_load(benchmark, server):
+    latencies, elapsed = benchmark.pedantic(_load_test, args=(server,), rounds=3)
+    benchmark.extra_info["requests"] = len(latencies)
+    benchmark.extra_info["requests_per_second"] = round(len(latencies) / elapsed)
+    benchmark.extra_info["p99_ms"] = round(statistics.quantiles(latencies, n=100)[98] * 1000, 3)
@@ -0,0 +1,35 @@
+"""
+Overhead of the timing spans: 100k empty blocks without a span, with a disabled span (the
+default) and with an enabled one.
+"""
+
+from saml2awsmulti.timings import disable_timings, enable_timings, span
+
+ITERATIONS = 100_000
+
+
+def _no_span():
+    for _ in range(ITERATIONS):
+        pass
+
+
+def _spans():
+    for _ in range(ITERATIONS):
+        with span("login"):
+            pass
+
+
+def test_no_span(benchmark):
+    benchmark(_no_span)
+
+
+def test_disabled_span(benchmark):
+    benchmark(_spans)
+
+
+def test_enabled_span(benchmark):
+    enable_timings()
+    try:
+        benchmark(_spans)
+    finally:
+        disable_timings()
@@ -0,0 +1,155 @@
+"""
+Drive saml2aws with asyncio subprocesses. Kept apart from saml2aws_helper so that the awslogin
+command line does not pay for importing asyncio.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import tempfile
+from os.path import join
+
+from saml2awsmulti.capabilities import SAML2AWS_PROBE_CMDS
+from saml2awsmulti.login_executor import LoginResult, merge_private_credentials
+from saml2awsmulti.saml2aws_helper import Saml2AwsHelper
+
+
+class AsyncSaml2AwsHelper:
+    """Run saml2aws with asyncio subprocesses, so that many saml2aws processes can run on one
+    event loop. Every call accepts a timeout in seconds; the saml2aws process and everything it
+    started are killed when the call times out or is cancelled.
+
+    The configuration, credentials and capabilities are those of the Saml2AwsHelper in
+    `helper`, which builds the saml2aws commands.
+    """
+
+    def __init__(self, configfile, session_duration, browser_autofill, capabilities_file=None):
+        self.helper = Saml2AwsHelper(
+            configfile, session_duration, browser_autofill, capabilities_file
+        )
+
+    async def prepare(self):
+        self.helper.get_credentials()
+        await self._get_capabilities()
+
+    async def _get_capabilities(self):
+        helper = self.helper
+        if helper._capabilities is None:
+            fingerprint, capabilities = helper._load_capabilities()
+            if capabilities is None:
+                results = await asyncio.gather(
+                    *(self._communicate(cmd, None) for cmd in SAML2AWS_PROBE_CMDS)
+                )
+                outputs = [stdout.decode("utf-8") for _, stdout in results]
+                capabilities = helper._save_capabilities(fingerprint, outputs)
+            helper._capabilities = capabilities
+        return helper._capabilities
+
+    @staticmethod
+    async def _communicate(cmd, stdin_input, env=None, timeout=None):
+        """Run cmd to completion in its own process group and return (returncode, stdout
+        bytes)."""
+        p = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE if stdin_input is not None else None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            env=env,
+            start_new_session=True,
+        )
+        try:
+            stdout, _ = await asyncio.wait_for(p.communicate(input=stdin_input), timeout)
+        except BaseException:
+            # Timed out or cancelled: do not leave saml2aws, or e.g. the browser it drives, behind
+            if p.returncode is None:
+                _kill_process_group(p)
+                await p.wait()
+            raise
+        return p.returncode, stdout
+
+    async def run_saml2aws_list_roles(self, timeout=None):
+        await self.prepare()
+        cmd, stdin_input = self.helper._build_list_roles_cmd()
+        retval, stdout = await self._communicate(cmd, stdin_input, timeout=timeout)
+        logging.debug(f"Response Code: {retval}")
+        return self.helper._parse_list_roles_output(stdout)
+
+    async def run_saml2aws_get_saml_assertion(self, role_arn, timeout=None):
+        """Log in to role_arn with saml2aws login --cache-saml, throw the credentials away and
+        return the cached SAML assertion, as Saml2AwsHelper does."""
+        await self.prepare()
+        self.helper._check_login_cache_saml()
+        with tempfile.TemporaryDirectory(prefix="saml2aws-multi-") as tmp_dir:
+            saml_cache_file = join(tmp_dir, "saml_cache")
+            cmd, stdin_input = self.helper._build_login_cmd(
+                role_arn, "saml2aws-multi", saml_cache_file
+            )
+            env = self.helper._credentials_file_env(join(tmp_dir, "credentials"))
+            retval, _ = await self._communicate(cmd, stdin_input, env, timeout)
+            if retval != 0:
+                raise ValueError(
+                    f"Failed to retrieve the SAML assertion: saml2aws login exited with {retval}."
+                )
+            return self.helper._read_saml_cache_file(saml_cache_file)
+
+    async def run_saml2aws_login(self, role_arn, profile_name, credentials_file=None, timeout=None):
+        logging.info(f"Adding {profile_name}...")
+
+        await self.prepare()
+        cmd, stdin_input = self.helper._build_login_cmd(role_arn, profile_name)
+        retval, stdout = await self._communicate(
+            cmd, stdin_input, self.helper._credentials_file_env(credentials_file), timeout
+        )
+
+        for line in stdout.decode("utf-8").splitlines():
+            logging.debug(line)
+
+        logging.info(f"Response Code: {retval}")
+        return retval
+
+    async def run_saml2aws_logins(
+        self, profile_rolearn_dict, profiles, aws_cred_file, parallel, timeout=None
+    ):
+        """Login to the given profiles with at most `parallel` saml2aws processes at a time.
+
+        As in run_logins, each process writes to a private credentials file that is merged
+        into aws_cred_file under a file lock. Return a list of LoginResult in input order; the
+        returncode is None if the login timed out or failed to run.
+        """
+        await self.prepare()
+        semaphore = asyncio.Semaphore(parallel)
+
+        async def login(i, profile):
+            role_arn = profile_rolearn_dict[profile]
+            private_cred_file = join(tmp_dir, f"credentials-{i}")
+            async with semaphore:
+                try:
+                    returncode = await self.run_saml2aws_login(
+                        role_arn, profile, private_cred_file, timeout
+                    )
+                except asyncio.TimeoutError:
+                    logging.error(f"Failed to login {profile}: timed out after {timeout}s")
+                    returncode = None
+                except OSError as e:
+                    logging.error(f"Failed to login {profile}: {e}")
+                    returncode = None
+            if returncode == 0:
+                await asyncio.to_thread(
+                    merge_private_credentials, private_cred_file, profile, aws_cred_file
+                )
+            return LoginResult(profile, role_arn, returncode)
+
+        with tempfile.TemporaryDirectory(prefix="saml2aws-multi-") as tmp_dir:
+            return await asyncio.gather(*(login(i, p) for i, p in enumerate(profiles)))
+
+
+def _kill_process_group(p):
+    """Kill the asyncio subprocess p, started in its own session, and the processes it started."""
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(p.pid, signal.SIGKILL)
+        else:
+            p.kill()
+    except ProcessLookupError:
+        pass
@@ -5,23 +5,75 @@ for multiple roles in different accounts.
 
 import json
 import logging
+import os
+import secrets
+import sys
 from collections import OrderedDict
+from contextlib import nullcontext, redirect_stdout
 from datetime import datetime, timezone
 from os.path import exists, join
 from pathlib import Path
 
 import click
-from boto3.session import Session
 
+from saml2awsmulti.chained_roles import (
+    CLI_CACHE_DIR,
+    DEFAULT_PREWARM_WORKERS,
+    ChainedRoleGraph,
+    prewarm_chained_roles,
+)
+from saml2awsmulti.credential_process import (
+    CredentialCache,
+    credential_process_command,
+    get_role_credentials,
+)
+from saml2awsmulti.credentials_index import (
+    get_profile_entries,
+    is_expired,
+    read_profile,
+    split_fresh_profiles,
+)
+from saml2awsmulti.daemon import (
+    DEFAULT_REFRESH_MARGIN,
+    DEFAULT_SESSION_DURATION,
+    CredentialRefreshDaemon,
+)
 from saml2awsmulti.file_io import (
+    atomic_write,
     get_aws_profiles,
+    load_saml2aws_config,
     read_csv,
     read_lines_from_file,
-    write_aws_profiles,
+    update_aws_profiles,
     write_csv,
 )
+from saml2awsmulti.identity import DEFAULT_WHOAMI_WORKERS, StsClientFactory, get_caller_identities
+from saml2awsmulti.login_executor import log_login_summary, run_logins
+from saml2awsmulti.matcher import KeywordMatcher
+from saml2awsmulti.pipeline import get_warmup_result, reconcile_selection, start_warmup
+from saml2awsmulti.role_cache import (
+    diff_roles,
+    is_roles_cache_stale,
+    log_roles_diff,
+    read_roles_cache_metadata,
+    write_roles_cache_metadata,
+)
+from saml2awsmulti.role_store import SqliteRoleStore
 from saml2awsmulti.saml2aws_helper import Saml2AwsHelper
-from saml2awsmulti.selector import prompt_profile_selection, prompt_roles_selection
+from saml2awsmulti.selector import (
+    SELECTORS,
+    prompt_profile_selection,
+    prompt_roles_fuzzy_selection,
+    prompt_roles_selection,
+)
+from saml2awsmulti.sts_login import DEFAULT_STS_WORKERS, run_sts_logins
+from saml2awsmulti.timings import (
+    disable_timings,
+    enable_timings,
+    format_report,
+    span,
+    write_json_lines,
+)
 
 logging.basicConfig(format="%(message)s")
 logging.getLogger().setLevel(logging.INFO)
@@ -31,10 +83,16 @@ AWS_CRED_FILE = join(str(Path.home()), ".aws", "credentials")
 SAML2AWS_CONFIG_FILE = join(str(Path.home()), ".saml2aws")
 USER_DATA_HOME = join(str(Path.home()), ".saml2aws-multi")
 ALL_ROLES_FILE = join(USER_DATA_HOME, "aws_login_roles.csv")  # role_arn, account_alias
+ALL_ROLES_META_FILE = join(USER_DATA_HOME, "aws_login_roles_meta.json")
+ALL_ROLES_DB_FILE = join(USER_DATA_HOME, "aws_login_roles.db")  # SQLite index of ALL_ROLES_FILE
+SAML2AWS_CAPABILITIES_FILE = join(USER_DATA_HOME, "saml2aws_capabilities.json")
+CREDENTIAL_PROCESS_CACHE_DIR = join(USER_DATA_HOME, "credential_process_cache")
+SERVE_TOKEN_FILE = join(USER_DATA_HOME, "serve_token")  # Authorization token of awslogin serve
 LAST_SELECTED_FILE = join(USER_DATA_HOME, "aws_login_last_selected.txt")  # aws_profile_name
 
 DEFAULT_PROFILE_NAME_FORMAT = "RoleName"
 PROFILE_NAME_FORMATS = ["RoleName", "RoleName-AccountAlias"]
+ROLE_STORES = ["csv", "sqlite"]
 
 
 def create_profile_name_from_role_arn(role_arn, account_alias, profile_name_format):
@@ -46,14 +104,57 @@ def create_profile_name_from_role_arn(role_arn, account_alias, profile_name_form
 
 
 def create_profile_rolearn_dict(
-    saml2aws_helper, profile_name_format, refresh_cached_roles, keywords
+    saml2aws_helper,
+    profile_name_format,
+    refresh_cached_roles,
+    keywords,
+    role_store=None,
+    exclude=(),
 ):
     """Create an OrderedDict containing a full or shortlisted of {profile_name: role_arn}"""
     if refresh_cached_roles or not exists(ALL_ROLES_FILE):
-        rolearn_alias_list = saml2aws_helper.run_saml2aws_list_roles()
-        write_csv(ALL_ROLES_FILE, rolearn_alias_list)
-    else:
-        rolearn_alias_list = read_csv(ALL_ROLES_FILE)
+        rolearn_alias_list = save_roles_cache(saml2aws_helper.iter_saml2aws_list_roles())
+        return to_profile_rolearn_dict(rolearn_alias_list, profile_name_format, keywords, exclude)
+
+    return load_cached_profile_rolearn_dict(profile_name_format, keywords, role_store, exclude)
+
+
+def load_cached_profile_rolearn_dict(profile_name_format, keywords, role_store=None, exclude=()):
+    """Create the {profile_name: role_arn} OrderedDict from the cached roles"""
+    if role_store is None:
+        return to_profile_rolearn_dict(
+            read_csv(ALL_ROLES_FILE), profile_name_format, keywords, exclude
+        )
+
+    include_matcher = KeywordMatcher(keywords)
+    exclude_matcher = KeywordMatcher(exclude)
+    if include_matcher.is_literal and not exclude_matcher:
+        return role_store.query_profiles(profile_name_format, keywords)
+    # Glob and regex keywords cannot be answered by the index; filter the shortlist here
+    profile_rolearn_dict = role_store.query_profiles(
+        profile_name_format, keywords if include_matcher.is_literal else []
+    )
+    return OrderedDict(
+        (profile_name, role_arn)
+        for profile_name, role_arn in profile_rolearn_dict.items()
+        if _is_shortlisted(profile_name, include_matcher, exclude_matcher)
+    )
+
+
+def open_role_store(role_store_type):
+    """Return a SqliteRoleStore in sync with ALL_ROLES_FILE, or None for the plain CSV file."""
+    if role_store_type != "sqlite" or not exists(ALL_ROLES_FILE):
+        return None
+    role_store = SqliteRoleStore(ALL_ROLES_DB_FILE)
+    if role_store.needs_migration(ALL_ROLES_FILE):
+        role_store.migrate_from_csv(ALL_ROLES_FILE)
+    return role_store
+
+
+def to_profile_rolearn_dict(rolearn_alias_list, profile_name_format, keywords, exclude=()):
+    """Create an OrderedDict of {profile_name: role_arn} from a list of (role_arn, alias)"""
+    include_matcher = KeywordMatcher(keywords)
+    exclude_matcher = KeywordMatcher(exclude)
 
     profile_rolearn_dict = OrderedDict()
     for role_arn, account_alias in rolearn_alias_list:
@@ -62,32 +163,141 @@ def create_profile_rolearn_dict(
         )
 
         # If keywords defined, return only roles with profile_name matching any of the keywords
-        if (
-            len(keywords) == 0
-            or len([keyword for keyword in keywords if keyword in profile_name]) > 0
-        ):
+        if _is_shortlisted(profile_name, include_matcher, exclude_matcher):
             profile_rolearn_dict[profile_name] = role_arn
 
     return profile_rolearn_dict
 
 
-def pre_select_options(profile_rolearn_dict, keywords):
+def _is_shortlisted(profile_name, include_matcher, exclude_matcher):
+    return (not include_matcher or include_matcher.matches(profile_name)) and not (
+        exclude_matcher.matches(profile_name)
+    )
+
+
+def get_idp_account_and_username():
+    """Return the saml2aws IdP account name and username the role cache belongs to."""
+    configs = load_saml2aws_config(SAML2AWS_CONFIG_FILE)
+    return configs.get("name", "default"), configs.get("username")
+
+
+def save_roles_cache(roles):
+    """Write the roles and their metadata to the cache, logging what changed since last time.
+
+    `roles` may be a generator, e.g. streaming from saml2aws list-roles: each role is written
+    as it arrives. Return the list of roles.
+    """
+    cached_roles = list(read_csv(ALL_ROLES_FILE)) if exists(ALL_ROLES_FILE) else None
+    rolearn_alias_list = []
+
+    def collect():
+        for role in roles:
+            rolearn_alias_list.append(role)
+            yield role
+
+    write_csv(ALL_ROLES_FILE, collect())
+    if cached_roles is not None:
+        diff = diff_roles(cached_roles, rolearn_alias_list)
+        log_roles_diff(diff)
+        rename_last_selected_profiles(diff.alias_changed)
+    write_roles_cache_metadata(ALL_ROLES_META_FILE, *get_idp_account_and_username())
+    return rolearn_alias_list
+
+
+def rename_last_selected_profiles(alias_changed):
+    """Keep last selected RoleName-AccountAlias profiles selected when an account alias changes."""
+    renames = {
+        create_profile_name_from_role_arn(role_arn, old_alias, "RoleName-AccountAlias"): (
+            create_profile_name_from_role_arn(role_arn, new_alias, "RoleName-AccountAlias")
+        )
+        for role_arn, old_alias, new_alias in alias_changed
+    }
+    last_selected = read_lines_from_file(LAST_SELECTED_FILE)
+    if any(profile in renames for profile in last_selected):
+        with open(LAST_SELECTED_FILE, "w") as f:
+            f.write("\n".join(renames.get(profile, profile) for profile in last_selected))
+
+
+def pre_select_options(profile_rolearn_dict, keywords, role_store=None, profile_name_format=None):
     """Pre-select roles based on keywords"""
     pre_select_profiles = read_lines_from_file(LAST_SELECTED_FILE)
 
     # Make sure the previous selected role is still a valid role
     pre_select_profiles = [p for p in pre_select_profiles if p in profile_rolearn_dict.keys()]
 
-    for profile_name, role_arn in profile_rolearn_dict.items():
-        for k in keywords:
-            if k in role_arn:
-                pre_select_profiles.append(profile_name)
-                break
+    matcher = KeywordMatcher(keywords)
+    if role_store is not None and matcher.is_literal:
+        pre_select_profiles += [
+            p
+            for p in role_store.query_profiles_by_role_arn(profile_name_format, keywords)
+            if p in profile_rolearn_dict
+        ]
+    elif matcher:
+        pre_select_profiles += [
+            profile_name
+            for profile_name, role_arn in profile_rolearn_dict.items()
+            if matcher.matches(role_arn)
+        ]
 
     # Deduplicate (a profile in last-selected may also match a keyword) while preserving order
     return list(dict.fromkeys(pre_select_profiles))
 
 
+def account_labels(profile_rolearn_dict):
+    """Return {profile_name: "account_alias (account_id)"}, with the aliases of the cached
+    roles, for the fuzzy role prompt to search and show."""
+    aliases = dict(read_csv(ALL_ROLES_FILE)) if exists(ALL_ROLES_FILE) else {}
+    labels = {}
+    for profile_name, role_arn in profile_rolearn_dict.items():
+        account_id = role_arn.split(":")[4]
+        alias = aliases.get(role_arn)
+        # saml2aws list-roles gives accounts without an alias the alias "None"
+        labels[profile_name] = (
+            f"{alias} ({account_id})" if alias not in (None, "None") else account_id
+        )
+    return labels
+
+
+def select_roles(profile_rolearn_dict, roles_file, last, all_matching):
+    """Return the profiles selected by --roles-file, --last or --all-matching, without
+    prompting; profiles read from a file may not be in profile_rolearn_dict."""
+    if all_matching:
+        matcher = KeywordMatcher(all_matching)
+        return [profile for profile in profile_rolearn_dict if matcher.matches(profile)]
+    if last:
+        lines = read_lines_from_file(LAST_SELECTED_FILE)
+    else:
+        with click.open_file(roles_file) as f:
+            lines = [line.strip() for line in f]
+    # Ignore blank lines and comments, and keep the first of duplicate profiles
+    return list(dict.fromkeys(line for line in lines if line and not line.startswith("#")))
+
+
+def login_result_records(results, skipped=(), unknown=()):
+    """Return a JSON-serializable dict per role: the LoginResults, then the skipped roles with
+    fresh credentials ({profile: expires}), then the unknown profiles."""
+    records = [
+        {
+            "Profile": r.profile_name,
+            "RoleArn": r.role_arn,
+            "Status": "ok" if r.returncode == 0 else "failed",
+            "ReturnCode": r.returncode,
+            "Error": r.error,
+        }
+        for r in results
+    ]
+    records += [
+        {
+            "Profile": profile,
+            "Status": "skipped",
+            "Expires": datetime.fromtimestamp(expires, timezone.utc).isoformat(),
+        }
+        for profile, expires in dict(skipped).items()
+    ]
+    records += [{"Profile": profile, "Status": "unknown"} for profile in unknown]
+    return records
+
+
 @click.group(
     invoke_without_command=True, help="Get credentials for multiple accounts with saml2aws"
 )
@@ -95,13 +305,63 @@ def pre_select_options(profile_rolearn_dict, keywords):
     "--shortlisted",
     "-l",
     multiple=True,
-    help="Show only roles with the given keyword(s); e.g. -l keyword1 -l keyword2...",
+    help=(
+        "Show only roles with the given keyword(s); e.g. -l keyword1 -l keyword2... "
+        "Keywords with *, ? or [ are glob patterns; keywords starting with re: are regexes."
+    ),
+)
+@click.option(
+    "--exclude",
+    "-x",
+    multiple=True,
+    help="Hide roles with the given keyword(s); e.g. -x keyword1 -x keyword2...",
 )
 @click.option(
     "--pre-select",
     "-s",
     multiple=True,
-    help="Pre-select roles with the given keyword(s); e.g. -s keyword1 -s keyword2...",
+    help=(
+        "Pre-select roles with the given keyword(s); e.g. -s keyword1 -s keyword2... "
+        "Supports the same glob and re: keywords as --shortlisted."
+    ),
+)
+@click.option(
+    "--selector",
+    default="checkbox",
+    show_default=True,
+    envvar="SAML2AWS_MULTI_SELECTOR",
+    type=click.Choice(SELECTORS, case_sensitive=False),
+    help=(
+        "Choose the roles from a checkbox list, or from a list filtered as you type (fuzzy "
+        "search over profile names and account aliases), for thousands of roles."
+    ),
+)
+@click.option(
+    "--roles-file",
+    type=click.Path(dir_okay=False, allow_dash=True),
+    help=(
+        "Log in to the profiles listed in this file (one per line, - for stdin) without "
+        "prompting."
+    ),
+)
+@click.option(
+    "--last",
+    is_flag=True,
+    help="Log in to the profiles selected last time without prompting.",
+)
+@click.option(
+    "--all-matching",
+    multiple=True,
+    help=(
+        "Log in to every role matching the given keyword(s) without prompting; supports the "
+        "same glob and re: keywords as --shortlisted."
+    ),
+)
+@click.option(
+    "--json",
+    "json_output",
+    is_flag=True,
+    help="Print the result of each role as a JSON line to stdout.",
 )
 @click.option(
     "--profile-name-format",
@@ -121,92 +381,595 @@ def pre_select_options(profile_rolearn_dict, keywords):
         f"provided and save the roles into {ALL_ROLES_FILE}."
     ),
 )
+@click.option(
+    "--roles-cache-ttl",
+    default=0,
+    show_default=True,
+    envvar="SAML2AWS_MULTI_ROLES_CACHE_TTL",
+    type=click.FloatRange(min=0),
+    help=(
+        f"Refresh {ALL_ROLES_FILE} in the background when it is older than the given number of "
+        f"hours, or was fetched for another saml2aws account or username; 0 disables expiry."
+    ),
+)
+@click.option(
+    "--role-store",
+    default="csv",
+    show_default=True,
+    envvar="SAML2AWS_MULTI_ROLE_STORE",
+    type=click.Choice(ROLE_STORES, case_sensitive=False),
+    help=(
+        f"Read the cached roles from {ALL_ROLES_FILE}, or from an indexed SQLite copy of it "
+        f"({ALL_ROLES_DB_FILE}) for faster startup with thousands of roles."
+    ),
+)
 @click.option("--session-duration", "-t", help="Set the session duration in seconds.")
 @click.option(
     "--browser-autofill", "-b", is_flag=True, show_default=True, help="Enable browser-autofill."
 )
+@click.option(
+    "--parallel",
+    "-P",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of saml2aws logins to run concurrently.",
+)
+@click.option(
+    "--use-sts",
+    is_flag=True,
+    show_default=True,
+    help=(
+        "Authenticate once and assume all selected roles with STS AssumeRoleWithSAML, "
+        "instead of running one saml2aws login per role."
+    ),
+)
+@click.option(
+    "--pipeline",
+    is_flag=True,
+    show_default=True,
+    help=(
+        "Show the cached roles immediately and refresh them (-r) in the background while you "
+        "choose; with --use-sts, authenticate against the IdP in the background too. Logins "
+        "run after the selection."
+    ),
+)
+@click.option(
+    "--cache-saml",
+    is_flag=True,
+    help=(
+        "Authenticate against the IdP with the first login only, and reuse its cached SAML "
+        "assertion (saml2aws login --cache-saml) for the other roles."
+    ),
+)
+@click.option(
+    "--timeout",
+    "call_timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    help="Kill saml2aws calls (list-roles, each login) running longer than this many seconds.",
+)
+@click.option(
+    "--batch-timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    help=(
+        "Stop logging in after this many seconds: running logins are killed and the remaining "
+        "roles are reported as timed out."
+    ),
+)
+@click.option(
+    "--min-remaining",
+    type=click.FloatRange(min=0),
+    help="Skip roles whose credentials are valid for more than this many minutes.",
+)
+@click.option(
+    "--timings", is_flag=True, help="Print how long each phase took (probe, prompts, logins)."
+)
+@click.option(
+    "--timings-file",
+    type=click.Path(dir_okay=False),
+    help="Append the timing spans to this file as JSON lines.",
+)
 @click.option("--debug", "-d", is_flag=True, show_default=True, help="Enable debug mode.")
 @click.pass_context
 def main_cli(
     ctx,
     shortlisted,
+    exclude,
     pre_select,
+    selector,
+    roles_file,
+    last,
+    all_matching,
+    json_output,
     profile_name_format,
     refresh_cached_roles,
+    roles_cache_ttl,
+    role_store,
     session_duration,
     browser_autofill,
+    parallel,
+    use_sts,
+    pipeline,
+    cache_saml,
+    call_timeout,
+    batch_timeout,
+    min_remaining,
+    timings,
+    timings_file,
     debug,
 ):
     if debug:
         logging.getLogger().setLevel(logging.DEBUG)
+    if timings or timings_file:
+        enable_timings()
+        ctx.call_on_close(lambda: _report_timings(timings, timings_file))
 
     if ctx.invoked_subcommand is None:
+        if sum(map(bool, (roles_file, last, all_matching))) > 1:
+            raise click.UsageError("Use only one of --roles-file, --last and --all-matching.")
+        non_interactive = bool(roles_file or last or all_matching)
         try:
             saml2aws_helper = Saml2AwsHelper(
-                SAML2AWS_CONFIG_FILE, session_duration, browser_autofill
+                SAML2AWS_CONFIG_FILE,
+                session_duration,
+                browser_autofill,
+                SAML2AWS_CAPABILITIES_FILE,
+                call_timeout=call_timeout,
             )
 
-            profile_rolearn_dict = create_profile_rolearn_dict(
-                saml2aws_helper,
-                profile_name_format,
-                refresh_cached_roles,
-                shortlisted,
+            stale = (
+                not refresh_cached_roles
+                and exists(ALL_ROLES_FILE)
+                and is_roles_cache_stale(
+                    read_roles_cache_metadata(ALL_ROLES_META_FILE),
+                    roles_cache_ttl * 3600,
+                    *get_idp_account_and_username(),
+                )
             )
-            pre_select_profiles = pre_select_options(profile_rolearn_dict, pre_select)
+            if stale:
+                logging.info("Cached roles are stale; refreshing them in the background")
+
+            warmup = None
+            if (pipeline or stale) and exists(ALL_ROLES_FILE):
+                # Ask for the password first; the prompt below then opens from the cached roles
+                # while saml2aws runs in the background.
+                saml2aws_helper.get_credentials()
+                # Any cached role will do to get the SAML assertion
+                saml_role = next(read_csv(ALL_ROLES_FILE), None) if use_sts else None
+                saml_role_arn = saml_role[0] if saml_role else None
+                warmup = start_warmup(saml2aws_helper, refresh_cached_roles or stale, saml_role_arn)
+
+            with span("load_roles"):
+                store = open_role_store(role_store)
+                if warmup is not None:
+                    profile_rolearn_dict = load_cached_profile_rolearn_dict(
+                        profile_name_format, shortlisted, store, exclude
+                    )
+                else:
+                    profile_rolearn_dict = create_profile_rolearn_dict(
+                        saml2aws_helper,
+                        profile_name_format,
+                        refresh_cached_roles,
+                        shortlisted,
+                        store,
+                        exclude,
+                    )
+
+            if non_interactive:
+                roles = select_roles(profile_rolearn_dict, roles_file, last, all_matching)
+                unknown = [role for role in roles if role not in profile_rolearn_dict]
+                if unknown:
+                    logging.error(f"Unknown profile(s): {', '.join(unknown)}")
+                    roles = [role for role in roles if role in profile_rolearn_dict]
+            else:
+                unknown = []
+                pre_select_profiles = pre_select_options(
+                    profile_rolearn_dict, pre_select, store, profile_name_format
+                )
+                with span("role_prompt"):
+                    if selector == "fuzzy":
+                        roles = prompt_roles_fuzzy_selection(
+                            profile_rolearn_dict.keys(),
+                            pre_select_profiles,
+                            account_labels(profile_rolearn_dict),
+                        )
+                    else:
+                        roles = prompt_roles_selection(
+                            profile_rolearn_dict.keys(), pre_select_profiles
+                        )
+
+            saml_assertion = None
+            if warmup is not None:
+                warmup_result = get_warmup_result(warmup)
+                saml_assertion = warmup_result.saml_assertion
+                if warmup_result.rolearn_alias_list:
+                    save_roles_cache(warmup_result.rolearn_alias_list)
+                    profile_rolearn_dict, roles = reconcile_selection(
+                        profile_rolearn_dict,
+                        roles or [],
+                        to_profile_rolearn_dict(
+                            warmup_result.rolearn_alias_list,
+                            profile_name_format,
+                            shortlisted,
+                            exclude,
+                        ),
+                    )
 
-            roles = prompt_roles_selection(profile_rolearn_dict.keys(), pre_select_profiles)
             if roles:
-                for profile in roles:
-                    saml2aws_helper.run_saml2aws_login(profile_rolearn_dict[profile], profile)
+                logins, skipped = roles, {}
+                if min_remaining is not None:
+                    logins, skipped = split_fresh_profiles(
+                        get_profile_entries(AWS_CRED_FILE), roles, min_remaining * 60
+                    )
+                with (
+                    span("logins", roles=len(logins)),
+                    (
+                        saml2aws_helper.batch_deadline(batch_timeout)
+                        if batch_timeout
+                        else nullcontext()
+                    ),
+                ):
+                    if not logins:
+                        results = []
+                    elif use_sts:
+                        results = run_sts_logins(
+                            saml2aws_helper,
+                            profile_rolearn_dict,
+                            logins,
+                            AWS_CRED_FILE,
+                            session_duration,
+                            region=load_saml2aws_config(SAML2AWS_CONFIG_FILE).get("region"),
+                            max_workers=max(parallel, DEFAULT_STS_WORKERS),
+                            saml_assertion=saml_assertion,
+                        )
+                    else:
+                        with saml2aws_helper.saml_cache() if cache_saml else nullcontext():
+                            results = run_logins(
+                                saml2aws_helper,
+                                profile_rolearn_dict,
+                                logins,
+                                AWS_CRED_FILE,
+                                parallel,
+                            )
+                log_login_summary(results, list(skipped))
 
                 # Dump the last selected options
                 with open(LAST_SELECTED_FILE, "w") as f:
                     f.write("\n".join(roles))
             else:
-                logging.info("Nothing selected. Aborted.")
+                results, skipped = [], {}
+                if not unknown:
+                    logging.info("Nothing selected. Aborted.")
+
+            if json_output:
+                for record in login_result_records(results, skipped, unknown):
+                    click.echo(json.dumps(record))
+            if non_interactive and (
+                unknown or not roles or any(r.returncode != 0 for r in results)
+            ):
+                sys.exit(1)
+        except click.ClickException:
+            # e.g. an invalid re: keyword; let click report it as a usage error
+            raise
         except FileNotFoundError as e:
             if e.filename == SAML2AWS_CONFIG_FILE:
                 logging.error(f"{e}. See https://github.com/Versent/saml2aws to create one.")
             else:
                 logging.error(f"Error: {e} Aborted.")
-        except Exception:
+            if non_interactive or json_output:
+                _abort(e, json_output)
+        except Exception as e:
+            if non_interactive or json_output:
+                logging.error(f"Error: {e} Aborted.")
+                _abort(e, json_output)
             import traceback
 
             traceback.print_exc()
 
 
-@main_cli.command(help="List chained role profiles specified in ~/.aws/config")
-@click.option("--from-profile", "-p", help="List chained roles for the given profile name.")
-def chained(from_profile):
+def _abort(error, json_output):
+    """End a run that failed before its logins completed with exit status 1, so that scripts
+    see the failure; with --json, print an error record first."""
+    if json_output:
+        click.echo(json.dumps({"Status": "error", "Error": str(error)}))
+    sys.exit(1)
+
+
+@main_cli.command(help="Keep the credentials of the given profiles fresh until interrupted")
+@click.option(
+    "--profile",
+    "-p",
+    "profiles",
+    multiple=True,
+    help="Profile to keep fresh; e.g. -p profile1 -p profile2... [default: last selected]",
+)
+@click.option(
+    "--profile-name-format",
+    "-n",
+    default=DEFAULT_PROFILE_NAME_FORMAT,
+    show_default=True,
+    type=click.Choice(PROFILE_NAME_FORMATS, case_sensitive=False),
+    help="Set the profile name format.",
+)
+@click.option(
+    "--refresh-margin",
+    default=DEFAULT_REFRESH_MARGIN / 60,
+    show_default=True,
+    type=click.FloatRange(min=0),
+    help="Refresh credentials this many minutes before they expire.",
+)
+@click.option("--session-duration", "-t", help="Set the session duration in seconds.")
+@click.option(
+    "--parallel",
+    "-P",
+    default=4,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of saml2aws logins to run concurrently.",
+)
+@click.option(
+    "--use-sts",
+    is_flag=True,
+    show_default=True,
+    help="Refresh each batch of profiles with one IdP authentication and STS AssumeRoleWithSAML.",
+)
+def daemon(profiles, profile_name_format, refresh_margin, session_duration, parallel, use_sts):
+    profiles = list(profiles) or read_lines_from_file(LAST_SELECTED_FILE)
+    if not exists(ALL_ROLES_FILE):
+        logging.error("No cached roles found; run awslogin first.")
+        return
+    profile_rolearn_dict = load_cached_profile_rolearn_dict(profile_name_format, [])
+    for profile in [p for p in profiles if p not in profile_rolearn_dict]:
+        logging.warning(f"Skipped {profile}: not found in the cached roles")
+    profiles = [p for p in profiles if p in profile_rolearn_dict]
+    if not profiles:
+        logging.info("No profiles to refresh. Aborted.")
+        return
+
+    # The password is only kept in memory, for the lifetime of the daemon
+    saml2aws_helper = Saml2AwsHelper(
+        SAML2AWS_CONFIG_FILE, session_duration, False, SAML2AWS_CAPABILITIES_FILE
+    )
+    saml2aws_helper.prepare()
+
+    def refresh(batch):
+        if use_sts:
+            results = run_sts_logins(
+                saml2aws_helper,
+                profile_rolearn_dict,
+                batch,
+                AWS_CRED_FILE,
+                session_duration,
+                region=load_saml2aws_config(SAML2AWS_CONFIG_FILE).get("region"),
+                max_workers=parallel,
+            )
+        else:
+            results = run_logins(
+                saml2aws_helper, profile_rolearn_dict, batch, AWS_CRED_FILE, parallel
+            )
+        log_login_summary(results)
+        return results
+
+    refresh_daemon = CredentialRefreshDaemon(
+        refresh,
+        profiles,
+        AWS_CRED_FILE,
+        refresh_margin=refresh_margin * 60,
+        session_duration=int(session_duration or DEFAULT_SESSION_DURATION),
+    )
+    logging.info(f"Keeping {len(profiles)} profile(s) fresh; press Ctrl+C to stop")
+    try:
+        refresh_daemon.run()
+    except KeyboardInterrupt:
+        logging.info("Stopped.")
+
+
+@main_cli.command(
+    "credential-process", help="Print the credentials of a role for the AWS credential_process"
+)
+@click.option("--role", "role_arn", required=True, help="Role ARN")
+@click.option("--session-duration", "-t", help="Set the session duration in seconds.")
+def credential_process(role_arn, session_duration):
+    saml2aws_helper = Saml2AwsHelper(
+        SAML2AWS_CONFIG_FILE, session_duration, False, SAML2AWS_CAPABILITIES_FILE
+    )
+    try:
+        # Only the credentials JSON may go to stdout; prompts and saml2aws output go to stderr
+        with redirect_stdout(sys.stderr):
+            credentials = get_role_credentials(
+                saml2aws_helper,
+                role_arn,
+                CredentialCache(CREDENTIAL_PROCESS_CACHE_DIR),
+                session_duration,
+            )
+    except Exception as e:
+        logging.error(f"Failed to get credentials for {role_arn}: {e}")
+        sys.exit(1)
+    click.echo(json.dumps(credentials))
+
+
+@main_cli.command("config-export", help="Add credential_process profiles to ~/.aws/config")
+@click.option(
+    "--shortlisted",
+    "-l",
+    multiple=True,
+    help="Export only roles with the given keyword(s); e.g. -l keyword1 -l keyword2...",
+)
+@click.option(
+    "--exclude",
+    "-x",
+    multiple=True,
+    help="Skip roles with the given keyword(s); e.g. -x keyword1 -x keyword2...",
+)
+@click.option(
+    "--profile-name-format",
+    "-n",
+    default=DEFAULT_PROFILE_NAME_FORMAT,
+    show_default=True,
+    type=click.Choice(PROFILE_NAME_FORMATS, case_sensitive=False),
+    help="Set the profile name format.",
+)
+@click.option("--session-duration", "-t", help="Set the session duration in seconds.")
+def config_export(shortlisted, exclude, profile_name_format, session_duration):
+    if not exists(ALL_ROLES_FILE):
+        logging.error("No cached roles found; run awslogin first.")
+        return
+    profile_rolearn_dict = load_cached_profile_rolearn_dict(
+        profile_name_format, shortlisted, exclude=exclude
+    )
     config = get_aws_profiles(AWS_CONF_FILE)
+    updates = {}
+    for profile, role_arn in profile_rolearn_dict.items():
+        section = f"profile {profile}"
+        # Keep the other settings of existing profiles, e.g. region
+        values = dict(config.items(section, raw=True)) if config.has_section(section) else {}
+        values["credential_process"] = credential_process_command(role_arn, session_duration)
+        updates[section] = values
+    update_aws_profiles(AWS_CONF_FILE, updates)
+    logging.info(f"Exported {len(updates)} profile(s) to {AWS_CONF_FILE}")
 
-    profiles = []
-    for profile in config.sections():
-        if config[profile].get("source_profile") and config[profile].get("role_arn"):
 
-            if from_profile is None or from_profile == config[profile].get("source_profile"):
-                profiles.append(profile.replace("profile ", ""))
+@main_cli.command(help="Serve credentials to the AWS SDKs on a localhost HTTP endpoint")
+@click.option(
+    "--port", default=0, show_default=True, type=int, help="Port to listen on; 0 picks a free one."
+)
+@click.option(
+    "--profile-name-format",
+    "-n",
+    default=DEFAULT_PROFILE_NAME_FORMAT,
+    show_default=True,
+    type=click.Choice(PROFILE_NAME_FORMATS, case_sensitive=False),
+    help="Set the profile name format.",
+)
+@click.option("--session-duration", "-t", help="Set the session duration in seconds.")
+def serve(port, profile_name_format, session_duration):
+    from saml2awsmulti.server import CredentialsServer, ProfileCredentialsProvider
+
+    if not exists(ALL_ROLES_FILE):
+        logging.error("No cached roles found; run awslogin first.")
+        return
+    saml2aws_helper = Saml2AwsHelper(
+        SAML2AWS_CONFIG_FILE, session_duration, False, SAML2AWS_CAPABILITIES_FILE
+    )
+    saml2aws_helper.prepare()
+
+    # Credentials are only kept in the memory of the server
+    provider = ProfileCredentialsProvider(
+        saml2aws_helper,
+        load_cached_profile_rolearn_dict(profile_name_format, []),
+        CredentialCache(None),
+        session_duration,
+    )
+    token = secrets.token_urlsafe(32)
+    with atomic_write(SERVE_TOKEN_FILE) as f:
+        f.write(token)
+
+    server = CredentialsServer(provider, token, port=port)
+    logging.info(
+        "Serving credentials; in another shell run:\n"
+        f"  export AWS_CONTAINER_CREDENTIALS_FULL_URI={server.url}/<profile>\n"
+        f"  export AWS_CONTAINER_AUTHORIZATION_TOKEN_FILE={SERVE_TOKEN_FILE}\n"
+        "Press Ctrl+C to stop."
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Stopped.")
+    finally:
+        server.server_close()
+        os.remove(SERVE_TOKEN_FILE)
+
+
+@main_cli.command(help="List chained role profiles specified in ~/.aws/config")
+@click.option(
+    "--from-profile",
+    "-p",
+    help="List chained roles for the given profile name, including those chained through them.",
+)
+@click.option(
+    "--prewarm",
+    is_flag=True,
+    help="Assume the listed roles now and cache their credentials in ~/.aws/cli/cache, so the "
+    "AWS CLI can use them without calling STS; log in to their base profiles first.",
+)
+@click.option(
+    "--parallel",
+    "-P",
+    default=DEFAULT_PREWARM_WORKERS,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of roles assumed concurrently with --prewarm.",
+)
+def chained(from_profile, prewarm, parallel):
+    graph = ChainedRoleGraph(get_aws_profiles(AWS_CONF_FILE))
+    for cycle in graph.cycles:
+        logging.warning(f"Ignored cyclic source_profile chain: {' -> '.join(cycle)}")
+
+    if from_profile is None:
+        profiles = graph.resolvable()
+    else:
+        profiles = graph.descendants(from_profile)
 
     logging.info(f"Found {len(profiles)} chained role profiles")
     cnt = 1
     for profile in profiles:
-        logging.info(f"{cnt}: {profile}")
+        chain = graph.chain(profile)
+        via = f" (via {' -> '.join(chain[:-1])})" if len(chain) > 2 else ""
+        logging.info(f"{cnt}: {profile}{via}")
         cnt += 1
 
+    if prewarm and profiles:
+        _prewarm_chained_roles(graph, profiles, parallel)
+
+
+def _prewarm_chained_roles(graph, profiles, parallel):
+    from botocore.utils import JSONFileCache
+
+    entries = get_profile_entries(AWS_CRED_FILE)
+    expired = {}
+    for profile in profiles:
+        base_profile = graph.chain(profile)[0]
+        entry = entries.get(base_profile)
+        if entry is not None and is_expired(entry):
+            expired.setdefault(base_profile, []).append(profile)
+    for base_profile, skipped in expired.items():
+        logging.error(
+            f"Skipped {', '.join(skipped)}: the credentials of {base_profile} expired, "
+            "log in to it first"
+        )
+    profiles = [p for p in profiles if graph.chain(p)[0] not in expired]
+
+    results = prewarm_chained_roles(
+        graph, profiles, StsClientFactory(), JSONFileCache(CLI_CACHE_DIR), parallel
+    )
+    failed = 0
+    for profile, result in results.items():
+        if result["Status"] == "failed":
+            failed += 1
+            logging.error(f"Failed to assume {profile}: {result['Error']}")
+        else:
+            logging.info(f"{profile}: {result['Status']}, expires {result['Expiration']}")
+    logging.info(f"Pre-warmed {len(results) - failed}/{len(results)} chained role(s)")
+    if failed or expired:
+        sys.exit(1)
+
 
 @main_cli.command(help="Switch default profile")
 def switch():
-    cred_config = get_aws_profiles(AWS_CRED_FILE)
+    entries = get_profile_entries(AWS_CRED_FILE)
     options = [
         profile
-        for profile in cred_config.sections()
-        if profile != "default" and not _is_expired(cred_config, profile)
+        for profile, entry in entries.items()
+        if profile != "default" and not is_expired(entry)
     ]
     if options:
         profile = prompt_profile_selection(options)
         if profile is not None:
-            cred_config["default"] = cred_config[profile]
-            write_aws_profiles(AWS_CRED_FILE, cred_config)
+            values = read_profile(AWS_CRED_FILE, profile, entries[profile])
+            if values is None:
+                # The file changed since the index was read
+                values = dict(get_aws_profiles(AWS_CRED_FILE)[profile])
+            update_aws_profiles(AWS_CRED_FILE, {"default": values})
             logging.info(f"Set the default profile to {profile}")
         else:
             logging.info("Nothing selected. Aborted.")
@@ -216,7 +979,30 @@ def switch():
 
 @main_cli.command(help="Who am I?")
 @click.option("--profile", "-p", default="default", show_default=True, help="Profile name")
-def whoami(profile):
+@click.option(
+    "--all", "-a", "all_profiles", is_flag=True, help="Check every profile, as JSON lines."
+)
+@click.option(
+    "--profiles-matching",
+    "-m",
+    multiple=True,
+    help="Check the profiles with the given keyword(s), as JSON lines; e.g. -m dev -m 'tst-*'",
+)
+@click.option(
+    "--parallel",
+    "-P",
+    default=DEFAULT_WHOAMI_WORKERS,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of profiles checked concurrently with --all or --profiles-matching.",
+)
+def whoami(profile, all_profiles, profiles_matching, parallel):
+    if all_profiles or profiles_matching:
+        _whoami_profiles(profiles_matching, parallel)
+        return
+
+    from boto3.session import Session
+
     try:
         resp = Session(profile_name=profile).client("sts").get_caller_identity()
         del resp["ResponseMetadata"]
@@ -225,34 +1011,46 @@ def whoami(profile):
         logging.error(e)
 
 
+def _whoami_profiles(keywords, parallel):
+    client_factory = StsClientFactory()
+    profiles = client_factory.available_profiles()
+    if keywords:
+        matcher = KeywordMatcher(keywords)
+        profiles = [p for p in profiles if matcher.matches(p)]
+    if not profiles:
+        logging.info("No matching aws profile found.")
+        return
+
+    failed = 0
+    for identity in get_caller_identities(profiles, client_factory, parallel):
+        failed += "Error" in identity
+        click.echo(json.dumps(identity))
+    if failed:
+        logging.error(f"{failed} of {len(profiles)} profile(s) failed")
+        sys.exit(1)
+
+
 @main_cli.command(help="Remove expired credentials from ~/.aws/credentials")
 def clean():
-    cred_config = get_aws_profiles(AWS_CRED_FILE)
     removed = [
         profile
-        for profile in cred_config.sections()
-        if profile != "default" and _is_expired(cred_config, profile)
+        for profile, entry in get_profile_entries(AWS_CRED_FILE).items()
+        if profile != "default" and is_expired(entry)
     ]
     if removed:
-        for profile in removed:
-            cred_config.remove_section(profile)
-        write_aws_profiles(AWS_CRED_FILE, cred_config)
+        update_aws_profiles(AWS_CRED_FILE, {profile: None for profile in removed})
         profile_list = "\n  - ".join(removed)
         logging.info(f"Removed {len(removed)} expired profile(s):\n  - {profile_list}")
     else:
         logging.info("No expired profiles found.")
 
 
-def _is_expired(cred_config, profile):
-    """Return True if the profile's x_security_token_expires is in the past."""
-    expires_str = cred_config[profile].get("x_security_token_expires")
-    if not expires_str:
-        return False
-    try:
-        return datetime.fromisoformat(expires_str) < datetime.now(timezone.utc)
-    except ValueError:
-        logging.warning(f"Could not parse expiry for profile '{profile}': {expires_str}")
-        return False
+def _report_timings(print_report, timings_file):
+    spans = disable_timings()
+    if print_report:
+        click.echo(format_report(spans), err=True)
+    if timings_file:
+        write_json_lines(timings_file, spans)
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -0,0 +1,106 @@
+"""
+Probe what the installed saml2aws binary supports (version, command line flags), and cache the
+result so that the probe only runs again when the binary changes.
+"""
+
+import json
+import logging
+import re
+import shutil
+from collections import namedtuple
+from os import makedirs, stat
+from os.path import dirname, exists, realpath
+
+SAML2AWS_BINARY = "saml2aws"
+
+# Outputs passed to parse_capabilities, in this order
+SAML2AWS_PROBE_CMDS = [
+    [SAML2AWS_BINARY, "--version"],
+    [SAML2AWS_BINARY, "login", "--help"],
+]
+
+# Matches e.g. "--cache-file=CACHE-FILE" and kingpin's "--[no-]skip-prompt"
+FLAG_PATTERN = re.compile(r"--(?:\[no-\])?([a-z][a-z0-9-]*)")
+
+
+class Saml2AwsCapabilities(namedtuple("Saml2AwsCapabilities", ["version", "login_flags"])):
+    __slots__ = ()
+
+    @property
+    def stdin_password(self):
+        return "--stdin-password" in self.login_flags
+
+    @property
+    def session_duration(self):
+        return "--session-duration" in self.login_flags
+
+    @property
+    def login_cache_saml(self):
+        return "--cache-saml" in self.login_flags
+
+
+def get_binary_fingerprint(binary=SAML2AWS_BINARY):
+    """Return (resolved path, size, mtime_ns) of the binary found on PATH, or None."""
+    path = shutil.which(binary)
+    if path is None:
+        return None
+    path = realpath(path)
+    st = stat(path)
+    return path, st.st_size, st.st_mtime_ns
+
+
+def parse_capabilities(version_output, login_help):
+    lines = [line.strip() for line in version_output.splitlines() if line.strip()]
+    return Saml2AwsCapabilities(
+        version=lines[0] if lines else None,
+        login_flags=_parse_flags(login_help),
+    )
+
+
+def load_capabilities(filename, fingerprint):
+    """Return the cached Saml2AwsCapabilities of the binary, or None if it changed since."""
+    if not filename or fingerprint is None or not exists(filename):
+        return None
+    path, size, mtime_ns = fingerprint
+    try:
+        with open(filename) as f:
+            entry = json.load(f).get(path)
+        if not entry or entry.get("size") != size or entry.get("mtime_ns") != mtime_ns:
+            return None
+        return Saml2AwsCapabilities(entry.get("version"), tuple(entry["login_flags"]))
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        # Not JSON, or written by another version: probe saml2aws again
+        logging.debug(f"Ignored invalid saml2aws capabilities cache {filename}: {e!r}")
+        return None
+
+
+def save_capabilities(filename, fingerprint, capabilities):
+    """Cache the capabilities of the binary, alongside those of other saml2aws binaries."""
+    if not filename or fingerprint is None:
+        return
+    if not capabilities.login_flags:
+        # The probe failed (e.g. saml2aws crashed); try again next time
+        return
+    path, size, mtime_ns = fingerprint
+    cache = {}
+    if exists(filename):
+        try:
+            with open(filename) as f:
+                cache = json.load(f)
+        except ValueError:
+            pass
+        if not isinstance(cache, dict):
+            cache = {}
+    cache[path] = {
+        "size": size,
+        "mtime_ns": mtime_ns,
+        "version": capabilities.version,
+        "login_flags": list(capabilities.login_flags),
+    }
+    makedirs(dirname(filename) or ".", exist_ok=True)
+    with open(filename, "w") as f:
+        json.dump(cache, f, indent=2)
+
+
+def _parse_flags(help_output):
+    return tuple(sorted({f"--{name}" for name in FLAG_PATTERN.findall(help_output)}))
@@ -0,0 +1,206 @@
+"""
+Resolve the chained role profiles of ~/.aws/config (profiles assuming role_arn with the
+credentials of their source_profile, over any number of hops), and pre-warm their credentials
+in the AWS CLI cache so that the first use of a chained profile needs no STS call.
+"""
+
+import json
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from hashlib import sha1
+from os.path import join
+from pathlib import Path
+
+from saml2awsmulti.timings import span
+
+# Where the AWS CLI caches the responses of the AssumeRole calls it makes for chained profiles
+CLI_CACHE_DIR = join(str(Path.home()), ".aws", "cli", "cache")
+DEFAULT_PREWARM_WORKERS = 10
+# botocore calls AssumeRole again when cached credentials expire within 15 minutes
+CACHE_EXPIRY_WINDOW = timedelta(minutes=15)
+
+
+class ChainedRoleGraph:
+    """The chained role profiles of an AWS config file, as a graph from each source_profile to
+    the profiles assuming a role with its credentials.
+
+    A profile whose source_profile is not a chained profile itself (e.g. a profile logged in
+    with saml2aws) is one hop away from its base profile. Profiles whose chain of
+    source_profiles loops (see `cycles`), or leads into a loop, cannot be resolved.
+    """
+
+    def __init__(self, config):
+        self.roles = OrderedDict()  # profile: {"role_arn": ..., "source_profile": ..., ...}
+        self.children = defaultdict(list)  # source_profile: [profile, ...]
+        for section in config.sections():
+            values = config[section]
+            if values.get("source_profile") and values.get("role_arn"):
+                profile = section.replace("profile ", "")
+                self.roles[profile] = dict(values)
+                self.children[values.get("source_profile")].append(profile)
+        self.cycles = []
+        self._depths = self._resolve_depths()
+
+    def _resolve_depths(self):
+        """Return {profile: number of hops from its base profile, or None if unresolvable}."""
+        depths = {}
+        for profile in self.roles:
+            path = []
+            current = profile
+            while current in self.roles and current not in depths and current not in path:
+                path.append(current)
+                current = self.roles[current]["source_profile"]
+            if current in path:
+                start = path.index(current)
+                self.cycles.append(path[start:] + [current])
+                depth = None
+            elif current in depths:
+                depth = depths[current]
+            else:
+                depth = 0  # current is the base profile
+            for hop in reversed(path):
+                depth = None if depth is None else depth + 1
+                depths[hop] = depth
+        return depths
+
+    def depth(self, profile):
+        """Return the number of hops from the base profile to profile, or None."""
+        return self._depths.get(profile)
+
+    def chain(self, profile):
+        """Return [base_profile, ..., profile], or None if profile cannot be resolved."""
+        if self.depth(profile) is None:
+            return None
+        chain = [profile]
+        while chain[-1] in self.roles:
+            chain.append(self.roles[chain[-1]]["source_profile"])
+        return chain[::-1]
+
+    def descendants(self, profile):
+        """Return the resolvable profiles whose chain goes through profile, nearest first."""
+        found = []
+        queue = list(self.children.get(profile, []))
+        while queue:
+            child = queue.pop(0)
+            if child not in found and self.depth(child) is not None:
+                found.append(child)
+                queue.extend(self.children.get(child, []))
+        return found
+
+    def resolvable(self):
+        """Return the profiles that can be resolved, in config order."""
+        return [profile for profile in self.roles if self.depth(profile) is not None]
+
+
+def assume_role_args(role):
+    """Return the AssumeRole arguments botocore uses for a chained profile's config values,
+    without the generated RoleSessionName."""
+    args = {"RoleArn": role["role_arn"]}
+    if role.get("role_session_name"):
+        args["RoleSessionName"] = role["role_session_name"]
+    if role.get("external_id"):
+        args["ExternalId"] = role["external_id"]
+    if role.get("duration_seconds"):
+        try:
+            args["DurationSeconds"] = int(role["duration_seconds"])
+        except ValueError:
+            pass  # botocore ignores it too
+    return args
+
+
+def cli_cache_key(args):
+    """Return the key under which botocore caches the AssumeRole response for args: the sha1 of
+    the sorted JSON arguments, made file-safe."""
+    argument_hash = sha1(json.dumps(args, sort_keys=True).encode("utf-8")).hexdigest()
+    return argument_hash.replace(":", "_").replace("/", "_")
+
+
+def prewarm_chained_roles(
+    graph, profiles, client_factory, cache, max_workers=DEFAULT_PREWARM_WORKERS, now=None
+):
+    """Assume the roles of the given chained profiles and store the responses in cache.
+
+    Each role is assumed as soon as its source profile's credentials are available: roles one
+    hop away with an STS client from client_factory(base_profile), the others with
+    client_factory.with_credentials() of their source profile's response. Source profiles of
+    the given profiles are assumed too. Credentials still valid in the cache are reused.
+
+    Return {profile: {"Status": "assumed" or "cached", "Expiration": ...} or {"Status": "failed",
+    "Error": ...}} for the given profiles and their source profiles, in completion order.
+    """
+    wanted = set()
+    for profile in profiles:
+        wanted.update(graph.chain(profile)[1:])
+    results = OrderedDict()
+
+    def assume(profile, source_credentials):
+        role = graph.roles[profile]
+        args = assume_role_args(role)
+        key = cli_cache_key(args)
+        cached = _load_valid(cache, key, now)
+        if cached is not None:
+            return cached, {"Status": "cached", "Expiration": cached["Credentials"]["Expiration"]}
+
+        if role.get("mfa_serial"):
+            raise ValueError(f"{profile} needs an MFA code (mfa_serial), assume it interactively")
+        if source_credentials is None:
+            sts_client = client_factory(role["source_profile"])
+        else:
+            sts_client = client_factory.with_credentials(source_credentials)
+        args.setdefault("RoleSessionName", f"botocore-session-{int(time.time())}")
+        with span("assume_role", profile=profile):
+            response = sts_client.assume_role(**args)
+        response["Credentials"]["AccountId"] = response["AssumedRoleUser"]["Arn"].split(":")[4]
+        cache[key] = response
+        return response, {
+            "Status": "assumed",
+            "Expiration": _isoformat(response["Credentials"]["Expiration"]),
+        }
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {
+            executor.submit(assume, profile, None): profile
+            for profile in graph.roles
+            if profile in wanted and graph.depth(profile) == 1
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                profile = pending.pop(future)
+                try:
+                    response, results[profile] = future.result()
+                except Exception as e:
+                    logging.debug(f"AssumeRole failed for {profile}: {e}")
+                    results[profile] = {"Status": "failed", "Error": str(e)}
+                    for descendant in graph.descendants(profile):
+                        if descendant in wanted:
+                            error = f"source profile {profile} failed"
+                            results[descendant] = {"Status": "failed", "Error": error}
+                    continue
+                for child in graph.children.get(profile, []):
+                    if child in wanted:
+                        submitted = executor.submit(assume, child, response["Credentials"])
+                        pending[submitted] = child
+    return results
+
+
+def _load_valid(cache, key, now=None):
+    if key not in cache:
+        return None
+    try:
+        response = cache[key]
+        expiration = datetime.fromisoformat(
+            response["Credentials"]["Expiration"].replace("Z", "+00:00").replace("UTC", "+00:00")
+        )
+    except (KeyError, ValueError, AttributeError):
+        return None
+    if expiration - CACHE_EXPIRY_WINDOW <= (now or datetime.now(timezone.utc)):
+        return None
+    return response
+
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, datetime) else value
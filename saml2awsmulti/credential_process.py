@@ -0,0 +1,128 @@
+"""
+Serve role credentials to the AWS SDKs through the `credential_process` profile setting, so that
+each profile is only logged in when it is used.
+
+Credentials are cached in memory and in a directory only readable by the user, and reused while
+they are valid for at least `min_remaining` seconds; saml2aws is only called on a cache miss.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shlex
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from os.path import exists, join
+
+from saml2awsmulti.file_io import atomic_write, get_aws_profiles
+
+CREDENTIAL_PROCESS_VERSION = 1
+# botocore refreshes credential_process credentials 15 minutes before they expire; serving
+# credentials closer to expiry would make it call us again on every request.
+DEFAULT_MIN_REMAINING = 900
+PRIVATE_PROFILE_NAME = "credential-process"
+
+
+class CredentialCache:
+    """A two-level (memory, then disk) cache of credential_process outputs. With no cache_dir,
+    the credentials are only kept in memory."""
+
+    def __init__(self, cache_dir, min_remaining=DEFAULT_MIN_REMAINING, clock=time.time):
+        self._cache_dir = cache_dir
+        self._min_remaining = min_remaining
+        self._clock = clock
+        self._memory = {}
+
+    def get(self, key):
+        """Return the cached credentials for key, or None if missing or about to expire."""
+        credentials = self._memory.get(key)
+        if credentials is None:
+            credentials = self._read(key)
+        if credentials is None or not self._is_fresh(credentials):
+            self._memory.pop(key, None)
+            return None
+        self._memory[key] = credentials
+        return credentials
+
+    def put(self, key, credentials):
+        self._memory[key] = credentials
+        if self._cache_dir is None:
+            return
+        os.makedirs(self._cache_dir, mode=0o700, exist_ok=True)
+        os.chmod(self._cache_dir, 0o700)
+        with atomic_write(self._path(key)) as f:
+            json.dump(credentials, f)
+
+    def _is_fresh(self, credentials):
+        try:
+            expires = datetime.fromisoformat(credentials["Expiration"]).timestamp()
+        except (KeyError, TypeError, ValueError):
+            return False
+        return expires - self._clock() >= self._min_remaining
+
+    def _read(self, key):
+        if self._cache_dir is None:
+            return None
+        path = self._path(key)
+        if not exists(path):
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except ValueError:
+            return None
+
+    def _path(self, key):
+        return join(self._cache_dir, f"{key}.json")
+
+
+def cache_key(role_arn, session_duration=None):
+    return hashlib.sha1(f"{role_arn}:{session_duration or ''}".encode()).hexdigest()
+
+
+def to_credential_process_output(section):
+    """Convert a credentials file section written by saml2aws to the credential_process JSON."""
+    expires = datetime.fromisoformat(section["x_security_token_expires"])
+    return {
+        "Version": CREDENTIAL_PROCESS_VERSION,
+        "AccessKeyId": section["aws_access_key_id"],
+        "SecretAccessKey": section["aws_secret_access_key"],
+        "SessionToken": section["aws_session_token"],
+        "Expiration": expires.astimezone(timezone.utc).isoformat(),
+    }
+
+
+def fetch_role_credentials(saml2aws_helper, role_arn):
+    """Login to role_arn with saml2aws, without touching ~/.aws/credentials."""
+    with tempfile.TemporaryDirectory(prefix="saml2aws-multi-") as tmp_dir:
+        private_cred_file = join(tmp_dir, "credentials")
+        returncode = saml2aws_helper.run_saml2aws_login(
+            role_arn, PRIVATE_PROFILE_NAME, credentials_file=private_cred_file
+        )
+        config = get_aws_profiles(private_cred_file)
+        if returncode != 0 or not config.has_section(PRIVATE_PROFILE_NAME):
+            raise ValueError(f"saml2aws login failed (return code {returncode})")
+        return to_credential_process_output(config[PRIVATE_PROFILE_NAME])
+
+
+def get_role_credentials(saml2aws_helper, role_arn, cache, session_duration=None):
+    """Return the credential_process JSON for role_arn, from the cache while still valid."""
+    key = cache_key(role_arn, session_duration)
+    credentials = cache.get(key)
+    if credentials is None:
+        logging.debug(f"No valid cached credentials for {role_arn}")
+        credentials = fetch_role_credentials(saml2aws_helper, role_arn)
+        cache.put(key, credentials)
+    return credentials
+
+
+def credential_process_command(role_arn, session_duration=None):
+    """Return the credential_process setting that runs awslogin for role_arn."""
+    # Use the absolute path: the SDKs do not necessarily run with the user's shell PATH
+    cmd = [shutil.which("awslogin") or "awslogin", "credential-process", "--role", role_arn]
+    if session_duration:
+        cmd += ["--session-duration", str(session_duration)]
+    return shlex.join(cmd)
@@ -0,0 +1,158 @@
+"""
+A sidecar index of an AWS credentials file (<credentials>.index.json): for each profile, the
+byte offset of its section and when its credentials expire.
+
+`switch` and `clean` only need the profile names and expiry times, which the index gives without
+parsing every section with ConfigParser. The index records the mtime and size of the credentials
+file it was built from; when they no longer match (e.g. saml2aws wrote the file itself), the
+credentials file is scanned again and the index rebuilt.
+"""
+
+import json
+import logging
+import re
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from os import fstat, stat
+from os.path import exists
+
+INDEX_SUFFIX = ".index.json"
+EXPIRES_KEY = "x_security_token_expires"
+
+SECTION_HEADER = re.compile(rb"\s*\[(?P<name>[^\]]+)\]")
+EXPIRES_LINE = re.compile(rb"\s*" + EXPIRES_KEY.encode() + rb"\s*[=:]\s*(?P<value>.*?)\s*$")
+
+# expires is a POSIX timestamp, or None if the profile has no (valid) expiry
+ProfileEntry = namedtuple("ProfileEntry", ["offset", "expires"])
+
+
+def index_filename(cred_file):
+    return f"{cred_file}{INDEX_SUFFIX}"
+
+
+def parse_expires(value, profile):
+    """Return x_security_token_expires as a POSIX timestamp, or None if it cannot be parsed."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        logging.warning(f"Could not parse expiry for profile '{profile}': {value}")
+        return None
+
+
+def is_expired(entry, now=None):
+    return entry.expires is not None and entry.expires < (now or time.time())
+
+
+def split_fresh_profiles(entries, profiles, min_remaining, now=None):
+    """Split profiles into those to login again (missing, unknown expiry, or expiring within
+    min_remaining seconds) and {profile: expires} of those still fresh, in one pass."""
+    now = now or time.time()
+    stale, fresh = [], OrderedDict()
+    for profile in profiles:
+        entry = entries.get(profile)
+        if entry is None or entry.expires is None or entry.expires - now <= min_remaining:
+            stale.append(profile)
+        else:
+            fresh[profile] = entry.expires
+    return stale, fresh
+
+
+def get_profile_entries(cred_file):
+    """Return an OrderedDict of {profile: ProfileEntry} in file order, from the index if it is
+    up to date, otherwise by scanning the credentials file (and rebuilding the index)."""
+    if not exists(cred_file):
+        return OrderedDict()
+    entries = load_index(cred_file)
+    if entries is None:
+        logging.debug(f"Rebuilding the profile index of {cred_file}")
+        with open(cred_file, "rb") as f:
+            # Record the file as it was when the scan started: if it is rewritten meanwhile, the
+            # index is stale and the next call scans it again
+            st = fstat(f.fileno())
+            entries = scan_profiles(f)
+        save_index(cred_file, entries, st)
+    return entries
+
+
+def scan_profiles(lines):
+    """Return {profile: ProfileEntry} from the binary lines of a credentials file."""
+    entries = OrderedDict()
+    offset = 0
+    profile, profile_offset, expires = None, None, None
+    for line in lines:
+        match = SECTION_HEADER.match(line)
+        if match:
+            if profile is not None:
+                entries.setdefault(profile, ProfileEntry(profile_offset, expires))
+            profile = match.group("name").strip().decode("utf-8")
+            profile_offset, expires = offset, None
+        elif profile is not None:
+            match = EXPIRES_LINE.match(line)
+            if match:
+                expires = parse_expires(match.group("value").decode("utf-8"), profile)
+        offset += len(line)
+    if profile is not None:
+        entries.setdefault(profile, ProfileEntry(profile_offset, expires))
+    return entries
+
+
+def load_index(cred_file):
+    """Return the indexed {profile: ProfileEntry}, or None if the index is missing or stale."""
+    filename = index_filename(cred_file)
+    if not exists(filename):
+        return None
+    try:
+        with open(filename) as f:
+            index = json.load(f)
+    except ValueError:
+        return None
+    st = stat(cred_file)
+    if index.get("mtime_ns") != st.st_mtime_ns or index.get("size") != st.st_size:
+        return None
+    return OrderedDict((name, ProfileEntry(*entry)) for name, entry in index["profiles"])
+
+
+def save_index(cred_file, entries, st=None):
+    """Write the index of entries, scanned from cred_file as of its os.stat_result st (by
+    default, as it is now)."""
+    # Imported here, as file_io imports this module
+    from saml2awsmulti.file_io import atomic_write
+
+    st = st or stat(cred_file)
+    index = {
+        "mtime_ns": st.st_mtime_ns,
+        "size": st.st_size,
+        "profiles": [[name, list(entry)] for name, entry in entries.items()],
+    }
+    try:
+        with atomic_write(index_filename(cred_file)) as f:
+            json.dump(index, f, separators=(",", ":"))
+    except OSError as e:
+        logging.debug(f"Could not save the profile index of {cred_file}: {e}")
+
+
+def read_profile(cred_file, profile, entry):
+    """Return {key: value} of the profile's section, read from its indexed byte offset.
+
+    Return None if the section is no longer at that offset.
+    """
+    values = {}
+    with open(cred_file, "rb") as f:
+        f.seek(entry.offset)
+        match = SECTION_HEADER.match(f.readline())
+        if not match or match.group("name").strip().decode("utf-8") != profile:
+            return None
+        for line in f:
+            if SECTION_HEADER.match(line):
+                break
+            line = line.decode("utf-8").strip()
+            if not line or line.startswith(("#", ";")):
+                continue
+            key, sep, value = line.partition("=")
+            if not sep:
+                key, sep, value = line.partition(":")
+            values[key.strip()] = value.strip()
+    return values
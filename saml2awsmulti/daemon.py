@@ -0,0 +1,180 @@
+"""
+Keep the credentials of a set of profiles fresh by logging in again shortly before they expire.
+"""
+
+import heapq
+import logging
+import time
+from datetime import datetime
+
+from saml2awsmulti.credentials_index import get_profile_entries
+from saml2awsmulti.login_executor import LoginResult
+from saml2awsmulti.retry import is_transient_failure
+
+DEFAULT_REFRESH_MARGIN = 600  # Seconds before expiry
+DEFAULT_COALESCE_WINDOW = 300  # Profiles due this soon after the first one join its refresh
+DEFAULT_RETRY_DELAY = 60  # First retry of a transient failure; doubled on each failure
+DEFAULT_MAX_RETRY_DELAY = 3600
+DEFAULT_SESSION_DURATION = 3600  # Assumed when saml2aws did not write an expiry
+MAX_SLEEP = 60  # Wake up regularly, e.g. in case the computer was suspended
+
+
+class ExpiryScheduler:
+    """A min-heap of (due time, profile). Scheduling a profile again supersedes its earlier
+    entry, which is dropped lazily when it reaches the top of the heap."""
+
+    def __init__(self):
+        self._heap = []
+        self._due = {}
+
+    def __len__(self):
+        return len(self._due)
+
+    def schedule(self, profile, due):
+        self._due[profile] = due
+        heapq.heappush(self._heap, (due, profile))
+
+    def next_due(self):
+        """Return the earliest due time, or None if nothing is scheduled."""
+        self._discard_superseded()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, until):
+        """Remove and return the profiles due at or before `until`, earliest first."""
+        profiles = []
+        while self.next_due() is not None and self.next_due() <= until:
+            _, profile = heapq.heappop(self._heap)
+            del self._due[profile]
+            profiles.append(profile)
+        return profiles
+
+    def clear(self):
+        self._heap.clear()
+        self._due.clear()
+
+    def _discard_superseded(self):
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+
+class CredentialRefreshDaemon:
+    """Refresh each profile `refresh_margin` seconds before its x_security_token_expires.
+
+    `refresh(profiles)` logs in to a batch of profiles and returns a list of LoginResult, e.g.
+    run_logins or run_sts_logins with the credentials kept in memory by the Saml2AwsHelper.
+    Profiles falling due within `coalesce_window` of each other are refreshed in one batch, so
+    that they share one IdP session. `clock` and `sleep` can be replaced in tests.
+
+    A profile whose refresh failed transiently (see is_transient_failure) is retried after
+    `retry_delay` seconds, doubling up to `max_retry_delay`. Any other failure, e.g. a wrong
+    password or a role that was removed, would fail the same way on every retry, and repeated
+    failed IdP logins lock the user's account: the profile is dropped, and when a whole batch
+    fails that way the daemon stops.
+    """
+
+    def __init__(
+        self,
+        refresh,
+        profiles,
+        aws_cred_file,
+        refresh_margin=DEFAULT_REFRESH_MARGIN,
+        coalesce_window=DEFAULT_COALESCE_WINDOW,
+        retry_delay=DEFAULT_RETRY_DELAY,
+        max_retry_delay=DEFAULT_MAX_RETRY_DELAY,
+        session_duration=DEFAULT_SESSION_DURATION,
+        clock=time.time,
+        sleep=time.sleep,
+    ):
+        self._refresh = refresh
+        self._aws_cred_file = aws_cred_file
+        self._refresh_margin = refresh_margin
+        self._coalesce_window = coalesce_window
+        self._retry_delay = retry_delay
+        self._max_retry_delay = max_retry_delay
+        self._failures = {}  # profile: consecutive transient failures
+        self._session_duration = session_duration
+        self._clock = clock
+        self._sleep = sleep
+        self._scheduler = ExpiryScheduler()
+
+        entries = get_profile_entries(aws_cred_file)
+        now = clock()
+        for profile in profiles:
+            entry = entries.get(profile)
+            if entry is None or entry.expires is None:
+                # Never logged in, or unknown expiry: refresh straight away
+                self._scheduler.schedule(profile, now)
+            else:
+                self._schedule_expiry(profile, entry.expires)
+
+    def next_due(self):
+        return self._scheduler.next_due()
+
+    def run_once(self):
+        """Refresh the profiles that are due, if any; return their LoginResults."""
+        now = self._clock()
+        next_due = self._scheduler.next_due()
+        if next_due is None or next_due > now:
+            return []
+
+        profiles = self._scheduler.pop_due(now + self._coalesce_window)
+        logging.info(f"Refreshing {len(profiles)} profile(s): {', '.join(profiles)}")
+        try:
+            results = self._refresh(profiles)
+        except Exception as e:
+            logging.error(f"Failed to refresh {', '.join(profiles)}: {e}")
+            results = [LoginResult(profile, None, None, str(e)) for profile in profiles]
+
+        entries = get_profile_entries(self._aws_cred_file)
+        now = self._clock()
+        dropped = []
+        for result in results:
+            profile = result.profile_name
+            entry = entries.get(profile)
+            if result.returncode == 0 and entry is not None:
+                self._failures.pop(profile, None)
+                expires = entry.expires or now + self._session_duration
+                # Credentials shorter-lived than the refresh margin must not cause a busy loop
+                self._schedule_expiry(profile, expires, now + self._retry_delay)
+            elif _is_transient(result):
+                failures = self._failures[profile] = self._failures.get(profile, 0) + 1
+                delay = min(self._retry_delay * 2 ** (failures - 1), self._max_retry_delay)
+                logging.warning(f"Failed to refresh {profile}; retrying in {delay}s")
+                self._scheduler.schedule(profile, now + delay)
+            else:
+                logging.error(f"Failed to refresh {profile}; no longer refreshing it")
+                self._failures.pop(profile, None)
+                dropped.append(profile)
+        if dropped and len(dropped) == len(results):
+            # Most likely the password is wrong: stop before the IdP locks the account
+            logging.error("Every refresh failed; stopping. Check your password and run again.")
+            self._scheduler.clear()
+        return results
+
+    def run(self, until=None):
+        """Refresh profiles as they fall due, until `until` (a clock time) or forever."""
+        while len(self._scheduler) and (until is None or self._clock() < until):
+            self.run_once()
+            if not len(self._scheduler):
+                break
+            delay = self._scheduler.next_due() - self._clock()
+            if until is not None:
+                delay = min(delay, until - self._clock())
+            self._sleep(min(max(delay, 0), MAX_SLEEP))
+
+    def _schedule_expiry(self, profile, expires, not_before=None):
+        due = expires - self._refresh_margin
+        if not_before is not None:
+            due = max(due, not_before)
+        self._scheduler.schedule(profile, due)
+        logging.debug(
+            f"{profile} expires at {datetime.fromtimestamp(expires):%Y-%m-%d %H:%M:%S}, "
+            f"next refresh at {datetime.fromtimestamp(due):%Y-%m-%d %H:%M:%S}"
+        )
+
+
+def _is_transient(result):
+    """Return True if the failed LoginResult is worth retrying, judging by its error. A login
+    that timed out or raised has no returncode; it is judged by its error alone."""
+    returncode = 1 if result.returncode is None else result.returncode
+    return is_transient_failure(returncode, result.error or "")
@@ -1,12 +1,27 @@
 import csv
+import os
+import re
+import stat
+import tempfile
 from configparser import ConfigParser
+from contextlib import contextmanager
 from os import makedirs
-from os.path import dirname, exists
+from os.path import basename, dirname, exists
+
+from saml2awsmulti.credentials_index import save_index, scan_profiles
+from saml2awsmulti.timings import span
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # Advisory locking is unavailable on Windows; fall back to unlocked writes.
+    fcntl = None
 
 
 def write_csv(output_filename, data_list):
-    makedirs(dirname(output_filename), exist_ok=True)
-    with open(output_filename, "w") as f:
+    """Write the rows of data_list, which may be a generator; the file is only replaced once
+    every row has been written."""
+    with atomic_write(output_filename) as f:
         csv_out = csv.writer(f)
         for item in data_list:
             csv_out.writerow(item)
@@ -47,5 +62,148 @@ def get_aws_profiles(filename):
 
 
 def write_aws_profiles(filename, config):
-    with open(filename, "w") as configfile:
+    with atomic_write(filename) as configfile:
         config.write(configfile)
+
+
+@contextmanager
+def atomic_write(filename):
+    """Write `filename` through a temporary file in the same directory, then os.replace() it,
+    so that readers never see a partially written file. A symlink is followed, so its target
+    is replaced rather than the link. The file mode, owner and group are preserved; new files
+    are only readable by the owner, as they usually hold credentials."""
+    filename = os.path.realpath(filename)
+    directory = dirname(filename)
+    makedirs(directory, exist_ok=True)
+    st = os.stat(filename) if exists(filename) else None
+    mode = stat.S_IMODE(st.st_mode) if st is not None else 0o600
+    fd, tmp_filename = tempfile.mkstemp(dir=directory, prefix=f".{basename(filename)}.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_filename, mode)
+        if st is not None and hasattr(os, "chown"):
+            try:
+                os.chown(tmp_filename, st.st_uid, st.st_gid)
+            except PermissionError:
+                pass  # Only root can give the file away; keep our own owner then
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        os.unlink(tmp_filename)
+        raise
+
+
+@contextmanager
+def file_lock(filename):
+    """Hold an exclusive advisory lock on `filename`.lock for the duration of the block."""
+    makedirs(dirname(filename) or ".", exist_ok=True)
+    with open(f"{filename}.lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+SECTION_HEADER = re.compile(r"\s*\[(?P<name>[^\]]+)\]")
+
+
+def update_aws_profiles(filename, updates):
+    """Apply {section: {key: value}} updates to an AWS credentials/config file in place.
+
+    A section mapped to None is removed. Only the updated sections are rewritten: other
+    sections, comments and the order of the file are kept as they are. The update holds the
+    file lock and replaces the file atomically, so it composes with concurrent awslogin
+    processes and parallel saml2aws logins. The profile index of the file is updated too.
+    """
+    with span("credentials_write", sections=len(updates)), file_lock(filename):
+        lines = []
+        if exists(filename):
+            with open(filename) as f:
+                lines = f.readlines()
+
+        new_lines = _update_sections(lines, updates)
+        if new_lines != lines:
+            with atomic_write(filename) as f:
+                f.writelines(new_lines)
+                f.flush()
+                # Stamp the index with the new file as written: if saml2aws (which does not
+                # take the lock) writes the file after it is replaced, the index is then stale
+                st = os.fstat(f.fileno())
+            save_index(filename, scan_profiles(line.encode("utf-8") for line in new_lines), st)
+
+
+def _update_sections(lines, updates):
+    preamble, sections = _split_sections(lines)
+    new_lines = list(preamble)
+    done = set()
+    for name, leading, body in sections:
+        if name not in updates:
+            new_lines.extend(leading + body)
+        elif updates[name] is not None and name not in done:
+            # Keep the comments inside the section and the blank lines after it
+            comments = [line for line in body[1:] if _is_comment(line)]
+            blank_lines = len(body) - len(_rstrip_blank_lines(body))
+            new_lines.extend(leading)
+            new_lines.extend(_format_section(name, updates[name], comments))
+            new_lines.extend(["\n"] * blank_lines)
+        done.add(name)
+
+    for name, values in updates.items():
+        if name not in done and values is not None:
+            if new_lines and not new_lines[-1].endswith("\n"):
+                new_lines[-1] += "\n"
+            if new_lines and new_lines[-1].strip():
+                new_lines.append("\n")
+            new_lines.extend(_format_section(name, values))
+            new_lines.append("\n")  # ConfigParser.write also ends each section with a blank line
+    return new_lines
+
+
+def _split_sections(lines):
+    """Return (preamble lines, [(name, leading comment lines, section lines)]).
+
+    The comment lines right above a section header belong to that section, and are removed
+    with it.
+    """
+    preamble, sections = [], []
+    current = preamble
+    for line in lines:
+        match = SECTION_HEADER.match(line)
+        if match:
+            start = len(current)
+            while start > 0 and _is_comment(current[start - 1]):
+                start -= 1
+            leading = current[start:]
+            del current[start:]
+            current = [line]
+            sections.append((match.group("name").strip(), leading, current))
+        else:
+            current.append(line)
+    return preamble, sections
+
+
+def _rstrip_blank_lines(lines):
+    end = len(lines)
+    while end > 0 and not lines[end - 1].strip():
+        end -= 1
+    return lines[:end]
+
+
+def _is_comment(line):
+    return line.lstrip().startswith(("#", ";"))
+
+
+def _format_section(name, values, comments=()):
+    return [f"[{name}]\n", *comments, *(_format_value(k, v) for k, v in values.items())]
+
+
+def _format_value(key, value):
+    # Indent the continuation lines of multi-line values, e.g. the sub-keys of "s3 =", or they
+    # would be read back as keys of the section
+    lines = f"{key} = {value}".split("\n")
+    return "\n    ".join(line.rstrip() for line in lines) + "\n"
@@ -0,0 +1,45 @@
+"""
+Fuzzy filtering of thousands of roles for the role prompt, fast enough to run on every keystroke.
+"""
+
+import re
+
+
+class FuzzyFilter:
+    """Filter texts (e.g. "profile-name account-alias") with case-insensitive fuzzy queries.
+
+    A query matches a text containing its characters in order, e.g. "dvadm" matches
+    "dev-admin". Matches containing the query as a substring rank first, then the other
+    matches, each in input order.
+
+    There is nothing to build up front: typing one more character only scans the matches of
+    the previous query, and the matches of the shorter queries are kept, so backspace costs
+    nothing.
+    """
+
+    def __init__(self, texts):
+        self.texts = [text.lower() for text in texts]
+        self._history = []  # [(query, matches)], each query extending the previous one
+
+    def search(self, query):
+        """Return the indexes of the texts matching query, best matches first."""
+        query = query.lower()
+        while self._history and not query.startswith(self._history[-1][0]):
+            self._history.pop()
+        if self._history and self._history[-1][0] == query:
+            matches = self._history[-1][1]
+        elif not query:
+            return list(range(len(self.texts)))
+        else:
+            # Matches of "abc" are among the matches of "ab"
+            candidates = self._history[-1][1] if self._history else range(len(self.texts))
+            search = re.compile(".*?".join(map(re.escape, query))).search
+            texts = self.texts
+            matches = [i for i in candidates if search(texts[i])]
+            self._history.append((query, matches))
+
+        substrings = [i for i in matches if query in self.texts[i]]
+        if len(substrings) == len(matches):
+            return list(matches)
+        ranked_first = set(substrings)
+        return substrings + [i for i in matches if i not in ranked_first]
@@ -0,0 +1,80 @@
+"""
+Check who each of many profiles is logged in as, with STS GetCallerIdentity calls running
+concurrently.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+DEFAULT_WHOAMI_WORKERS = 10
+
+
+class StsClientFactory:
+    """Create an STS client per profile.
+
+    Each profile needs its own botocore session (credentials, region), but a new session loads
+    and parses the STS service model and endpoint data again; the sessions created here share
+    the data loader (and its cache) of one base session instead.
+    """
+
+    def __init__(self, region=None):
+        import botocore.session
+
+        self._session_class = botocore.session.Session
+        self._region = region
+        self._base_session = botocore.session.get_session()
+        self._loader = self._base_session.get_component("data_loader")
+        # Fill the loader's cache once, before the profile sessions are created concurrently
+        self._base_session.create_client("sts", region_name=region)
+
+    def available_profiles(self):
+        """Return the profiles of ~/.aws/credentials and ~/.aws/config."""
+        return list(self._base_session.available_profiles)
+
+    def __call__(self, profile):
+        session = self._session_class(profile=profile)
+        session.register_component("data_loader", self._loader)
+        return session.create_client("sts", region_name=self._region)
+
+    def with_credentials(self, credentials):
+        """Create an STS client using the Credentials of an STS response (e.g. AssumeRole)."""
+        return self._base_session.create_client(
+            "sts",
+            region_name=self._region,
+            aws_access_key_id=credentials["AccessKeyId"],
+            aws_secret_access_key=credentials["SecretAccessKey"],
+            aws_session_token=credentials["SessionToken"],
+        )
+
+
+def get_caller_identities(profiles, client_factory, max_workers=DEFAULT_WHOAMI_WORKERS):
+    """Call GetCallerIdentity for each profile concurrently, and yield one dict per profile as
+    soon as its call completes: Profile, Account, Arn, UserId and LatencyMs, or Profile, Error
+    and LatencyMs if the call failed."""
+
+    def whoami(profile):
+        start = time.perf_counter()
+        try:
+            sts_client = client_factory(profile)
+            start = time.perf_counter()
+            resp = sts_client.get_caller_identity()
+        except Exception as e:
+            logging.debug(f"GetCallerIdentity failed for {profile}: {e}")
+            return {"Profile": profile, "Error": str(e), "LatencyMs": _elapsed_ms(start)}
+        return {
+            "Profile": profile,
+            "Account": resp["Account"],
+            "Arn": resp["Arn"],
+            "UserId": resp["UserId"],
+            "LatencyMs": _elapsed_ms(start),
+        }
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(whoami, profile) for profile in profiles]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def _elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 1)
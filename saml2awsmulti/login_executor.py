@@ -0,0 +1,118 @@
+"""
+Run saml2aws logins for multiple roles, optionally with a bounded pool of workers.
+"""
+
+import logging
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from os.path import exists, join
+
+from saml2awsmulti.file_io import get_aws_profiles, update_aws_profiles
+from saml2awsmulti.retry import AdaptiveConcurrency
+
+# error describes why a login did not complete, e.g. that it timed out (returncode is None)
+LoginResult = namedtuple(
+    "LoginResult", ["profile_name", "role_arn", "returncode", "error"], defaults=[None]
+)
+
+
+def run_logins(saml2aws_helper, profile_rolearn_dict, profiles, aws_cred_file, parallel=1):
+    """Login to each of the given profiles and return a list of LoginResult in input order.
+
+    A login timing out does not stop the others. Each saml2aws process writes to its own
+    private credentials file, which is then merged into aws_cred_file under a file lock, so
+    that neither parallel logins nor other awslogin processes (e.g. `awslogin clean`) can lose
+    or corrupt a profile.
+    """
+    if parallel <= 1 or len(profiles) <= 1:
+        results = []
+        with tempfile.TemporaryDirectory(prefix="saml2aws-multi-") as tmp_dir:
+            for i, profile in enumerate(profiles):
+                role_arn = profile_rolearn_dict[profile]
+                try:
+                    returncode = _login_and_merge(
+                        saml2aws_helper,
+                        role_arn,
+                        profile,
+                        join(tmp_dir, f"credentials-{i}"),
+                        aws_cred_file,
+                    )
+                except TimeoutError as e:
+                    logging.error(f"Failed to login {profile}: {e}")
+                    results.append(LoginResult(profile, role_arn, None, str(e)))
+                else:
+                    error = _login_error(saml2aws_helper, profile) if returncode != 0 else None
+                    results.append(LoginResult(profile, role_arn, returncode, error))
+        return results
+
+    # Prompt for the password and probe saml2aws once, before any worker thread needs them
+    saml2aws_helper.prepare()
+
+    # Up to `parallel` logins run at once, fewer while the IdP throttles them.
+    concurrency = AdaptiveConcurrency(parallel)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="saml2aws-multi-") as tmp_dir:
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            futures = {
+                executor.submit(
+                    _login_and_merge,
+                    saml2aws_helper,
+                    profile_rolearn_dict[profile],
+                    profile,
+                    join(tmp_dir, f"credentials-{i}"),
+                    aws_cred_file,
+                    concurrency,
+                ): profile
+                for i, profile in enumerate(profiles)
+            }
+            for future in as_completed(futures):
+                profile = futures[future]
+                returncode, error = None, None
+                try:
+                    returncode = future.result()
+                    error = _login_error(saml2aws_helper, profile) if returncode != 0 else None
+                except Exception as e:
+                    error = str(e)
+                    logging.error(f"Failed to login {profile}: {e}")
+                results[profile] = LoginResult(
+                    profile, profile_rolearn_dict[profile], returncode, error
+                )
+
+    return [results[profile] for profile in profiles]
+
+
+def _login_error(saml2aws_helper, profile):
+    """Return what saml2aws printed when the login to profile failed, or None."""
+    return saml2aws_helper.login_errors.get(profile)
+
+
+def _login_and_merge(
+    saml2aws_helper, role_arn, profile_name, private_cred_file, aws_cred_file, concurrency=None
+):
+    returncode = saml2aws_helper.run_saml2aws_login(
+        role_arn, profile_name, credentials_file=private_cred_file, concurrency=concurrency
+    )
+    if returncode == 0:
+        merge_private_credentials(private_cred_file, profile_name, aws_cred_file)
+    return returncode
+
+
+def merge_private_credentials(private_cred_file, profile_name, aws_cred_file):
+    """Copy the profile saml2aws wrote to its private credentials file into aws_cred_file."""
+    private_config = get_aws_profiles(private_cred_file) if exists(private_cred_file) else None
+    if private_config is None or not private_config.has_section(profile_name):
+        logging.warning(f"saml2aws did not write credentials for {profile_name}")
+    else:
+        update_aws_profiles(aws_cred_file, {profile_name: dict(private_config[profile_name])})
+
+
+def log_login_summary(results, skipped=()):
+    """Log how many logins succeeded, the roles skipped, and the return code of each failed
+    login."""
+    failed = [r for r in results if r.returncode != 0]
+    logging.info(f"Logged in {len(results) - len(failed)}/{len(results)} role(s)")
+    if skipped:
+        logging.info(f"Skipped {len(skipped)} role(s) with fresh credentials: {', '.join(skipped)}")
+    for r in failed:
+        logging.error(f"  - {r.profile_name}: {r.error or f'failed (return code {r.returncode})'}")
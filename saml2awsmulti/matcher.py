@@ -0,0 +1,81 @@
+"""
+Match profile names and role ARNs against --shortlisted, --pre-select and --exclude keywords.
+"""
+
+import re
+from fnmatch import translate
+
+import click
+
+GLOB_CHARS = "*?["  # Not valid in IAM role names, so plain keywords never contain them
+REGEX_PREFIX = "re:"
+
+
+class KeywordMatcher:
+    """Compile a set of keywords into a single regular expression, so that each name is scanned
+    once instead of once per keyword.
+
+    - A plain keyword matches names containing it.
+    - A keyword with glob characters (`*`, `?`, `[`) must match the whole name, e.g. `*-dev`.
+    - A keyword prefixed with `re:` is a regular expression searched in the name; an invalid
+      one raises click.BadParameter.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = list(keywords)
+        self.literals = [k for k in self.keywords if not _is_pattern(k)]
+        patterns = []
+        if self.literals:
+            patterns.append(_trie_regex(self.literals))
+        for keyword in self.keywords:
+            if keyword.startswith(REGEX_PREFIX):
+                pattern = keyword.replace(REGEX_PREFIX, "", 1)
+                try:
+                    re.compile(pattern)
+                except re.error as e:
+                    raise click.BadParameter(f"invalid regular expression in '{keyword}': {e}")
+                patterns.append(f"(?:{pattern})")
+            elif _is_glob(keyword):
+                patterns.append(f"(?:^{translate(keyword)})")
+        self._regex = re.compile("|".join(patterns)) if patterns else None
+
+    def __bool__(self):
+        return self._regex is not None
+
+    @property
+    def is_literal(self):
+        """True if every keyword is a plain substring keyword."""
+        return len(self.literals) == len(self.keywords)
+
+    def matches(self, name):
+        return self._regex is not None and self._regex.search(name) is not None
+
+
+def _is_glob(keyword):
+    return any(c in keyword for c in GLOB_CHARS)
+
+
+def _is_pattern(keyword):
+    return keyword.startswith(REGEX_PREFIX) or _is_glob(keyword)
+
+
+def _trie_regex(literals):
+    """Return a regex matching any of the literals, with common prefixes factored out so the
+    regex engine does not retry every keyword at every position."""
+    trie = {}
+    for literal in literals:
+        node = trie
+        for c in literal:
+            node = node.setdefault(c, {})
+        node[""] = {}  # End of a keyword
+    return _trie_node_regex(trie)
+
+
+def _trie_node_regex(node):
+    if "" in node:
+        # A keyword ends here; any longer keyword sharing this prefix also contains it
+        return ""
+    alternatives = [re.escape(c) + _trie_node_regex(child) for c, child in sorted(node.items())]
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return "(?:" + "|".join(alternatives) + ")"
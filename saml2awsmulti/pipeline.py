@@ -0,0 +1,68 @@
+"""
+Overlap saml2aws work (capability probe, role discovery, IdP authentication) with the
+interactive role selection prompt.
+"""
+
+import logging
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# SAML assertions are usually only accepted by STS for 5 minutes after they are issued
+SAML_ASSERTION_MAX_AGE = 240
+
+WarmupResult = namedtuple("WarmupResult", ["rolearn_alias_list", "saml_assertion", "fetched_at"])
+
+
+def start_warmup(saml2aws_helper, refresh_roles, saml_role_arn=None):
+    """Start warming up saml2aws in a background thread and return a Future of WarmupResult.
+
+    The credentials must already have been collected, because the password prompt and the role
+    selection prompt cannot share the terminal. If saml_role_arn is set, the SAML assertion is
+    fetched too, with a saml2aws login to that role (see run_saml2aws_get_saml_assertion).
+    """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="saml2aws-warmup")
+    future = executor.submit(_warmup, saml2aws_helper, refresh_roles, saml_role_arn)
+    executor.shutdown(wait=False)
+    return future
+
+
+def _warmup(saml2aws_helper, refresh_roles, saml_role_arn):
+    saml2aws_helper.prepare()
+    rolearn_alias_list, saml_assertion = None, None
+    if refresh_roles:
+        rolearn_alias_list = saml2aws_helper.run_saml2aws_list_roles()
+    if saml_role_arn:
+        saml_assertion = saml2aws_helper.run_saml2aws_get_saml_assertion(saml_role_arn)
+    return WarmupResult(rolearn_alias_list, saml_assertion, time.monotonic())
+
+
+def get_warmup_result(future):
+    """Wait for the background warm-up; return an empty WarmupResult if it failed."""
+    try:
+        result = future.result()
+    except Exception as e:
+        logging.warning(f"Background saml2aws warm-up failed: {e}")
+        return WarmupResult(None, None, None)
+
+    if result.saml_assertion and time.monotonic() - result.fetched_at > SAML_ASSERTION_MAX_AGE:
+        logging.debug("Pre-fetched SAML assertion is too old; a new one will be requested")
+        result = result._replace(saml_assertion=None)
+    return result
+
+
+def reconcile_selection(profile_rolearn_dict, selected_profiles, refreshed_profile_rolearn_dict):
+    """Map the profiles selected from the cached role list onto the refreshed role list.
+
+    Return the refreshed {profile_name: role_arn} and the selected profiles that still exist.
+    """
+    removed = [p for p in selected_profiles if p not in refreshed_profile_rolearn_dict]
+    for profile in removed:
+        logging.warning(f"Skipped {profile}: role no longer available")
+
+    added = [p for p in refreshed_profile_rolearn_dict if p not in profile_rolearn_dict]
+    if added:
+        logging.info(f"Found {len(added)} new role(s); run awslogin again to select them")
+
+    selected = [p for p in selected_profiles if p in refreshed_profile_rolearn_dict]
+    return refreshed_profile_rolearn_dict, selected
@@ -0,0 +1,125 @@
+"""
+Retry saml2aws logins that failed transiently (IdP rate limiting, timeouts) with jittered
+exponential backoff, and adapt the number of concurrent logins to the failures (AIMD: halve the
+limit when logins fail transiently, add one after a limit's worth of successful logins).
+"""
+
+import logging
+import random
+import re
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY = 1.0  # seconds
+DEFAULT_MAX_DELAY = 30.0  # seconds
+
+# sysexits.h EX_TEMPFAIL: "temporary failure, the user is invited to retry"
+TRANSIENT_RETURNCODES = {75}
+# What saml2aws prints when the IdP (Okta, ADFS, ...) throttles or the network fails. Status
+# codes and timeouts are anchored to HTTP and Go net/http messages, so that e.g. an account ID
+# containing 502 does not match.
+TRANSIENT_OUTPUT = re.compile(
+    r"too many requests|rate.?limit|throttl|E0000047"
+    r"|(?:HTTP/\S+|status(?: code)?:?) (?:429|50[234])\b"
+    r"|\b(?:429|50[234]) (?:Too Many Requests|Bad Gateway|Service Unavailable|Gateway Time-?out)"
+    r"|(?:i/o|TLS handshake|Client\.) ?timeout|connection timed out|context deadline exceeded"
+    r"|connection (?:reset|refused)|unexpected EOF|temporary failure",
+    re.IGNORECASE,
+)
+# Failures waiting for the user (MFA push or code, device verification) are not retried, even
+# when they are reported as a timeout: the user would be prompted again
+INTERACTIVE_OUTPUT = re.compile(r"\bMFA\b|\bpush\b|verif|\bdevice\b|waiting for", re.IGNORECASE)
+
+
+def is_transient_failure(returncode, output):
+    """Return True if a saml2aws call exiting with returncode and printing output (str) failed
+    in a way worth retrying. Calls killed by a signal (negative returncode) are not retried."""
+    if returncode == 0 or returncode is None or returncode < 0:
+        return False
+    if returncode in TRANSIENT_RETURNCODES:
+        return True
+    return any(
+        TRANSIENT_OUTPUT.search(line) and not INTERACTIVE_OUTPUT.search(line)
+        for line in output.splitlines()
+    )
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts=DEFAULT_MAX_ATTEMPTS,
+        base_delay=DEFAULT_BASE_DELAY,
+        max_delay=DEFAULT_MAX_DELAY,
+        rng=None,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._rng = rng or random.Random()
+
+    def should_retry(self, attempt, returncode, output):
+        """Return True if the attempt-th (1-based) call failed transiently and may be retried."""
+        return attempt < self.max_attempts and is_transient_failure(returncode, output)
+
+    def backoff(self, attempt):
+        """Return the delay before the attempt+1-th call: "full jitter", uniformly distributed
+        up to the exponentially growing base_delay * 2^(attempt-1), capped at max_delay."""
+        return self._rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class AdaptiveConcurrency:
+    """Limit the number of concurrent logins, between `minimum` and the initial `limit`.
+
+    A login failing transiently halves the limit; the logins already in flight at that point
+    do not halve it again, so a burst of throttled logins counts as one signal. Every `limit`
+    successful logins in a row raise it by one, back up to the initial limit.
+    """
+
+    def __init__(self, limit, minimum=1):
+        self.maximum = limit
+        self.minimum = min(minimum, limit)
+        self.limit = limit
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._issued = 0
+        self._decreased_after = 0
+        self._successes = 0
+
+    @contextmanager
+    def slot(self):
+        """Wait until fewer than `limit` logins are in flight; yield a slot whose
+        transient_failure the caller sets to report how the login went."""
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+            self._issued += 1
+            slot = SimpleNamespace(ticket=self._issued, transient_failure=False)
+        try:
+            yield slot
+        finally:
+            self._release(slot)
+
+    def _release(self, slot):
+        with self._cond:
+            self._in_flight -= 1
+            if slot.transient_failure:
+                self._successes = 0
+                if slot.ticket > self._decreased_after:
+                    self._set_limit(max(self.minimum, self.limit // 2), "transient failure")
+                    self._decreased_after = self._issued
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.maximum:
+                    self._successes = 0
+                    self._set_limit(self.limit + 1, "successful logins")
+            self._cond.notify_all()
+
+    def _set_limit(self, limit, reason):
+        logging.debug(
+            f"Concurrency limit {self.limit} -> {limit} after {reason} "
+            f"(in flight: {self._in_flight})"
+        )
+        self.limit = limit
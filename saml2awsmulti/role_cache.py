@@ -0,0 +1,86 @@
+"""
+Metadata, expiry and diffs for the cached role list (aws_login_roles.csv).
+"""
+
+import json
+import logging
+from collections import namedtuple
+from datetime import datetime, timezone
+from os import makedirs
+from os.path import dirname, exists
+
+RolesDiff = namedtuple("RolesDiff", ["added", "removed", "alias_changed"])
+
+
+def read_roles_cache_metadata(filename):
+    """Return the cache metadata dict, or {} if there is none (e.g. caches from older versions)."""
+    if not exists(filename):
+        return {}
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except ValueError as e:
+        logging.warning(f"Ignored invalid roles cache metadata {filename}: {e}")
+        return {}
+
+
+def write_roles_cache_metadata(filename, idp_account, username, fetched_at=None):
+    makedirs(dirname(filename), exist_ok=True)
+    metadata = {
+        "fetched_at": (fetched_at or datetime.now(timezone.utc)).isoformat(),
+        "idp_account": idp_account,
+        "username": username,
+    }
+    with open(filename, "w") as f:
+        json.dump(metadata, f, indent=2)
+
+
+def is_roles_cache_stale(metadata, ttl_seconds, idp_account, username, now=None):
+    """Return True if the cache is older than ttl_seconds, or was fetched for another identity.
+
+    A ttl_seconds of 0 disables expiry.
+    """
+    if not ttl_seconds:
+        return False
+    if metadata.get("idp_account") != idp_account:
+        return True
+    if username and metadata.get("username") != username:
+        return True
+    try:
+        fetched_at = datetime.fromisoformat(metadata["fetched_at"])
+    except (KeyError, TypeError, ValueError):
+        return True
+    age = (now or datetime.now(timezone.utc)) - fetched_at
+    return age.total_seconds() > ttl_seconds
+
+
+def diff_roles(old_rolearn_alias_list, new_rolearn_alias_list):
+    """Compare two lists of (role_arn, alias).
+
+    Return a RolesDiff of added role ARNs, removed role ARNs, and (role_arn, old_alias,
+    new_alias) for roles whose account alias changed.
+    """
+    old = {role_arn: alias for role_arn, alias in old_rolearn_alias_list}
+    new = {role_arn: alias for role_arn, alias in new_rolearn_alias_list}
+    return RolesDiff(
+        added=[role_arn for role_arn in new if role_arn not in old],
+        removed=[role_arn for role_arn in old if role_arn not in new],
+        alias_changed=[
+            (role_arn, old[role_arn], alias)
+            for role_arn, alias in new.items()
+            if role_arn in old and old[role_arn] != alias
+        ],
+    )
+
+
+def log_roles_diff(diff):
+    logging.info(
+        f"Cached roles refreshed: {len(diff.added)} added, {len(diff.removed)} removed, "
+        f"{len(diff.alias_changed)} account alias change(s)"
+    )
+    for role_arn in diff.added:
+        logging.debug(f"  + {role_arn}")
+    for role_arn in diff.removed:
+        logging.debug(f"  - {role_arn}")
+    for role_arn, old_alias, new_alias in diff.alias_changed:
+        logging.debug(f"  ~ {role_arn}: {old_alias} -> {new_alias}")
@@ -0,0 +1,162 @@
+"""
+An optional SQLite store of the cached roles, indexed for large organisations.
+
+The CSV file stays the source of truth written by saml2aws list-roles refreshes; the store is
+rebuilt from it whenever the CSV file changes.
+"""
+
+import logging
+import sqlite3
+from collections import OrderedDict
+from os import makedirs, stat
+from os.path import dirname
+
+from saml2awsmulti.file_io import read_csv
+
+PROFILE_NAME_COLUMNS = {
+    "RoleName": "profile_name",
+    "RoleName-AccountAlias": "profile_name_alias",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS roles (
+    position INTEGER PRIMARY KEY,
+    role_arn TEXT NOT NULL UNIQUE,
+    account_id TEXT NOT NULL,
+    account_alias TEXT NOT NULL,
+    role_name TEXT NOT NULL,
+    profile_name TEXT NOT NULL,
+    profile_name_alias TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_roles_account_id ON roles (account_id);
+CREATE INDEX IF NOT EXISTS idx_roles_account_alias ON roles (account_alias);
+CREATE INDEX IF NOT EXISTS idx_roles_role_name ON roles (role_name);
+CREATE INDEX IF NOT EXISTS idx_roles_profile_name ON roles (profile_name);
+CREATE INDEX IF NOT EXISTS idx_roles_profile_name_alias ON roles (profile_name_alias);
+CREATE TABLE IF NOT EXISTS store_metadata (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# A trigram full-text index turns substring keyword matches into index lookups.
+# It needs SQLite 3.34+; older versions fall back to scanning the roles table.
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS roles_fts USING fts5(
+    role_arn, profile_name, profile_name_alias, tokenize="trigram case_sensitive 1"
+);
+"""
+FTS_MIN_KEYWORD_LENGTH = 3
+
+
+class SqliteRoleStore:
+    def __init__(self, filename):
+        makedirs(dirname(filename) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(filename)
+        self._conn.executescript(SCHEMA)
+        try:
+            self._conn.executescript(FTS_SCHEMA)
+            self._fts = True
+        except sqlite3.OperationalError as e:
+            logging.debug(f"SQLite trigram index unavailable, keyword filters will scan: {e}")
+            self._fts = False
+
+    def close(self):
+        self._conn.close()
+
+    def replace_roles(self, rolearn_alias_list):
+        """Replace all roles with the given list of (role_arn, account_alias)."""
+        rows = [_to_row(role_arn, account_alias) for role_arn, account_alias in rolearn_alias_list]
+        with self._conn:
+            self._conn.execute("DELETE FROM roles")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO roles (role_arn, account_id, account_alias, role_name, "
+                "profile_name, profile_name_alias) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            if self._fts:
+                self._conn.execute("DELETE FROM roles_fts")
+                self._conn.execute(
+                    "INSERT INTO roles_fts (rowid, role_arn, profile_name, profile_name_alias) "
+                    "SELECT position, role_arn, profile_name, profile_name_alias FROM roles"
+                )
+
+    def needs_migration(self, csv_filename):
+        """Return True if the store was not yet built from the current version of csv_filename."""
+        return self._get_metadata("csv_version") != _file_version(csv_filename)
+
+    def migrate_from_csv(self, csv_filename):
+        """Rebuild the store from a roles CSV file (role_arn, account_alias)."""
+        self.replace_roles(read_csv(csv_filename))
+        self._set_metadata("csv_version", _file_version(csv_filename))
+        logging.debug(f"Migrated {self.count()} role(s) from {csv_filename}")
+
+    def count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM roles").fetchone()[0]
+
+    def iter_roles(self):
+        """Yield (role_arn, account_alias) in the order saml2aws listed them."""
+        yield from self._conn.execute("SELECT role_arn, account_alias FROM roles ORDER BY position")
+
+    def query_profiles(self, profile_name_format, keywords):
+        """Return an OrderedDict of {profile_name: role_arn} with profile names containing any
+        of the keywords, or all roles if there are no keywords."""
+        column = PROFILE_NAME_COLUMNS[profile_name_format]
+        where, params = self._keywords_filter(column, keywords)
+        rows = self._conn.execute(
+            f"SELECT {column}, role_arn FROM roles {where} ORDER BY position", params
+        )
+        return OrderedDict(rows)
+
+    def query_profiles_by_role_arn(self, profile_name_format, keywords):
+        """Return the profile names of the roles with ARNs containing any of the keywords."""
+        if not keywords:
+            return []
+        column = PROFILE_NAME_COLUMNS[profile_name_format]
+        where, params = self._keywords_filter("role_arn", keywords)
+        rows = self._conn.execute(f"SELECT {column} FROM roles {where} ORDER BY position", params)
+        return [row[0] for row in rows]
+
+    def _keywords_filter(self, column, keywords):
+        if not keywords:
+            return "", []
+        clauses, params = [], []
+        for keyword in keywords:
+            if self._fts and len(keyword) >= FTS_MIN_KEYWORD_LENGTH:
+                clauses.append(f"position IN (SELECT rowid FROM roles_fts WHERE {column} GLOB ?)")
+                params.append(f"*{_escape_glob(keyword)}*")
+            else:
+                clauses.append(f"instr({column}, ?) > 0")
+                params.append(keyword)
+        return "WHERE " + " OR ".join(clauses), params
+
+    def _get_metadata(self, key):
+        row = self._conn.execute(
+            "SELECT value FROM store_metadata WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set_metadata(self, key, value):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO store_metadata (key, value) VALUES (?, ?)", (key, value)
+            )
+
+
+def _to_row(role_arn, account_alias):
+    # Same derivation as aws_login.create_profile_name_from_role_arn
+    profile_name = role_arn.split("role/")[-1].replace("/", "-")
+    return (
+        role_arn,
+        role_arn.split(":")[4],
+        account_alias,
+        role_arn.split("/")[-1],
+        profile_name,
+        f"{profile_name}-{account_alias}",
+    )
+
+
+def _file_version(filename):
+    st = stat(filename)
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def _escape_glob(keyword):
+    return "".join(f"[{c}]" if c in "[*?" else c for c in keyword)
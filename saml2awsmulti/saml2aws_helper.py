@@ -1,147 +1,456 @@
 import getpass
 import logging
+import os
+import re
+import signal
 import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from os.path import exists, getmtime, join
 
+from saml2awsmulti.capabilities import (
+    SAML2AWS_PROBE_CMDS,
+    get_binary_fingerprint,
+    load_capabilities,
+    parse_capabilities,
+    save_capabilities,
+)
 from saml2awsmulti.file_io import load_saml2aws_config
+from saml2awsmulti.retry import RetryPolicy, is_transient_failure
+from saml2awsmulti.sts_login import get_assertion_expiry
+from saml2awsmulti.timings import span
+
+# saml2aws list-roles prints "Account: ALIAS (ACCOUNT_NUMBER)" or "Account: ACCOUNT_NUMBER"
+# followed by the role ARNs of the account; the lines are matched as bytes, before decoding
+ACCOUNT_LINE = re.compile(
+    rb"Account: (?:(?P<alias>\S+) \((?P<account_id>\d+)\)|(?P<bare_account_id>\d+))\s*$"
+)
+ROLE_ARN_PREFIX = re.compile(rb"arn:[^:\s]*:[^:\s]*::(?P<account_id>[^:\s]*):")
+
+# Assumed lifetime of a cached SAML assertion without NotOnOrAfter; IdPs commonly use 5 minutes
+DEFAULT_SAML_CACHE_TTL = 300
+# Authenticate again rather than start a login with an assertion about to expire
+SAML_CACHE_MARGIN = 30
 
 
 class Saml2AwsHelper:
-    def __init__(self, configfile, session_duration, browser_autofill):
+    def __init__(
+        self,
+        configfile,
+        session_duration,
+        browser_autofill,
+        capabilities_file=None,
+        retry_policy=None,
+        call_timeout=None,
+    ):
         self._configfile = configfile
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.call_timeout = call_timeout
+        self._deadline = None
         self._session_duration = session_duration
         self._browser_autofill = browser_autofill
+        self._capabilities_file = capabilities_file
         self._uname = None
         self._upass = None
-        self._stdin_password_supported = None
+        self._capabilities = None
+        self._saml_cache_file = None
+        self._saml_cache_lock = threading.Lock()
+        # profile: the last line saml2aws printed when its latest login to the profile failed
+        self.login_errors = {}
 
     def get_credentials(self):
         if self._uname is None or self._upass is None:
             configs = load_saml2aws_config(filename=self._configfile)
 
-            self._uname = configs.get("username")
-            if self._uname is None:
-                self._uname = input("Username: ")
-            else:
-                logging.info(f"Username: {self._uname}")
+            with span("password"):
+                # The environment variables saml2aws reads, so scripts can log in unattended
+                self._uname = os.environ.get("SAML2AWS_USERNAME") or configs.get("username")
+                if self._uname is None:
+                    self._uname = input("Username: ")
+                else:
+                    logging.info(f"Username: {self._uname}")
 
-            self._upass = getpass.getpass("Password: ")
+                self._upass = os.environ.get("SAML2AWS_PASSWORD") or getpass.getpass("Password: ")
 
         return self._uname, self._upass
 
+    def prepare(self):
+        """Collect credentials and probe saml2aws up front, e.g. before starting worker threads."""
+        self.get_credentials()
+        self.get_capabilities()
+
+    def get_capabilities(self):
+        """Return the Saml2AwsCapabilities of the installed saml2aws binary.
+
+        The probe (saml2aws --version, login --help) only runs when the binary is not in the
+        capabilities file yet, or its path, size or mtime changed.
+        """
+        if self._capabilities is None:
+            with span("capability_probe"):
+                fingerprint, capabilities = self._load_capabilities()
+                if capabilities is None:
+                    outputs = []
+                    for cmd in SAML2AWS_PROBE_CMDS:
+                        result = subprocess.run(cmd, capture_output=True, text=True)
+                        outputs.append(result.stdout + result.stderr)
+                    capabilities = self._save_capabilities(fingerprint, outputs)
+            self._capabilities = capabilities
+        return self._capabilities
+
+    def _load_capabilities(self):
+        fingerprint = get_binary_fingerprint()
+        return fingerprint, load_capabilities(self._capabilities_file, fingerprint)
+
+    def _save_capabilities(self, fingerprint, outputs):
+        capabilities = parse_capabilities(*outputs)
+        logging.debug(f"Probed saml2aws {capabilities.version}")
+        save_capabilities(self._capabilities_file, fingerprint, capabilities)
+        return capabilities
+
     def _supports_stdin_password(self):
         """Detect whether the installed saml2aws binary supports --stdin-password."""
-        if self._stdin_password_supported is None:
-            result = subprocess.run(
-                ["saml2aws", "login", "--help"],
-                capture_output=True,
-                text=True,
-            )
-            self._stdin_password_supported = "--stdin-password" in (result.stdout + result.stderr)
-        return self._stdin_password_supported
+        return self.get_capabilities().stdin_password
 
-    def run_saml2aws_list_roles(self):
-        """Return List of (role_arn, account_name)"""
-        roles = []
-        accounts_dict = {}
+    def _with_password(self, cmd):
+        """Return (cmd, stdin_input) with the username and password arguments added."""
         uname, upass = self.get_credentials()
-
         if self._supports_stdin_password():
             # Avoid exposing the password in the process list by using --stdin-password.
-            cmd = [
-                "saml2aws",
-                "list-roles",
-                f"--username={uname}",
-                "--skip-prompt",
-                "--stdin-password",
-            ]
-            p = subprocess.Popen(
-                cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
-            )
-            stdout, _ = p.communicate(input=(upass + "\n").encode())
-        else:
-            # Fallback for saml2aws versions that predate --stdin-password support.
-            cmd = [
-                "saml2aws",
-                "list-roles",
-                f"--username={uname}",
-                f"--password={upass}",
-                "--skip-prompt",
-            ]
-            p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            stdout, _ = p.communicate()
-
-        for line in stdout.decode("utf-8").splitlines():
-            logging.debug(line)
-            if line.startswith("Account:"):
-                try:
-                    if "(" in line:
-                        # Account: ALIAS (ACCOUNT_NUMBER)
-                        acc_name, acc_id = line.replace("(", "").replace(")", "").split(" ")[1:]
-                    else:
-                        # Account: ACCOUNT_NUMBER
-                        acc_name, acc_id = "None", line.split(" ")[1]
-
-                    accounts_dict[acc_id] = acc_name
-                except Exception as e:
-                    logging.error(e)
-                    logging.error(line)
-            elif line.startswith("arn:"):
-                acc_id = line.split(":")[4]
-                roles.append((line, accounts_dict.get(acc_id, acc_id)))
-
-        retval = p.returncode
-        logging.debug(f"Response Code: {retval}")
+            cmd = cmd + [f"--username={uname}", "--skip-prompt", "--stdin-password"]
+            return cmd, (upass + "\n").encode()
+        # Fallback for saml2aws versions that predate --stdin-password support.
+        return cmd + [f"--username={uname}", f"--password={upass}", "--skip-prompt"], None
+
+    def _build_list_roles_cmd(self):
+        return self._with_password(["saml2aws", "list-roles"])
+
+    def _build_login_cmd(self, role_arn, profile_name, saml_cache_file=None):
+        cmd, stdin_input = self._with_password(
+            ["saml2aws", "login", f"--role={role_arn}", "-p", profile_name]
+        )
+        if saml_cache_file:
+            cmd += ["--cache-saml", f"--cache-file={saml_cache_file}"]
+        if self._session_duration:
+            capabilities = self.get_capabilities()
+            if capabilities.session_duration:
+                cmd.append(f"--session-duration={self._session_duration}")
+            else:
+                logging.warning(
+                    f"saml2aws {capabilities.version} does not support --session-duration; "
+                    "using the default session duration"
+                )
+        if self._browser_autofill:
+            cmd.append("--browser-autofill")
+        return cmd, stdin_input
+
+    @staticmethod
+    def _credentials_file_env(credentials_file):
+        """Return the environment that makes saml2aws write to `credentials_file`, if set."""
+        if credentials_file:
+            return dict(os.environ, AWS_SHARED_CREDENTIALS_FILE=credentials_file)
+        return None
+
+    @contextmanager
+    def batch_deadline(self, timeout):
+        """Within this context, saml2aws calls still running `timeout` seconds after entering it
+        are killed, and calls starting after that time out at once. None means no deadline."""
+        self._deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            yield
+        finally:
+            self._deadline = None
+
+    def _timeout(self, command):
+        """Return the timeout in seconds of the next saml2aws `command`: call_timeout, capped by
+        what is left until the batch deadline; None if neither is set.
+
+        Raise TimeoutError if the batch deadline has passed, so saml2aws is not started at all.
+        """
+        timeouts = [self.call_timeout] if self.call_timeout is not None else []
+        if self._deadline is not None:
+            remaining = self._deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"saml2aws {command} not started: the batch timed out")
+            timeouts.append(remaining)
+        return min(timeouts) if timeouts else None
+
+    @staticmethod
+    def _communicate(cmd, stdin_input, env=None, timeout=None):
+        """Run cmd to completion and return (returncode, stdout bytes).
+
+        Raise TimeoutError if cmd did not complete within `timeout` seconds; cmd then runs in its
+        own process group, which is killed, so nothing it started (e.g. a browser driven by
+        --browser-autofill) is left behind.
+        """
+        p = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if stdin_input is not None else None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=env,
+            start_new_session=timeout is not None,
+        )
+        try:
+            stdout, _ = p.communicate(input=stdin_input, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill_process_group(p)
+            p.communicate()
+            raise TimeoutError(f"saml2aws {cmd[1]} timed out after {timeout:.0f}s") from None
+        except BaseException:
+            _kill_process_group(p)
+            raise
+        return p.returncode, stdout
+
+    @staticmethod
+    def _parse_list_roles_output(stdout):
+        """Return List of (role_arn, account_name) parsed from saml2aws list-roles output."""
+        roles = list(parse_list_roles_lines(stdout.splitlines()))
         if not roles:
             raise ValueError("Failed to retrieve roles with saml2aws.")
         return roles
 
-    def run_saml2aws_login(self, role_arn, profile_name):
-        logging.info(f"Adding {profile_name}...")
+    def _check_login_cache_saml(self):
+        capabilities = self.get_capabilities()
+        if not capabilities.login_cache_saml:
+            raise ValueError(
+                f"saml2aws {capabilities.version} does not support login --cache-saml, which "
+                "is needed to get the SAML assertion; please upgrade saml2aws."
+            )
 
-        uname, upass = self.get_credentials()
+    @staticmethod
+    def _read_saml_cache_file(saml_cache_file):
+        if not exists(saml_cache_file):
+            raise ValueError(
+                "Failed to retrieve the SAML assertion: saml2aws login --cache-saml did not "
+                f"write it to {saml_cache_file}."
+            )
+        with open(saml_cache_file) as f:
+            return f.read().strip()
 
-        if self._supports_stdin_password():
-            # Avoid exposing the password in the process list by using --stdin-password.
-            cmd = [
-                "saml2aws",
-                "login",
-                f"--role={role_arn}",
-                "-p",
-                profile_name,
-                f"--username={uname}",
-                "--skip-prompt",
-                "--stdin-password",
-            ]
-            if self._session_duration:
-                cmd.append(f"--session-duration={self._session_duration}")
-            if self._browser_autofill:
-                cmd.append("--browser-autofill")
-            p = subprocess.Popen(
-                cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+    def iter_saml2aws_list_roles(self):
+        """Yield (role_arn, account_name) as saml2aws list-roles prints them.
+
+        Raise ValueError at the end if saml2aws printed no role.
+        """
+        cmd, stdin_input = self._build_list_roles_cmd()
+        timeout = self._timeout("list-roles")
+        with (
+            span("list_roles"),
+            subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE if stdin_input is not None else None,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                start_new_session=timeout is not None,
+            ) as p,
+        ):
+            # The output is read as it comes, so a timer kills saml2aws when it times out
+            watchdog = None
+            timed_out = threading.Event()
+            if timeout is not None:
+
+                def kill():
+                    timed_out.set()
+                    _kill_process_group(p)
+
+                watchdog = threading.Timer(timeout, kill)
+                watchdog.daemon = True
+                watchdog.start()
+            try:
+                if stdin_input is not None:
+                    p.stdin.write(stdin_input)
+                    p.stdin.close()
+                found = False
+                for role in parse_list_roles_lines(p.stdout):
+                    found = True
+                    yield role
+            except BaseException:
+                # Failed, or the caller stopped early: do not leave saml2aws running
+                _kill_process_group(p)
+                raise
+            finally:
+                if watchdog is not None:
+                    watchdog.cancel()
+        if timed_out.is_set() and p.returncode != 0:
+            raise TimeoutError(f"saml2aws list-roles timed out after {timeout:.0f}s")
+        logging.debug(f"Response Code: {p.returncode}")
+        if not found:
+            raise ValueError("Failed to retrieve roles with saml2aws.")
+
+    def run_saml2aws_list_roles(self):
+        """Return List of (role_arn, account_name)."""
+        return list(self.iter_saml2aws_list_roles())
+
+    def run_saml2aws_get_saml_assertion(self, role_arn):
+        """Authenticate against the IdP once and return the base64 encoded SAML assertion.
+
+        saml2aws only caches the assertion (--cache-saml) when logging in, so this logs in to
+        role_arn, any role of the user, and throws the credentials away.
+        """
+        self._check_login_cache_saml()
+        with tempfile.TemporaryDirectory(prefix="saml2aws-multi-") as tmp_dir:
+            saml_cache_file = join(tmp_dir, "saml_cache")
+            with span("saml_assertion"):
+                retval, _ = self._login(
+                    role_arn, "saml2aws-multi", join(tmp_dir, "credentials"), saml_cache_file
+                )
+            if retval != 0:
+                raise ValueError(
+                    f"Failed to retrieve the SAML assertion: saml2aws login exited with {retval}."
+                )
+            return self._read_saml_cache_file(saml_cache_file)
+
+    @contextmanager
+    def saml_cache(self):
+        """Within this context, logins share a cached SAML assertion: the first login
+        authenticates against the IdP and caches the assertion, the following ones reuse it
+        until it expires. Does nothing if saml2aws login does not support --cache-saml."""
+        capabilities = self.get_capabilities()
+        if not capabilities.login_cache_saml:
+            logging.warning(
+                f"saml2aws {capabilities.version} does not support login --cache-saml; "
+                "authenticating every login"
             )
-            stdout, _ = p.communicate(input=(upass + "\n").encode())
-        else:
-            # Fallback for saml2aws versions that predate --stdin-password support.
-            cmd = [
-                "saml2aws",
-                "login",
-                f"--role={role_arn}",
-                "-p",
-                profile_name,
-                f"--username={uname}",
-                f"--password={upass}",
-                "--skip-prompt",
-            ]
-            if self._session_duration:
-                cmd.append(f"--session-duration={self._session_duration}")
-            if self._browser_autofill:
-                cmd.append("--browser-autofill")
-            p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            stdout, _ = p.communicate()
+            yield
+            return
+        with tempfile.TemporaryDirectory(prefix="saml2aws-multi-") as tmp_dir:
+            self._saml_cache_file = join(tmp_dir, "saml_cache")
+            try:
+                yield
+            finally:
+                self._saml_cache_file = None
+
+    def _is_saml_cache_valid(self):
+        saml_cache_file = self._saml_cache_file
+        if not exists(saml_cache_file):
+            return False
+        with open(saml_cache_file) as f:
+            expires = get_assertion_expiry(f.read().strip())
+        if expires is None:
+            expires = getmtime(saml_cache_file) + DEFAULT_SAML_CACHE_TTL
+        return expires - time.time() > SAML_CACHE_MARGIN
 
-        for line in stdout.decode("utf-8").splitlines():
+    def _login(self, role_arn, profile_name, credentials_file, saml_cache_file=None):
+        """Run saml2aws login once; return (returncode, output)."""
+        cmd, stdin_input = self._build_login_cmd(role_arn, profile_name, saml_cache_file)
+        retval, stdout = self._communicate(
+            cmd, stdin_input, self._credentials_file_env(credentials_file), self._timeout("login")
+        )
+
+        output = stdout.decode("utf-8", errors="replace")
+        for line in output.splitlines():
             logging.debug(line)
-        retval = p.returncode
+        return retval, output
+
+    def _login_with_saml_cache(self, role_arn, profile_name, credentials_file):
+        saml_cache_file = self._saml_cache_file
+        with self._saml_cache_lock:
+            if not self._is_saml_cache_valid():
+                # First login, or the assertion expired: authenticate and cache the assertion.
+                # Concurrent logins wait here, then reuse it.
+                logging.debug(f"Caching the SAML assertion with the login of {profile_name}")
+                if exists(saml_cache_file):
+                    os.remove(saml_cache_file)
+                return self._login(role_arn, profile_name, credentials_file, saml_cache_file)
+
+        retval, output = self._login(role_arn, profile_name, credentials_file, saml_cache_file)
+        if retval != 0 and not is_transient_failure(retval, output):
+            logging.info(
+                f"Login of {profile_name} with the cached SAML assertion failed; "
+                "authenticating again"
+            )
+            retval, output = self._login(role_arn, profile_name, credentials_file)
+        return retval, output
 
+    def _attempt_login(self, role_arn, profile_name, credentials_file, concurrency):
+        if concurrency is None:
+            if self._saml_cache_file is None:
+                return self._login(role_arn, profile_name, credentials_file)
+            return self._login_with_saml_cache(role_arn, profile_name, credentials_file)
+
+        with concurrency.slot() as slot:
+            retval, output = self._attempt_login(role_arn, profile_name, credentials_file, None)
+            slot.transient_failure = is_transient_failure(retval, output)
+        return retval, output
+
+    def run_saml2aws_login(self, role_arn, profile_name, credentials_file=None, concurrency=None):
+        """Login to the given role; if `credentials_file` is set, saml2aws writes there instead
+        of ~/.aws/credentials. Within saml_cache(), the SAML assertion is reused.
+
+        Transient failures (IdP throttling, timeouts) are retried according to retry_policy. If
+        `concurrency` (an AdaptiveConcurrency) is set, each attempt waits for one of its slots.
+        Why the last attempt failed is kept in login_errors.
+        """
+        logging.info(f"Adding {profile_name}...")
+
+        with span("login", profile=profile_name):
+            attempt = 1
+            retval, output = self._attempt_login(
+                role_arn, profile_name, credentials_file, concurrency
+            )
+            while self.retry_policy.should_retry(attempt, retval, output):
+                delay = self.retry_policy.backoff(attempt)
+                attempt += 1
+                logging.warning(
+                    f"Login of {profile_name} failed transiently (return code {retval}); "
+                    f"retrying in {delay:.1f}s (attempt {attempt}/{self.retry_policy.max_attempts})"
+                )
+                time.sleep(delay)
+                retval, output = self._attempt_login(
+                    role_arn, profile_name, credentials_file, concurrency
+                )
+
+        if retval == 0:
+            self.login_errors.pop(profile_name, None)
+        else:
+            lines = [line.strip() for line in output.splitlines() if line.strip()]
+            self.login_errors[profile_name] = lines[-1] if lines else None
         logging.info(f"Response Code: {retval}")
         return retval
+
+
+def _kill_process_group(p):
+    """Kill p and, if it leads its own process group, the processes it started."""
+    if p.poll() is not None:
+        return
+    try:
+        if hasattr(os, "killpg") and os.getpgid(p.pid) == p.pid:
+            os.killpg(p.pid, signal.SIGKILL)
+        else:
+            p.kill()
+    except ProcessLookupError:
+        pass
+
+
+def parse_list_roles_lines(lines):
+    """Yield (role_arn, account_name) from the (bytes) lines of saml2aws list-roles output.
+
+    An ARN before its Account line, or under an Account line that cannot be parsed, gets its
+    account number as account name.
+    """
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+    accounts = {}
+    for line in lines:
+        if debug:
+            logging.debug(line.decode("utf-8").rstrip())
+        if line.startswith(b"arn:"):
+            match = ROLE_ARN_PREFIX.match(line)
+            if match is None:
+                logging.error(f"Could not parse the saml2aws role line: {line.decode('utf-8')}")
+                continue
+            account_id = match.group("account_id")
+            yield line.rstrip().decode("utf-8"), (
+                accounts.get(account_id) or account_id.decode("utf-8")
+            )
+        elif line.startswith(b"Account:"):
+            match = ACCOUNT_LINE.match(line)
+            if match is None:
+                logging.error(
+                    f"Could not parse the saml2aws account line: {line.decode('utf-8').rstrip()}"
+                )
+            elif match.group("alias"):
+                accounts[match.group("account_id")] = match.group("alias").decode("utf-8")
+            else:
+                accounts[match.group("bare_account_id")] = "None"
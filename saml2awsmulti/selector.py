@@ -1,5 +1,11 @@
-from InquirerPy import inquirer
-from InquirerPy.base.control import Choice
+# InquirerPy (and prompt_toolkit) take a while to import, so they are only imported when a
+# prompt is shown.
+
+from types import SimpleNamespace
+
+from saml2awsmulti.fuzzy_filter import FuzzyFilter
+
+SELECTORS = ["checkbox", "fuzzy"]
 
 # To use custom styles, see:
 # https://inquirerpy.readthedocs.io/en/latest/pages/style.html?highlight=style#customising-style
@@ -9,6 +15,8 @@ def prompt_profile_selection(options):
     if not options:
         raise ValueError("No profiles retrieved for selection.")
 
+    from InquirerPy import inquirer
+
     return inquirer.select(
         message="Please choose the profile",
         choices=options,
@@ -20,6 +28,10 @@ def prompt_roles_selection(options, last_selected_options):
     if not options:
         raise ValueError("No roles retrieved for selection.")
 
+    from InquirerPy import inquirer
+    from InquirerPy.base.control import Choice
+
+    last_selected_options = set(last_selected_options)
     choices = [Choice(role, enabled=role in last_selected_options) for role in options]
 
     return inquirer.checkbox(
@@ -28,3 +40,162 @@ def prompt_roles_selection(options, last_selected_options):
         cycle=True,
         transformer=lambda result: f"{len(result)} role(s) selected",
     ).execute()
+
+
+def prompt_roles_fuzzy_selection(options, last_selected_options, labels=None):
+    """Like prompt_roles_selection, for thousands of roles: type to filter the roles (fuzzy
+    search over the profile names and their labels, e.g. account aliases), Tab to toggle one,
+    Ctrl+A to toggle all the matches, Enter to accept. Only the visible rows are rendered."""
+    if not options:
+        raise ValueError("No roles retrieved for selection.")
+
+    return fuzzy_roles_application(options, last_selected_options, labels).run()
+
+
+def fuzzy_roles_application(options, last_selected_options, labels=None, **app_kwargs):
+    """Return the prompt_toolkit Application of prompt_roles_fuzzy_selection; it returns the
+    selected roles in the order of options."""
+    from prompt_toolkit.application import Application
+    from prompt_toolkit.buffer import Buffer
+    from prompt_toolkit.key_binding import KeyBindings
+    from prompt_toolkit.layout import HSplit, Layout, VSplit, Window
+    from prompt_toolkit.layout.controls import BufferControl, FormattedTextControl
+    from prompt_toolkit.styles import Style
+
+    options = list(options)
+    labels = labels or {}
+    fuzzy_filter = FuzzyFilter([f"{option} {labels.get(option, '')}" for option in options])
+    selected = set(last_selected_options) & set(options)
+    state = SimpleNamespace(matches=list(range(len(options))), cursor=0, top=0, done=False)
+
+    def on_text_changed(buffer):
+        state.matches = fuzzy_filter.search(buffer.text)
+        state.cursor = state.top = 0
+
+    query = Buffer(multiline=False, on_text_changed=on_text_changed)
+
+    def list_height():
+        return max(1, app.output.get_size().rows - 2)
+
+    def render_question():
+        if state.done:
+            return [("class:answer", f"{len(selected)} role(s) selected")]
+        return [("class:question", "? "), ("bold", "Please choose the role: ")]
+
+    def render_matches():
+        if state.done:
+            return []
+        height = list_height()
+        # Scroll to keep the cursor visible; render only the rows on screen
+        state.top = min(max(state.top, state.cursor - height + 1), state.cursor)
+        fragments = []
+        for position in range(state.top, min(len(state.matches), state.top + height)):
+            option = options[state.matches[position]]
+            current = position == state.cursor
+            fragments.append(("class:pointer", "❯ " if current else "  "))
+            fragments.append(("class:marker", "◉ " if option in selected else "○ "))
+            fragments.append(("class:current" if current else "", option))
+            if labels.get(option):
+                fragments.append(("class:label", f"  {labels[option]}"))
+            fragments.append(("", "\n"))
+        return fragments
+
+    def render_status():
+        if state.done:
+            return []
+        return [
+            (
+                "class:status",
+                f"{len(state.matches)}/{len(options)} role(s), {len(selected)} selected "
+                "(Tab: toggle, Ctrl+A: toggle matches, Enter: done)",
+            )
+        ]
+
+    def move(offset):
+        if state.matches:
+            state.cursor = (state.cursor + offset) % len(state.matches)
+
+    def toggle(option):
+        if option in selected:
+            selected.remove(option)
+        else:
+            selected.add(option)
+
+    bindings = KeyBindings()
+
+    @bindings.add("up")
+    @bindings.add("c-p")
+    def _(event):
+        move(-1)
+
+    @bindings.add("down")
+    @bindings.add("c-n")
+    def _(event):
+        move(1)
+
+    @bindings.add("pageup")
+    def _(event):
+        state.cursor = max(0, state.cursor - list_height())
+
+    @bindings.add("pagedown")
+    def _(event):
+        state.cursor = max(0, min(len(state.matches) - 1, state.cursor + list_height()))
+
+    @bindings.add("tab")
+    def _(event):
+        if state.matches:
+            toggle(options[state.matches[state.cursor]])
+            move(1)
+
+    @bindings.add("s-tab")
+    def _(event):
+        if state.matches:
+            toggle(options[state.matches[state.cursor]])
+            move(-1)
+
+    @bindings.add("c-a")
+    def _(event):
+        matched = {options[i] for i in state.matches}
+        if matched <= selected:
+            selected.difference_update(matched)
+        else:
+            selected.update(matched)
+
+    @bindings.add("enter")
+    def _(event):
+        state.done = True
+        event.app.exit(result=[option for option in options if option in selected])
+
+    @bindings.add("c-c")
+    def _(event):
+        state.done = True
+        event.app.exit(exception=KeyboardInterrupt())
+
+    layout = Layout(
+        HSplit(
+            [
+                VSplit(
+                    [
+                        Window(FormattedTextControl(render_question), dont_extend_width=True),
+                        Window(BufferControl(query), height=1),
+                    ]
+                ),
+                Window(FormattedTextControl(render_matches), dont_extend_height=True),
+                Window(FormattedTextControl(render_status), height=1),
+            ]
+        ),
+        focused_element=query,
+    )
+    style = Style.from_dict(
+        {
+            "question": "#e5c07b",
+            "answer": "#61afef",
+            "pointer": "#61afef",
+            "marker": "#98c379",
+            "current": "bold",
+            "label": "#5c6370",
+            "status": "#5c6370",
+        }
+    )
+    app = Application(layout=layout, key_bindings=bindings, style=style, **app_kwargs)
+    return app  # list_height() reads the terminal size from app
@@ -0,0 +1,120 @@
+"""
+Serve role credentials on a localhost HTTP endpoint compatible with the AWS SDKs' container
+credentials provider (AWS_CONTAINER_CREDENTIALS_FULL_URI), so that short-lived processes get
+their credentials from memory instead of each parsing ~/.aws/credentials.
+
+GET /profiles lists the profiles; GET /profiles/<profile> returns the credentials of a profile.
+Every request must carry the authorization token in its Authorization header, as set by the SDKs
+from AWS_CONTAINER_AUTHORIZATION_TOKEN(_FILE).
+"""
+
+import hmac
+import json
+import logging
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from saml2awsmulti.credential_process import cache_key, fetch_role_credentials
+
+DEFAULT_HOST = "127.0.0.1"
+PROFILES_PATH = "/profiles"
+
+
+class ProfileCredentialsProvider:
+    """Return the credentials of a profile from the cache, or log in with saml2aws on a miss.
+
+    Concurrent requests for the same profile wait for a single saml2aws login.
+    """
+
+    def __init__(self, saml2aws_helper, profile_rolearn_dict, cache, session_duration=None):
+        self._saml2aws_helper = saml2aws_helper
+        self._profile_rolearn_dict = profile_rolearn_dict
+        self._cache = cache
+        self._session_duration = session_duration
+        self._locks = defaultdict(threading.Lock)
+
+    def profiles(self):
+        return list(self._profile_rolearn_dict)
+
+    def get(self, profile):
+        """Return the credential_process JSON of the profile, or None if it is unknown."""
+        role_arn = self._profile_rolearn_dict.get(profile)
+        if role_arn is None:
+            return None
+        key = cache_key(role_arn, self._session_duration)
+        credentials = self._cache.get(key)
+        if credentials is None:
+            with self._locks[key]:
+                credentials = self._cache.get(key)
+                if credentials is None:
+                    credentials = fetch_role_credentials(self._saml2aws_helper, role_arn)
+                    self._cache.put(key, credentials)
+        return credentials
+
+
+class CredentialsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, provider, token, host=DEFAULT_HOST, port=0):
+        super().__init__((host, port), CredentialsRequestHandler)
+        self.provider = provider
+        self.token = token
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{PROFILES_PATH}"
+
+
+class CredentialsRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so clients can reuse their connection
+    # Headers and body are sent separately; without TCP_NODELAY, the body waits for the client's
+    # delayed ACK of the headers (~40ms per request)
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        token = self.headers.get("Authorization", "")
+        if not hmac.compare_digest(token.encode(), self.server.token.encode()):
+            self._send_json(401, {"message": "Invalid authorization token"})
+            return
+
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path == PROFILES_PATH:
+            self._send_json(200, self.server.provider.profiles())
+            return
+        if not path.startswith(f"{PROFILES_PATH}/"):
+            self._send_json(404, {"message": "Not found"})
+            return
+
+        profile = unquote(path.removeprefix(f"{PROFILES_PATH}/"))
+        try:
+            credentials = self.server.provider.get(profile)
+        except Exception as e:
+            logging.error(f"Failed to get credentials for {profile}: {e}")
+            self._send_json(502, {"message": f"Failed to get credentials for {profile}"})
+            return
+        if credentials is None:
+            self._send_json(404, {"message": f"Unknown profile {profile}"})
+            return
+        self._send_json(
+            200,
+            {
+                "AccessKeyId": credentials["AccessKeyId"],
+                "SecretAccessKey": credentials["SecretAccessKey"],
+                "Token": credentials["SessionToken"],
+                "Expiration": credentials["Expiration"],
+            },
+        )
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
@@ -0,0 +1,149 @@
+"""
+Authenticate against the IdP once with saml2aws, then assume every selected role with
+STS AssumeRoleWithSAML using the same SAML assertion.
+"""
+
+import base64
+import logging
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from saml2awsmulti.file_io import update_aws_profiles
+from saml2awsmulti.login_executor import LoginResult
+from saml2awsmulti.timings import span
+
+DEFAULT_STS_REGION = "us-east-1"
+DEFAULT_STS_WORKERS = 10
+SAML_ATTRIBUTE_TAG = "{urn:oasis:names:tc:SAML:2.0:assertion}Attribute"
+SAML_ROLE_ATTRIBUTE = "https://aws.amazon.com/SAML/Attributes/Role"
+
+
+def create_sts_client(region=None):
+    from boto3.session import Session
+
+    return Session().client("sts", region_name=region or DEFAULT_STS_REGION)
+
+
+def get_role_principal_arns(saml_assertion):
+    """Return {role_arn: principal_arn} from the Role attribute of a base64 SAML assertion."""
+    root = ET.fromstring(base64.b64decode(saml_assertion))
+    role_principal_arns = {}
+    for attribute in root.iter(SAML_ATTRIBUTE_TAG):
+        if attribute.get("Name") != SAML_ROLE_ATTRIBUTE:
+            continue
+        for value in attribute:
+            # Each value is "role_arn,principal_arn", but IdPs do not agree on the order
+            arns = [arn.strip() for arn in (value.text or "").split(",")]
+            role_arn = next((arn for arn in arns if ":role/" in arn), None)
+            principal_arn = next((arn for arn in arns if ":saml-provider/" in arn), None)
+            if role_arn and principal_arn:
+                role_principal_arns[role_arn] = principal_arn
+    return role_principal_arns
+
+
+def get_assertion_expiry(saml_assertion):
+    """Return the earliest NotOnOrAfter of a base64 SAML assertion as a POSIX timestamp, or
+    None if it has none (or cannot be parsed)."""
+    try:
+        root = ET.fromstring(base64.b64decode(saml_assertion))
+        return min(
+            (
+                datetime.fromisoformat(element.get("NotOnOrAfter")).timestamp()
+                for element in root.iter()
+                if element.get("NotOnOrAfter")
+            ),
+            default=None,
+        )
+    except (ValueError, ET.ParseError) as e:
+        logging.debug(f"Could not read the expiry of the SAML assertion: {e}")
+        return None
+
+
+def assume_roles_with_saml(
+    sts_client,
+    saml_assertion,
+    profile_rolearn_dict,
+    profiles,
+    session_duration=None,
+    max_workers=DEFAULT_STS_WORKERS,
+):
+    """Call AssumeRoleWithSAML for each profile concurrently.
+
+    Return a list of LoginResult in input order, and {profile_name: credentials_section} for
+    the roles assumed successfully, in the same format saml2aws writes to ~/.aws/credentials.
+    """
+    role_principal_arns = get_role_principal_arns(saml_assertion)
+
+    def assume(profile):
+        role_arn = profile_rolearn_dict[profile]
+        principal_arn = role_principal_arns.get(role_arn)
+        if principal_arn is None:
+            logging.error(f"Failed to login {profile}: role not found in the SAML assertion")
+            return None
+        kwargs = {
+            "RoleArn": role_arn,
+            "PrincipalArn": principal_arn,
+            "SAMLAssertion": saml_assertion,
+        }
+        if session_duration:
+            kwargs["DurationSeconds"] = int(session_duration)
+        try:
+            with span("assume_role_with_saml", profile=profile):
+                resp = sts_client.assume_role_with_saml(**kwargs)
+        except Exception as e:
+            logging.error(f"Failed to login {profile}: {e}")
+            return None
+        return _to_credentials_section(resp)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        sections = list(executor.map(assume, profiles))
+
+    results = [
+        LoginResult(profile, profile_rolearn_dict[profile], 0 if section else 1)
+        for profile, section in zip(profiles, sections)
+    ]
+    credentials = {
+        profile: section for profile, section in zip(profiles, sections) if section is not None
+    }
+    return results, credentials
+
+
+def run_sts_logins(
+    saml2aws_helper,
+    profile_rolearn_dict,
+    profiles,
+    aws_cred_file,
+    session_duration=None,
+    region=None,
+    max_workers=DEFAULT_STS_WORKERS,
+    sts_client=None,
+    saml_assertion=None,
+):
+    """Get one SAML assertion (unless one is given) with a saml2aws login to the first role,
+    assume all the given roles and write them in a single batch."""
+    if saml_assertion is None:
+        saml_assertion = saml2aws_helper.run_saml2aws_get_saml_assertion(
+            profile_rolearn_dict[profiles[0]]
+        )
+    if sts_client is None:
+        sts_client = create_sts_client(region)
+
+    results, credentials = assume_roles_with_saml(
+        sts_client, saml_assertion, profile_rolearn_dict, profiles, session_duration, max_workers
+    )
+    if credentials:
+        update_aws_profiles(aws_cred_file, credentials)
+    return results
+
+
+def _to_credentials_section(resp):
+    creds = resp["Credentials"]
+    return {
+        "aws_access_key_id": creds["AccessKeyId"],
+        "aws_secret_access_key": creds["SecretAccessKey"],
+        "aws_session_token": creds["SessionToken"],
+        "aws_security_token": creds["SessionToken"],
+        "x_principal_arn": resp["AssumedRoleUser"]["Arn"],
+        "x_security_token_expires": creds["Expiration"].isoformat(),
+    }
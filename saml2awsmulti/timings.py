@@ -0,0 +1,94 @@
+"""
+Time the phases of a run (capability probe, password entry, list-roles, role prompt, each
+saml2aws login, credentials file writes) for `awslogin --timings`.
+
+Spans are only recorded after enable_timings(); until then span() returns a shared no-op context
+manager, so instrumented code pays for one function call and one global lookup.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager, nullcontext
+
+# start is relative to enable_timings(); start and duration are in seconds
+Span = namedtuple("Span", ["name", "start", "duration", "thread", "attributes"])
+
+_NULL_SPAN = nullcontext()
+_recorder = None
+
+
+class TimingsRecorder:
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self._origin = clock()
+        self.spans = []
+
+    @contextmanager
+    def span(self, name, **attributes):
+        start = self._clock()
+        try:
+            yield
+        finally:
+            # list.append is atomic, so worker threads can record spans concurrently
+            self.spans.append(
+                Span(
+                    name,
+                    start - self._origin,
+                    self._clock() - start,
+                    threading.current_thread().name,
+                    attributes,
+                )
+            )
+
+
+def enable_timings(clock=time.perf_counter):
+    """Start recording spans; return the TimingsRecorder."""
+    global _recorder
+    _recorder = TimingsRecorder(clock)
+    return _recorder
+
+
+def disable_timings():
+    """Stop recording spans; return the spans recorded so far."""
+    global _recorder
+    spans = _recorder.spans if _recorder is not None else []
+    _recorder = None
+    return spans
+
+
+def span(name, **attributes):
+    """Return a context manager timing the enclosed block as span `name`."""
+    if _recorder is None:
+        return _NULL_SPAN
+    return _recorder.span(name, **attributes)
+
+
+def format_report(spans):
+    """Return a table of the count, total, mean and max duration of the spans of each name, in
+    the order the phases started."""
+    phases = OrderedDict()
+    for s in sorted(spans, key=lambda s: s.start):
+        phases.setdefault(s.name, []).append(s.duration)
+    lines = [f"{'Phase':<24} {'Count':>6} {'Total (ms)':>11} {'Mean (ms)':>10} {'Max (ms)':>10}"]
+    for name, durations in phases.items():
+        lines.append(
+            f"{name:<24} {len(durations):>6} {sum(durations) * 1000:>11.1f} "
+            f"{sum(durations) / len(durations) * 1000:>10.1f} {max(durations) * 1000:>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+def write_json_lines(filename, spans):
+    """Append one JSON object per span to filename."""
+    with open(filename, "a") as f:
+        for s in spans:
+            record = {
+                "name": s.name,
+                "start_ms": round(s.start * 1000, 3),
+                "duration_ms": round(s.duration * 1000, 3),
+                "thread": s.thread,
+            }
+            record.update(s.attributes)
+            f.write(json.dumps(record) + "\n")
@@ -0,0 +1,27 @@
+import json
+import os
+import sys
+
+import pytest
+
+FAKE_SAML2AWS = os.path.join(os.path.dirname(__file__), "fake_saml2aws.py")
+
+
+@pytest.fixture
+def fake_saml2aws(tmp_path, monkeypatch):
+    """Put a fake saml2aws first on PATH; return a function that writes its JSON config."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    executable = bin_dir / "saml2aws"
+    executable.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_SAML2AWS}" "$@"\n')
+    executable.chmod(0o755)
+
+    config_file = tmp_path / "fake_saml2aws.json"
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+    monkeypatch.setenv("FAKE_SAML2AWS_CONFIG", str(config_file))
+
+    def configure(**config):
+        config_file.write_text(json.dumps(config))
+
+    configure()
+    return configure
@@ -0,0 +1,216 @@
+"""
+A fake saml2aws executable for tests and benchmarks, configured via a JSON file named by
+FAKE_SAML2AWS_CONFIG. All keys are optional:
+
+- version, stdin_password, cache_saml: what `--version` and `--help` report; without
+  stdin_password, `--stdin-password` is rejected like older saml2aws versions do
+- roles: [[role_arn, alias], ...] printed by list-roles, or num_accounts x roles_per_account
+  synthetic roles; assertion: the SAML assertion cached by `login --cache-saml`
+- cache_saml_noop: login accepts `--cache-saml` but does not write the cache file
+- idp_delay: time spent authenticating against the IdP, which `login --cache-saml` skips when
+  the cache file exists; login_delay (+ up to login_jitter): time spent in every login (STS)
+- login_returncodes: {profile: returncode}; failure_rate: share of profiles whose login fails
+- throttled_logins: {profile: n} throttles (HTTP 429) the first n logins of profile, and
+  max_concurrent_logins throttles logins beyond that many in flight; both keep their state
+  in state_dir
+- hang_logins: [profile, ...] whose login starts a child process (its pid written to
+  state_dir/child-PROFILE.pid) and hangs, e.g. on an MFA push; hang_list_roles: list-roles
+  prints the first account, then hangs; list_roles_returncode: list-roles prints an error and
+  exits with it at once
+- expires: x_security_token_expires written by login; calls_log: file logging every call
+"""
+
+import base64
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+SAML_ASSERTION_TEMPLATE = (
+    '<samlp:Response xmlns:samlp="urn:oasis:names:tc:SAML:2.0:protocol">'
+    '<saml:Assertion xmlns:saml="urn:oasis:names:tc:SAML:2.0:assertion">'
+    "<saml:AttributeStatement>"
+    '<saml:Attribute Name="https://aws.amazon.com/SAML/Attributes/Role">{values}</saml:Attribute>'
+    "</saml:AttributeStatement>"
+    "</saml:Assertion>"
+    "</samlp:Response>"
+)
+
+HELP_FLAGS = {
+    "login": [
+        "--username=USERNAME",
+        "--password=PASSWORD",
+        "--stdin-password  Read password from stdin",
+        "--role=ROLE",
+        "--[no-]skip-prompt",
+        "--session-duration=SESSION-DURATION",
+        "--browser-autofill",
+        "--cache-saml",
+        "--cache-file=CACHE-FILE",
+    ],
+    "list-roles": ["--cache-saml", "--cache-file=CACHE-FILE"],
+}
+
+
+def make_saml_assertion(role_principal_arns, not_on_or_after=None):
+    """Return a base64 encoded SAML assertion granting the given {role_arn: principal_arn}."""
+    values = "".join(
+        f"<saml:AttributeValue>{role_arn},{principal_arn}</saml:AttributeValue>"
+        for role_arn, principal_arn in role_principal_arns.items()
+    )
+    assertion = SAML_ASSERTION_TEMPLATE.format(values=values)
+    if not_on_or_after:
+        assertion = assertion.replace(
+            "<saml:AttributeStatement>",
+            f'<saml:Conditions NotOnOrAfter="{not_on_or_after}"/><saml:AttributeStatement>',
+        )
+    return base64.b64encode(assertion.encode()).decode()
+
+
+def _get_flag(args, name):
+    for arg in args:
+        if arg.startswith(f"{name}="):
+            return arg.split("=", 1)[1]
+    return None
+
+
+def _roles(config):
+    if "roles" in config:
+        return config["roles"]
+    return [
+        [f"arn:aws:iam::{100000000000 + i}:role/role-{j}", f"account-{i}"]
+        for i in range(config.get("num_accounts", 0))
+        for j in range(config.get("roles_per_account", 1))
+    ]
+
+
+def _login_returncode(config, profile):
+    if profile in config.get("login_returncodes", {}):
+        return config["login_returncodes"][profile]
+    # Deterministic per profile, so benchmark rounds fail the same logins
+    return 1 if random.Random(f"fail:{profile}").random() < config.get("failure_rate", 0) else 0
+
+
+def _count_login(config, profile):
+    """Return how many times profile logged in, this login included."""
+    with open(os.path.join(config["state_dir"], f"logins-{profile}"), "a+") as f:
+        f.write(".")
+        return f.tell()
+
+
+@contextmanager
+def _in_flight(config):
+    """Register a login in flight; yield how many logins are in flight."""
+    in_flight_dir = os.path.join(config["state_dir"], "in-flight")
+    os.makedirs(in_flight_dir, exist_ok=True)
+    marker = os.path.join(in_flight_dir, str(os.getpid()))
+    open(marker, "w").close()
+    try:
+        yield len(os.listdir(in_flight_dir))
+    finally:
+        os.remove(marker)
+
+
+def _is_throttled(config, profile, in_flight):
+    if "max_concurrent_logins" in config and in_flight > config["max_concurrent_logins"]:
+        return True
+    throttled = config.get("throttled_logins", {}).get(profile, 0)
+    return throttled > 0 and _count_login(config, profile) <= throttled
+
+
+def _hang(config, name):
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    if "state_dir" in config:
+        with open(os.path.join(config["state_dir"], f"child-{name}.pid"), "w") as f:
+            f.write(str(child.pid))
+    time.sleep(60)
+
+
+def main(args):
+    with open(os.environ["FAKE_SAML2AWS_CONFIG"]) as f:
+        config = json.load(f)
+
+    command = args[0] if args else ""
+    if "--version" in args:
+        print(config.get("version", "2.36.19"), file=sys.stderr)
+        return 0
+    if "--help" in args:
+        for flag in HELP_FLAGS.get(command, []):
+            if flag.startswith("--stdin-password") and not config.get("stdin_password", True):
+                continue
+            if flag.startswith("--cache-saml") and not config.get("cache_saml", True):
+                continue
+            print(f"  {flag}")
+        return 0
+
+    if "--stdin-password" in args and not config.get("stdin_password", True):
+        print("saml2aws: error: unknown long flag '--stdin-password'", file=sys.stderr)
+        return 1
+    password = sys.stdin.readline().strip() if "--stdin-password" in args else None
+    cache_file = _get_flag(args, "--cache-file") if "--cache-saml" in args else None
+    # saml2aws login skips the IdP authentication when the cached assertion is present
+    cache_hit = command == "login" and bool(cache_file) and os.path.exists(cache_file)
+    if config.get("calls_log"):
+        with open(config["calls_log"], "a") as f:
+            f.write(
+                json.dumps({"args": args, "stdin_password": password, "cache_hit": cache_hit})
+                + "\n"
+            )
+
+    if command == "list-roles":
+        if config.get("list_roles_returncode"):
+            print("Error authenticating to IdP.: Invalid username or password")
+            return config["list_roles_returncode"]
+        time.sleep(config.get("idp_delay", 0))
+        accounts = {}
+        for role_arn, alias in _roles(config):
+            accounts.setdefault((role_arn.split(":")[4], alias), []).append(role_arn)
+        for (acc_id, alias), role_arns in accounts.items():
+            print(f"Account: {alias} ({acc_id})")
+            print("\n".join(role_arns), flush=True)
+            if config.get("hang_list_roles"):
+                _hang(config, "list-roles")
+        return 0
+
+    if command == "login":
+        profile = args[args.index("-p") + 1]
+        if cache_hit and config.get("reject_cached_saml"):
+            print("Error logging in: the cached SAML assertion has expired")
+            return 1
+        if not cache_hit:
+            time.sleep(config.get("idp_delay", 0))
+            if cache_file and not config.get("cache_saml_noop"):
+                with open(cache_file, "w") as f:
+                    f.write(config.get("assertion", "cached-assertion"))
+        if profile in config.get("hang_logins", []):
+            _hang(config, profile)
+        jitter = random.Random(f"jitter:{profile}").uniform(0, config.get("login_jitter", 0))
+        with _in_flight(config) if "state_dir" in config else nullcontext(1) as in_flight:
+            time.sleep(config.get("login_delay", 0) + jitter)
+            if "state_dir" in config and _is_throttled(config, profile, in_flight):
+                print("Error authenticating to IdP.: 429 Too Many Requests")
+                return 1
+        returncode = _login_returncode(config, profile)
+        if returncode == 0:
+            cred_file = os.environ.get(
+                "AWS_SHARED_CREDENTIALS_FILE", os.path.expanduser("~/.aws/credentials")
+            )
+            with open(cred_file, "a") as f:
+                f.write(
+                    f"[{profile}]\n"
+                    f"aws_access_key_id = ASIA{profile.upper()}\n"
+                    f"aws_secret_access_key = secret-{profile}\n"
+                    f"aws_session_token = token-{profile}\n"
+                    f"x_security_token_expires = {config.get('expires', '2099-01-01T00:00:00Z')}\n"
+                )
+        print(f"Logged in {profile}" if returncode == 0 else "Error logging in")
+        return returncode
+
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+from saml2awsmulti.async_saml2aws_helper import AsyncSaml2AwsHelper
+from saml2awsmulti.file_io import get_aws_profiles
+
+
+class TestAsyncSaml2AwsHelper:
+    def _helper(self, session_duration=None):
+        helper = AsyncSaml2AwsHelper("config_file", session_duration, False)
+        helper.helper._uname, helper.helper._upass = "testuser", "testpass"
+        return helper
+
+    def test_prepare_probes_stdin_password(self, fake_saml2aws):
+        fake_saml2aws(stdin_password=True)
+        helper = self._helper()
+
+        asyncio.run(helper.prepare())
+
+        assert helper.helper._capabilities.stdin_password is True
+
+    def test_list_roles(self, fake_saml2aws):
+        fake_saml2aws(
+            roles=[
+                ["arn:aws:iam::123456789012:role/dev", "aws-01"],
+                ["arn:aws:iam::213456789012:role/test", "aws-02"],
+            ]
+        )
+
+        result = asyncio.run(self._helper().run_saml2aws_list_roles())
+
+        assert result == [
+            ("arn:aws:iam::123456789012:role/dev", "aws-01"),
+            ("arn:aws:iam::213456789012:role/test", "aws-02"),
+        ]
+
+    def test_login_stdin_password(self, fake_saml2aws, tmp_path):
+        calls_log = tmp_path / "calls.jsonl"
+        fake_saml2aws(calls_log=str(calls_log))
+
+        retval = asyncio.run(
+            self._helper("3600").run_saml2aws_login(
+                "arn:aws:iam::123456789012:role/dev", "dev", str(tmp_path / "credentials")
+            )
+        )
+
+        assert retval == 0
+        login_call = json.loads(calls_log.read_text().splitlines()[-1])
+        assert login_call["stdin_password"] == "testpass"
+        assert "--session-duration=3600" in login_call["args"]
+        assert not any("testpass" in arg for arg in login_call["args"])
+
+    def test_login_fallback_password_in_args(self, fake_saml2aws, tmp_path):
+        calls_log = tmp_path / "calls.jsonl"
+        fake_saml2aws(stdin_password=False, calls_log=str(calls_log))
+
+        retval = asyncio.run(
+            self._helper().run_saml2aws_login(
+                "arn:aws:iam::123456789012:role/dev", "dev", str(tmp_path / "credentials")
+            )
+        )
+
+        assert retval == 0
+        login_call = json.loads(calls_log.read_text().splitlines()[-1])
+        assert "--password=testpass" in login_call["args"]
+        assert "--stdin-password" not in login_call["args"]
+
+    def test_login_timeout_kills_process(self, fake_saml2aws, tmp_path):
+        fake_saml2aws(login_delay=30)
+
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(
+                self._helper().run_saml2aws_login(
+                    "arn:aws:iam::123456789012:role/dev", "dev", str(tmp_path / "creds"), 0.5
+                )
+            )
+
+    @pytest.mark.skipif(not os.path.isdir("/proc"), reason="needs /proc")
+    def test_login_timeout_kills_the_process_group(self, fake_saml2aws, tmp_path):
+        fake_saml2aws(state_dir=str(tmp_path), hang_logins=["dev"])
+
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(
+                self._helper().run_saml2aws_login(
+                    "arn:aws:iam::123456789012:role/dev", "dev", str(tmp_path / "creds"), 1
+                )
+            )
+
+        child_pid = int((tmp_path / "child-dev.pid").read_text())
+        deadline = time.monotonic() + 5
+        while _is_running(child_pid) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert not _is_running(child_pid)
+
+    def test_sync_helper_is_not_affected(self, fake_saml2aws, tmp_path):
+        # The synchronous API of the wrapped helper still returns results, not coroutines
+        fake_saml2aws()
+        helper = self._helper()
+
+        retval = helper.helper.run_saml2aws_login(
+            "arn:aws:iam::123456789012:role/dev", "dev", str(tmp_path / "credentials")
+        )
+
+        assert retval == 0
+
+    def test_logins_batch(self, fake_saml2aws, tmp_path):
+        fake_saml2aws(login_delay=0.2, login_returncodes={"prod": 1})
+        cred_file = str(tmp_path / "credentials")
+        profile_rolearn_dict = {
+            "dev": "arn:aws:iam::123456789012:role/dev",
+            "test": "arn:aws:iam::213456789012:role/test",
+            "prod": "arn:aws:iam::313456789012:role/prod",
+        }
+
+        results = asyncio.run(
+            self._helper().run_saml2aws_logins(
+                profile_rolearn_dict, ["dev", "test", "prod"], cred_file, parallel=3
+            )
+        )
+
+        assert [(r.profile_name, r.returncode) for r in results] == [
+            ("dev", 0),
+            ("test", 0),
+            ("prod", 1),
+        ]
+        assert sorted(get_aws_profiles(cred_file).sections()) == ["dev", "test"]
+
+    def test_logins_batch_timeout(self, fake_saml2aws, tmp_path, caplog):
+        fake_saml2aws(login_delay=30)
+
+        with caplog.at_level("ERROR"):
+            results = asyncio.run(
+                self._helper().run_saml2aws_logins(
+                    {"dev": "arn:aws:iam::123456789012:role/dev"},
+                    ["dev"],
+                    str(tmp_path / "credentials"),
+                    parallel=1,
+                    timeout=0.5,
+                )
+            )
+
+        assert results[0].returncode is None
+        assert "timed out" in caplog.text
+
+
+def _is_running(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Killed children of the killed saml2aws may linger as zombies until reaped
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
@@ -2,19 +2,29 @@ import logging
 import json
 from unittest.mock import Mock, mock_open, patch
 
+import pytest
 from click.testing import CliRunner
 
 from saml2awsmulti.aws_login import (
+    account_labels,
     chained,
     clean,
     create_profile_name_from_role_arn,
     create_profile_rolearn_dict,
+    load_cached_profile_rolearn_dict,
+    login_result_records,
     main_cli,
+    open_role_store,
     pre_select_options,
+    rename_last_selected_profiles,
+    save_roles_cache,
     switch,
+    to_profile_rolearn_dict,
     whoami,
-    _is_expired,
 )
+from saml2awsmulti.credentials_index import get_profile_entries
+from saml2awsmulti.file_io import get_aws_profiles
+from saml2awsmulti.login_executor import LoginResult
 
 
 class TestCreateProfileNameFromRoleArn:
@@ -48,21 +58,29 @@ class TestCreateProfileNameFromRoleArn:
 
 
 class TestCreateProfileRolearnDict:
+    @patch("saml2awsmulti.aws_login.write_roles_cache_metadata")
     @patch("saml2awsmulti.aws_login.exists")
     @patch("saml2awsmulti.aws_login.write_csv")
     @patch("saml2awsmulti.aws_login.read_csv")
-    def test_with_refresh_cached_roles(self, mock_read_csv, mock_write_csv, mock_exists):
+    def test_with_refresh_cached_roles(
+        self, mock_read_csv, mock_write_csv, mock_exists, mock_write_metadata
+    ):
         mock_exists.return_value = True
+        mock_read_csv.return_value = []
+        mock_write_csv.side_effect = lambda filename, rows: list(rows)
         mock_helper = Mock()
-        mock_helper.run_saml2aws_list_roles.return_value = [
-            ("arn:aws:iam::123456789012:role/dev", "aws-01"),
-            ("arn:aws:iam::213456789012:role/test", "aws-02"),
-        ]
+        mock_helper.iter_saml2aws_list_roles.return_value = iter(
+            [
+                ("arn:aws:iam::123456789012:role/dev", "aws-01"),
+                ("arn:aws:iam::213456789012:role/test", "aws-02"),
+            ]
+        )
 
         result = create_profile_rolearn_dict(mock_helper, "RoleName", True, [])
 
-        mock_helper.run_saml2aws_list_roles.assert_called_once()
+        mock_helper.iter_saml2aws_list_roles.assert_called_once()
         mock_write_csv.assert_called_once()
+        mock_write_metadata.assert_called_once()
         assert len(result) == 2
         assert result["dev"] == "arn:aws:iam::123456789012:role/dev"
         assert result["test"] == "arn:aws:iam::213456789012:role/test"
@@ -80,7 +98,7 @@ class TestCreateProfileRolearnDict:
         result = create_profile_rolearn_dict(mock_helper, "RoleName", False, [])
 
         mock_read_csv.assert_called_once()
-        mock_helper.run_saml2aws_list_roles.assert_not_called()
+        mock_helper.iter_saml2aws_list_roles.assert_not_called()
         assert len(result) == 2
 
     @patch("saml2awsmulti.aws_login.exists")
@@ -102,6 +120,116 @@ class TestCreateProfileRolearnDict:
         assert "prod" not in result
 
 
+class TestSaveRolesCache:
+    def test_save_roles_cache(self, tmp_path, caplog):
+        roles_file = str(tmp_path / "roles.csv")
+        meta_file = str(tmp_path / "roles_meta.json")
+        last_selected_file = tmp_path / "last_selected.txt"
+        roles_file_content = (
+            "arn:aws:iam::123456789012:role/dev,aws-01\n"
+            "arn:aws:iam::213456789012:role/test,aws-02\n"
+        )
+        with open(roles_file, "w") as f:
+            f.write(roles_file_content)
+        last_selected_file.write_text("dev-aws-01\ntest-aws-02")
+
+        with (
+            patch.multiple(
+                "saml2awsmulti.aws_login",
+                ALL_ROLES_FILE=roles_file,
+                ALL_ROLES_META_FILE=meta_file,
+                LAST_SELECTED_FILE=str(last_selected_file),
+            ),
+            caplog.at_level("INFO"),
+        ):
+            save_roles_cache(
+                [
+                    ("arn:aws:iam::123456789012:role/dev", "aws-01-renamed"),
+                    ("arn:aws:iam::213456789012:role/test", "aws-02"),
+                ]
+            )
+
+        assert "0 added, 0 removed, 1 account alias change(s)" in caplog.text
+        assert last_selected_file.read_text() == "dev-aws-01-renamed\ntest-aws-02"
+        assert "aws-01-renamed" in open(roles_file).read()
+        assert "fetched_at" in open(meta_file).read()
+
+    def test_save_roles_cache_stream_failure_keeps_cache(self, tmp_path):
+        roles_file = tmp_path / "roles.csv"
+        roles_file.write_text("arn:aws:iam::123456789012:role/dev,aws-01\n")
+
+        def roles():
+            yield ("arn:aws:iam::213456789012:role/test", "aws-02")
+            raise ValueError("Failed to retrieve roles with saml2aws.")
+
+        with patch.multiple(
+            "saml2awsmulti.aws_login",
+            ALL_ROLES_FILE=str(roles_file),
+            ALL_ROLES_META_FILE=str(tmp_path / "roles_meta.json"),
+        ):
+            with pytest.raises(ValueError):
+                save_roles_cache(roles())
+
+        assert roles_file.read_text() == "arn:aws:iam::123456789012:role/dev,aws-01\n"
+        assert list(tmp_path.iterdir()) == [roles_file]
+
+    @patch("saml2awsmulti.aws_login.read_lines_from_file")
+    def test_rename_last_selected_profiles_nothing_to_rename(self, mock_read_lines):
+        mock_read_lines.return_value = ["dev"]
+
+        with patch("builtins.open", mock_open()) as mocked_open:
+            rename_last_selected_profiles(
+                [("arn:aws:iam::123456789012:role/dev", "aws-01", "aws-01-renamed")]
+            )
+
+        mocked_open.assert_not_called()
+
+
+class TestOpenRoleStore:
+    def test_csv(self):
+        assert open_role_store("csv") is None
+
+    def test_sqlite(self, tmp_path):
+        roles_file = str(tmp_path / "roles.csv")
+        with open(roles_file, "w") as f:
+            f.write("arn:aws:iam::123456789012:role/dev,aws-01\n")
+
+        with patch.multiple(
+            "saml2awsmulti.aws_login",
+            ALL_ROLES_FILE=roles_file,
+            ALL_ROLES_DB_FILE=str(tmp_path / "roles.db"),
+        ):
+            store = open_role_store("sqlite")
+            profile_rolearn_dict = create_profile_rolearn_dict(Mock(), "RoleName", False, [], store)
+
+        assert profile_rolearn_dict == {"dev": "arn:aws:iam::123456789012:role/dev"}
+
+
+class TestToProfileRolearnDict:
+    ROLES = [
+        ("arn:aws:iam::123456789012:role/dev", "aws-01"),
+        ("arn:aws:iam::123456789012:role/dev-admin", "aws-01"),
+        ("arn:aws:iam::213456789012:role/test", "aws-02"),
+    ]
+
+    def test_exclude(self):
+        result = to_profile_rolearn_dict(self.ROLES, "RoleName", ["dev"], exclude=["admin"])
+        assert list(result) == ["dev"]
+
+    def test_glob_keywords(self):
+        result = to_profile_rolearn_dict(self.ROLES, "RoleName-AccountAlias", ["*-aws-01"])
+        assert list(result) == ["dev-aws-01", "dev-admin-aws-01"]
+
+    def test_role_store_with_glob_keywords_and_exclude(self):
+        mock_store = Mock()
+        mock_store.query_profiles.return_value = to_profile_rolearn_dict(self.ROLES, "RoleName", [])
+
+        result = load_cached_profile_rolearn_dict("RoleName", ["d*"], mock_store, ["*admin"])
+
+        assert list(result) == ["dev"]
+        mock_store.query_profiles.assert_called_once_with("RoleName", [])
+
+
 class TestPreSelectOptions:
     @patch("saml2awsmulti.aws_login.read_lines_from_file")
     def test_with_last_selected(self, mock_read_lines):
@@ -141,6 +269,33 @@ class TestPreSelectOptions:
 
         assert result == ["dev", "test"]
 
+    @patch("saml2awsmulti.aws_login.read_lines_from_file")
+    def test_with_role_store(self, mock_read_lines):
+        mock_read_lines.return_value = ["test"]
+        mock_store = Mock()
+        mock_store.query_profiles_by_role_arn.return_value = ["dev", "invalid"]
+        profile_rolearn_dict = {
+            "dev": "arn:aws:iam::123456789012:role/dev",
+            "test": "arn:aws:iam::213456789012:role/test",
+        }
+
+        result = pre_select_options(profile_rolearn_dict, ["dev"], mock_store, "RoleName")
+
+        assert result == ["test", "dev"]
+        mock_store.query_profiles_by_role_arn.assert_called_once_with("RoleName", ["dev"])
+
+    @patch("saml2awsmulti.aws_login.read_lines_from_file")
+    def test_with_regex_keyword(self, mock_read_lines):
+        mock_read_lines.return_value = []
+        profile_rolearn_dict = {
+            "dev": "arn:aws:iam::123456789012:role/dev",
+            "test": "arn:aws:iam::213456789012:role/test",
+        }
+
+        result = pre_select_options(profile_rolearn_dict, ["re:::2134"])
+
+        assert result == ["test"]
+
     @patch("saml2awsmulti.aws_login.read_lines_from_file")
     def test_no_duplicates_when_last_selected_matches_keyword(self, mock_read_lines):
         """A profile in last-selected that also matches a keyword must appear only once."""
@@ -177,6 +332,453 @@ class TestMainCli:
         assert result.exit_code == 0
         mock_helper.run_saml2aws_login.assert_called_once()
 
+    @patch("saml2awsmulti.aws_login.run_logins")
+    @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
+    @patch("saml2awsmulti.aws_login.create_profile_rolearn_dict")
+    @patch("saml2awsmulti.aws_login.pre_select_options")
+    @patch("saml2awsmulti.aws_login.prompt_roles_selection")
+    def test_main_cli_parallel(
+        self, mock_prompt, mock_pre_select, mock_create_dict, mock_helper_class, mock_run_logins
+    ):
+        runner = CliRunner()
+        mock_create_dict.return_value = {"dev": "arn:aws:iam::123456789012:role/dev"}
+        mock_pre_select.return_value = ["dev"]
+        mock_prompt.return_value = ["dev"]
+        mock_run_logins.return_value = []
+
+        with patch("builtins.open", mock_open()):
+            result = runner.invoke(main_cli, ["--parallel", "4"])
+
+        assert result.exit_code == 0
+        assert mock_run_logins.call_args[0][4] == 4
+
+    @patch("saml2awsmulti.aws_login.run_logins")
+    @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
+    @patch("saml2awsmulti.aws_login.create_profile_rolearn_dict")
+    @patch("saml2awsmulti.aws_login.pre_select_options")
+    @patch("saml2awsmulti.aws_login.prompt_roles_selection")
+    def test_main_cli_timings(
+        self,
+        mock_prompt,
+        mock_pre_select,
+        mock_create_dict,
+        mock_helper_class,
+        mock_run_logins,
+        tmp_path,
+    ):
+        mock_create_dict.return_value = {"dev": "arn:aws:iam::123456789012:role/dev"}
+        mock_prompt.return_value = ["dev"]
+        mock_run_logins.return_value = []
+        timings_file = tmp_path / "timings.jsonl"
+
+        with patch("saml2awsmulti.aws_login.LAST_SELECTED_FILE", str(tmp_path / "last")):
+            result = CliRunner().invoke(
+                main_cli, ["--timings", "--timings-file", str(timings_file)]
+            )
+
+        assert result.exit_code == 0
+        assert result.stderr.splitlines()[0].split()[:2] == ["Phase", "Count"]
+        names = [json.loads(line)["name"] for line in timings_file.read_text().splitlines()]
+        assert names == ["load_roles", "role_prompt", "logins"]
+
+    @patch("saml2awsmulti.aws_login.run_logins")
+    @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
+    @patch("saml2awsmulti.aws_login.create_profile_rolearn_dict")
+    @patch("saml2awsmulti.aws_login.pre_select_options")
+    @patch("saml2awsmulti.aws_login.prompt_roles_selection")
+    def test_main_cli_cache_saml(
+        self, mock_prompt, mock_pre_select, mock_create_dict, mock_helper_class, mock_run_logins
+    ):
+        mock_create_dict.return_value = {"dev": "arn:aws:iam::123456789012:role/dev"}
+        mock_prompt.return_value = ["dev"]
+        mock_run_logins.return_value = []
+        mock_helper = mock_helper_class.return_value
+        mock_helper.saml_cache.return_value.__enter__.side_effect = (
+            lambda: mock_run_logins.assert_not_called()
+        )
+
+        with patch("builtins.open", mock_open()):
+            result = CliRunner().invoke(main_cli, ["--cache-saml"])
+
+        assert result.exit_code == 0
+        mock_helper.saml_cache.assert_called_once()
+        mock_run_logins.assert_called_once()
+        mock_helper.saml_cache.return_value.__exit__.assert_called_once()
+
+    @patch("saml2awsmulti.aws_login.run_logins")
+    @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
+    @patch("saml2awsmulti.aws_login.create_profile_rolearn_dict")
+    @patch("saml2awsmulti.aws_login.pre_select_options")
+    @patch("saml2awsmulti.aws_login.prompt_roles_selection")
+    def test_main_cli_min_remaining(
+        self,
+        mock_prompt,
+        mock_pre_select,
+        mock_create_dict,
+        mock_helper_class,
+        mock_run_logins,
+        tmp_path,
+        caplog,
+    ):
+        cred_file = write_credentials(
+            tmp_path / "credentials",
+            {"fresh": "2099-01-01T00:00:00+00:00", "expired": "2000-01-01T00:00:00+00:00"},
+        )
+        mock_create_dict.return_value = {
+            "fresh": "arn:aws:iam::123456789012:role/fresh",
+            "expired": "arn:aws:iam::123456789012:role/expired",
+            "missing": "arn:aws:iam::123456789012:role/missing",
+        }
+        mock_prompt.return_value = ["fresh", "expired", "missing"]
+        mock_run_logins.return_value = []
+
+        with patch("saml2awsmulti.aws_login.AWS_CRED_FILE", cred_file):
+            with patch("saml2awsmulti.aws_login.LAST_SELECTED_FILE", str(tmp_path / "last")):
+                with caplog.at_level("INFO"):
+                    result = CliRunner().invoke(main_cli, ["--min-remaining", "60"])
+
+        assert result.exit_code == 0
+        assert mock_run_logins.call_args[0][2] == ["expired", "missing"]
+        assert "Skipped 1 role(s) with fresh credentials: fresh" in caplog.text
+        assert (tmp_path / "last").read_text() == "fresh\nexpired\nmissing"
+
+    @patch("saml2awsmulti.aws_login.run_logins")
+    @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
+    @patch("saml2awsmulti.aws_login.create_profile_rolearn_dict")
+    @patch("saml2awsmulti.aws_login.pre_select_options")
+    @patch("saml2awsmulti.aws_login.prompt_roles_selection")
+    def test_main_cli_min_remaining_all_fresh(
+        self,
+        mock_prompt,
+        mock_pre_select,
+        mock_create_dict,
+        mock_helper_class,
+        mock_run_logins,
+        tmp_path,
+    ):
+        cred_file = write_credentials(
+            tmp_path / "credentials", {"fresh": "2099-01-01T00:00:00+00:00"}
+        )
+        mock_create_dict.return_value = {"fresh": "arn:aws:iam::123456789012:role/fresh"}
+        mock_prompt.return_value = ["fresh"]
+
+        with patch("saml2awsmulti.aws_login.AWS_CRED_FILE", cred_file):
+            with patch("saml2awsmulti.aws_login.LAST_SELECTED_FILE", str(tmp_path / "last")):
+                result = CliRunner().invoke(main_cli, ["--min-remaining", "60"])
+
+        assert result.exit_code == 0
+        mock_run_logins.assert_not_called()
+        mock_helper_class.return_value.get_credentials.assert_not_called()
+
+    @patch("saml2awsmulti.aws_login.run_logins")
+    @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
+    @patch("saml2awsmulti.aws_login.create_profile_rolearn_dict")
+    @patch("saml2awsmulti.aws_login.prompt_roles_selection")
+    def test_main_cli_roles_file(
+        self, mock_prompt, mock_create_dict, mock_helper_class, mock_run_logins, tmp_path
+    ):
+        mock_create_dict.return_value = {
+            "dev": "arn:aws:iam::123456789012:role/dev",
+            "prod": "arn:aws:iam::123456789012:role/prod",
+        }
+        mock_run_logins.return_value = [LoginResult("dev", mock_create_dict.return_value["dev"], 0)]
+        roles_file = tmp_path / "roles"
+        roles_file.write_text("# CI roles\ndev\n\nunknown\ndev\n")
+
+        with patch("saml2awsmulti.aws_login.LAST_SELECTED_FILE", str(tmp_path / "last")):
+            result = CliRunner().invoke(main_cli, ["--roles-file", str(roles_file), "--json"])
+
+        mock_prompt.assert_not_called()
+        assert mock_run_logins.call_args[0][2] == ["dev"]
+        assert [json.loads(line) for line in result.stdout.splitlines()] == [
+            {
+                "Profile": "dev",
+                "RoleArn": "arn:aws:iam::123456789012:role/dev",
+                "Status": "ok",
+                "ReturnCode": 0,
+                "Error": None,
+            },
+            {"Profile": "unknown", "Status": "unknown"},
+        ]
+        # The unknown profile fails the run
+        assert result.exit_code == 1
+
+    @patch("saml2awsmulti.aws_login.run_logins")
+    @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
+    @patch("saml2awsmulti.aws_login.create_profile_rolearn_dict")
+    @patch("saml2awsmulti.aws_login.prompt_roles_selection")
+    def test_main_cli_roles_file_stdin(
+        self, mock_prompt, mock_create_dict, mock_helper_class, mock_run_logins, tmp_path
+    ):
+        mock_create_dict.return_value = {"dev": "arn:aws:iam::123456789012:role/dev"}
+        mock_run_logins.return_value = [LoginResult("dev", mock_create_dict.return_value["dev"], 0)]
+
+        with patch("saml2awsmulti.aws_login.LAST_SELECTED_FILE", str(tmp_path / "last")):
+            result = CliRunner().invoke(main_cli, ["--roles-file", "-"], input="dev\n")
+
+        assert result.exit_code == 0
+        mock_prompt.assert_not_called()
+        assert mock_run_logins.call_args[0][2] == ["dev"]
+
+    @patch("saml2awsmulti.aws_login.run_logins")
+    @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
+    @patch("saml2awsmulti.aws_login.create_profile_rolearn_dict")
+    @patch("saml2awsmulti.aws_login.prompt_roles_selection")
+    def test_main_cli_last(
+        self, mock_prompt, mock_create_dict, mock_helper_class, mock_run_logins, tmp_path
+    ):
+        mock_create_dict.return_value = {
+            "dev": "arn:aws:iam::123456789012:role/dev",
+            "prod": "arn:aws:iam::123456789012:role/prod",
+        }
+        mock_run_logins.return_value = [
+            LoginResult("prod", mock_create_dict.return_value["prod"], 0)
+        ]
+        (tmp_path / "last").write_text("prod")
+
+        with patch("saml2awsmulti.aws_login.LAST_SELECTED_FILE", str(tmp_path / "last")):
+            result = CliRunner().invoke(main_cli, ["--last"])
+
+        assert result.exit_code == 0
+        mock_prompt.assert_not_called()
+        assert mock_run_logins.call_args[0][2] == ["prod"]
+
+    @patch("saml2awsmulti.aws_login.run_logins")
+    @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
+    @patch("saml2awsmulti.aws_login.create_profile_rolearn_dict")
+    @patch("saml2awsmulti.aws_login.prompt_roles_selection")
+    def test_main_cli_all_matching(
+        self, mock_prompt, mock_create_dict, mock_helper_class, mock_run_logins, tmp_path
+    ):
+        mock_create_dict.return_value = {
+            "dev-a": "arn:aws:iam::123456789012:role/dev-a",
+            "prod": "arn:aws:iam::123456789012:role/prod",
+            "dev-b": "arn:aws:iam::123456789012:role/dev-b",
+        }
+        mock_run_logins.return_value = [
+            LoginResult("dev-a", mock_create_dict.return_value["dev-a"], 0),
+            LoginResult("dev-b", mock_create_dict.return_value["dev-b"], None, "timed out"),
+        ]
+
+        with patch("saml2awsmulti.aws_login.LAST_SELECTED_FILE", str(tmp_path / "last")):
+            result = CliRunner().invoke(main_cli, ["--all-matching", "dev-*", "--json"])
+
+        mock_prompt.assert_not_called()
+        assert mock_run_logins.call_args[0][2] == ["dev-a", "dev-b"]
+        records = [json.loads(line) for line in result.stdout.splitlines()]
+        assert [(r["Profile"], r["Status"]) for r in records] == [
+            ("dev-a", "ok"),
+            ("dev-b", "failed"),
+        ]
+        assert records[1]["Error"] == "timed out"
+        assert result.exit_code == 1
+
+    @patch("saml2awsmulti.aws_login.run_logins")
+    @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
+    @patch("saml2awsmulti.aws_login.create_profile_rolearn_dict")
+    def test_main_cli_all_matching_nothing(
+        self, mock_create_dict, mock_helper_class, mock_run_logins
+    ):
+        mock_create_dict.return_value = {"prod": "arn:aws:iam::123456789012:role/prod"}
+
+        result = CliRunner().invoke(main_cli, ["--all-matching", "dev"])
+
+        assert result.exit_code == 1
+        mock_run_logins.assert_not_called()
+
+    @pytest.mark.parametrize(
+        "error, message",
+        [
+            (
+                FileNotFoundError(2, "No such file or directory", "saml2aws"),
+                "[Errno 2] No such file or directory: 'saml2aws'",
+            ),
+            (ValueError("saml2aws list-roles exited with 1"), "saml2aws list-roles exited with 1"),
+        ],
+    )
+    @patch("saml2awsmulti.aws_login.run_logins")
+    @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
+    @patch("saml2awsmulti.aws_login.create_profile_rolearn_dict")
+    def test_main_cli_last_fails_before_logins(
+        self, mock_create_dict, mock_helper_class, mock_run_logins, error, message, tmp_path
+    ):
+        mock_create_dict.side_effect = error
+        (tmp_path / "last").write_text("prod")
+
+        with patch("saml2awsmulti.aws_login.LAST_SELECTED_FILE", str(tmp_path / "last")):
+            result = CliRunner().invoke(main_cli, ["--last", "--json"])
+
+        assert result.exit_code == 1
+        assert [json.loads(line) for line in result.stdout.splitlines()] == [
+            {"Status": "error", "Error": message}
+        ]
+        mock_run_logins.assert_not_called()
+
+    @pytest.mark.parametrize(
+        "args", [["-l", "re:("], ["-x", "re:("], ["--all-matching", "re:("], ["-s", "re:("]]
+    )
+    @patch("saml2awsmulti.aws_login.run_logins")
+    @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
+    @patch("saml2awsmulti.aws_login.prompt_roles_selection")
+    def test_main_cli_invalid_regex_keyword(
+        self, mock_prompt, mock_helper_class, mock_run_logins, args, tmp_path
+    ):
+        roles_file = tmp_path / "roles.csv"
+        roles_file.write_text("arn:aws:iam::123456789012:role/dev,aws-01\n")
+
+        with patch("saml2awsmulti.aws_login.ALL_ROLES_FILE", str(roles_file)):
+            result = CliRunner().invoke(main_cli, args)
+
+        assert result.exit_code == 2
+        assert "invalid regular expression in 're:('" in result.output
+        assert "Traceback" not in result.output
+        mock_run_logins.assert_not_called()
+
+    @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
+    def test_main_cli_selection_options_are_exclusive(self, mock_helper_class):
+        result = CliRunner().invoke(main_cli, ["--last", "--all-matching", "dev"])
+
+        assert result.exit_code == 2
+        assert "Use only one of --roles-file, --last and --all-matching" in result.output
+        mock_helper_class.assert_not_called()
+
+    @patch("saml2awsmulti.aws_login.run_logins")
+    @patch("saml2awsmulti.aws_login.run_sts_logins")
+    @patch("saml2awsmulti.aws_login.load_saml2aws_config")
+    @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
+    @patch("saml2awsmulti.aws_login.create_profile_rolearn_dict")
+    @patch("saml2awsmulti.aws_login.pre_select_options")
+    @patch("saml2awsmulti.aws_login.prompt_roles_selection")
+    def test_main_cli_use_sts(
+        self,
+        mock_prompt,
+        mock_pre_select,
+        mock_create_dict,
+        mock_helper_class,
+        mock_load_config,
+        mock_run_sts_logins,
+        mock_run_logins,
+    ):
+        runner = CliRunner()
+        mock_create_dict.return_value = {"dev": "arn:aws:iam::123456789012:role/dev"}
+        mock_pre_select.return_value = ["dev"]
+        mock_prompt.return_value = ["dev"]
+        mock_load_config.return_value = {"region": "ap-southeast-2"}
+        mock_run_sts_logins.return_value = []
+
+        with patch("builtins.open", mock_open()):
+            result = runner.invoke(main_cli, ["--use-sts"])
+
+        assert result.exit_code == 0
+        mock_run_logins.assert_not_called()
+        assert mock_run_sts_logins.call_args.kwargs["region"] == "ap-southeast-2"
+
+    @patch("saml2awsmulti.aws_login.run_logins")
+    @patch("saml2awsmulti.aws_login.write_roles_cache_metadata")
+    @patch("saml2awsmulti.aws_login.read_lines_from_file")
+    @patch("saml2awsmulti.aws_login.write_csv")
+    @patch("saml2awsmulti.aws_login.read_csv")
+    @patch("saml2awsmulti.aws_login.exists")
+    @patch("saml2awsmulti.aws_login.start_warmup")
+    @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
+    @patch("saml2awsmulti.aws_login.pre_select_options")
+    @patch("saml2awsmulti.aws_login.prompt_roles_selection")
+    def test_main_cli_pipeline(
+        self,
+        mock_prompt,
+        mock_pre_select,
+        mock_helper_class,
+        mock_start_warmup,
+        mock_exists,
+        mock_read_csv,
+        mock_write_csv,
+        mock_read_lines,
+        mock_write_metadata,
+        mock_run_logins,
+    ):
+        from saml2awsmulti.pipeline import WarmupResult
+
+        runner = CliRunner()
+        mock_exists.return_value = True
+        mock_read_csv.return_value = [
+            ("arn:aws:iam::123456789012:role/dev", "aws-01"),
+            ("arn:aws:iam::213456789012:role/old", "aws-02"),
+        ]
+        refreshed = [("arn:aws:iam::123456789012:role/dev", "aws-01")]
+        mock_start_warmup.return_value.result.return_value = WarmupResult(refreshed, None, 0)
+        mock_pre_select.return_value = []
+        mock_prompt.return_value = ["dev", "old"]
+        mock_run_logins.return_value = []
+
+        with patch("builtins.open", mock_open()):
+            result = runner.invoke(main_cli, ["--pipeline", "-r"])
+
+        assert result.exit_code == 0
+        mock_helper_class.return_value.get_credentials.assert_called_once()
+        mock_helper_class.return_value.iter_saml2aws_list_roles.assert_not_called()
+        mock_write_csv.assert_called_once()
+        mock_write_metadata.assert_called_once()
+        assert mock_run_logins.call_args[0][2] == ["dev"]
+
+    @patch("saml2awsmulti.aws_login.start_warmup")
+    @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
+    @patch("saml2awsmulti.aws_login.prompt_roles_selection")
+    def test_main_cli_pipeline_use_sts_no_cached_roles(
+        self, mock_prompt, mock_helper_class, mock_start_warmup, tmp_path
+    ):
+        from saml2awsmulti.pipeline import WarmupResult
+
+        roles_file = tmp_path / "roles.csv"
+        roles_file.write_text("# no roles yet\n")
+        mock_start_warmup.return_value.result.return_value = WarmupResult(None, None, 0)
+        mock_prompt.return_value = []
+
+        with patch("saml2awsmulti.aws_login.ALL_ROLES_FILE", str(roles_file)):
+            result = CliRunner().invoke(main_cli, ["--pipeline", "--use-sts"])
+
+        assert result.exit_code == 0
+        assert result.exception is None
+        mock_start_warmup.assert_called_once_with(mock_helper_class.return_value, False, None)
+
+    @patch("saml2awsmulti.aws_login.run_logins")
+    @patch("saml2awsmulti.aws_login.read_csv")
+    @patch("saml2awsmulti.aws_login.exists")
+    @patch("saml2awsmulti.aws_login.read_roles_cache_metadata")
+    @patch("saml2awsmulti.aws_login.start_warmup")
+    @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
+    @patch("saml2awsmulti.aws_login.pre_select_options")
+    @patch("saml2awsmulti.aws_login.prompt_roles_selection")
+    def test_main_cli_stale_roles_cache(
+        self,
+        mock_prompt,
+        mock_pre_select,
+        mock_helper_class,
+        mock_start_warmup,
+        mock_read_metadata,
+        mock_exists,
+        mock_read_csv,
+        mock_run_logins,
+        caplog,
+    ):
+        from saml2awsmulti.pipeline import WarmupResult
+
+        runner = CliRunner()
+        mock_exists.return_value = True
+        mock_read_metadata.return_value = {}
+        mock_read_csv.return_value = [("arn:aws:iam::123456789012:role/dev", "aws-01")]
+        mock_start_warmup.return_value.result.return_value = WarmupResult(None, None, 0)
+        mock_pre_select.return_value = []
+        mock_prompt.return_value = ["dev"]
+        mock_run_logins.return_value = []
+
+        with patch("builtins.open", mock_open()), caplog.at_level("INFO"):
+            result = runner.invoke(main_cli, ["--roles-cache-ttl", "24"])
+
+        assert result.exit_code == 0
+        assert "Cached roles are stale" in caplog.text
+        mock_start_warmup.assert_called_once_with(mock_helper_class.return_value, True, None)
+        mock_helper_class.return_value.iter_saml2aws_list_roles.assert_not_called()
+
     @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
     def test_main_cli_file_not_found_saml2aws_config(self, mock_helper_class, caplog):
         runner = CliRunner()
@@ -209,6 +811,37 @@ class TestMainCli:
         assert "Nothing selected. Aborted." in caplog.text
         mock_helper.run_saml2aws_login.assert_not_called()
 
+    @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
+    @patch("saml2awsmulti.aws_login.create_profile_rolearn_dict")
+    @patch("saml2awsmulti.aws_login.pre_select_options")
+    @patch("saml2awsmulti.aws_login.account_labels")
+    @patch("saml2awsmulti.aws_login.prompt_roles_fuzzy_selection")
+    @patch("saml2awsmulti.aws_login.prompt_roles_selection")
+    def test_main_cli_fuzzy_selector(
+        self,
+        mock_prompt,
+        mock_fuzzy_prompt,
+        mock_labels,
+        mock_pre_select,
+        mock_create_dict,
+        mock_helper_class,
+    ):
+        runner = CliRunner()
+        profile_rolearn_dict = {"dev": "arn:aws:iam::123456789012:role/dev"}
+        mock_create_dict.return_value = profile_rolearn_dict
+        mock_pre_select.return_value = ["dev"]
+        mock_labels.return_value = {"dev": "aws-dev (123456789012)"}
+        mock_fuzzy_prompt.return_value = []
+
+        result = runner.invoke(main_cli, ["--selector", "fuzzy"])
+
+        assert result.exit_code == 0
+        mock_labels.assert_called_once_with(profile_rolearn_dict)
+        mock_fuzzy_prompt.assert_called_once_with(
+            profile_rolearn_dict.keys(), ["dev"], {"dev": "aws-dev (123456789012)"}
+        )
+        mock_prompt.assert_not_called()
+
     @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
     @patch("saml2awsmulti.aws_login.create_profile_rolearn_dict")
     @patch("saml2awsmulti.aws_login.pre_select_options")
@@ -289,59 +922,146 @@ class TestChainedCommand:
 
         assert result.exit_code == 0
 
+    def test_chained_multi_hop_and_cycles(self, tmp_path, caplog):
+        conf_file = tmp_path / "config"
+        conf_file.write_text(
+            "[profile ops]\nsource_profile = base\nrole_arn = arn:aws:iam::1:role/ops\n"
+            "[profile audit]\nsource_profile = ops\nrole_arn = arn:aws:iam::2:role/audit\n"
+            "[profile a]\nsource_profile = b\nrole_arn = arn:aws:iam::3:role/a\n"
+            "[profile b]\nsource_profile = a\nrole_arn = arn:aws:iam::3:role/b\n"
+        )
+
+        with patch("saml2awsmulti.aws_login.AWS_CONF_FILE", str(conf_file)):
+            with caplog.at_level("INFO"):
+                result = CliRunner().invoke(chained, ["-p", "base"])
+
+        assert result.exit_code == 0
+        assert "Ignored cyclic source_profile chain: a -> b -> a" in caplog.text
+        assert "Found 2 chained role profiles" in caplog.text
+        assert "2: audit (via base -> ops)" in caplog.text
+
+    @patch("saml2awsmulti.aws_login.StsClientFactory")
+    @patch("saml2awsmulti.aws_login.prewarm_chained_roles")
+    def test_chained_prewarm(self, mock_prewarm, mock_factory, tmp_path, caplog):
+        conf_file = tmp_path / "config"
+        conf_file.write_text(
+            "[profile ops]\nsource_profile = base\nrole_arn = arn:aws:iam::1:role/ops\n"
+            "[profile billing]\nsource_profile = expired\nrole_arn = arn:aws:iam::2:role/b\n"
+        )
+        cred_file = write_credentials(
+            tmp_path / "credentials",
+            {"base": "2099-01-01T00:00:00+00:00", "expired": "2000-01-01T00:00:00+00:00"},
+        )
+        mock_prewarm.return_value = {
+            "ops": {"Status": "assumed", "Expiration": "2099-01-01T01:00:00+00:00"}
+        }
+
+        with patch.multiple(
+            "saml2awsmulti.aws_login", AWS_CONF_FILE=str(conf_file), AWS_CRED_FILE=cred_file
+        ):
+            with caplog.at_level("INFO"):
+                result = CliRunner().invoke(chained, ["--prewarm", "-P", "4"])
+
+        assert result.exit_code == 1
+        assert "Skipped billing: the credentials of expired expired" in caplog.text
+        assert "ops: assumed, expires 2099-01-01T01:00:00+00:00" in caplog.text
+        assert "Pre-warmed 1/1 chained role(s)" in caplog.text
+        graph, profiles, factory, _, parallel = mock_prewarm.call_args.args
+        assert profiles == ["ops"]
+        assert factory is mock_factory.return_value
+        assert parallel == 4
+
+
+def write_credentials(path, profiles):
+    """Write {profile: x_security_token_expires or None} as a credentials file."""
+    lines = []
+    for profile, expires in profiles.items():
+        lines += [f"[{profile}]", f"aws_access_key_id = ASIA{profile.upper()}"]
+        if expires:
+            lines.append(f"x_security_token_expires = {expires}")
+        lines.append("")
+    path.write_text("\n".join(lines))
+    return str(path)
+
 
 class TestSwitchCommand:
-    @patch("saml2awsmulti.aws_login.get_aws_profiles")
-    @patch("saml2awsmulti.aws_login.write_aws_profiles")
     @patch("saml2awsmulti.aws_login.prompt_profile_selection")
-    def test_switch_success(self, mock_prompt, mock_write, mock_get_profiles, caplog):
-        runner = CliRunner()
-        mock_config = Mock()
-        mock_config.sections.return_value = ["default", "dev", "test"]
-        mock_config.__getitem__ = Mock(return_value={"aws_access_key_id": "test"})
-        mock_config.__setitem__ = Mock()  # Enable item assignment
-        mock_get_profiles.return_value = mock_config
+    def test_switch_success(self, mock_prompt, tmp_path, caplog):
+        cred_file = write_credentials(
+            tmp_path / "credentials",
+            {"default": None, "dev": "2099-01-01T00:00:00+00:00", "test": None},
+        )
         mock_prompt.return_value = "dev"
 
-        with caplog.at_level("INFO"):
-            result = runner.invoke(switch, [])
+        with patch("saml2awsmulti.aws_login.AWS_CRED_FILE", cred_file):
+            with caplog.at_level("INFO"):
+                result = CliRunner().invoke(switch, [])
 
         assert result.exit_code == 0
         assert "Set the default profile to dev" in caplog.text
-        mock_write.assert_called_once()
+        mock_prompt.assert_called_once_with(["dev", "test"])
+        config = get_aws_profiles(cred_file)
+        assert config.sections() == ["default", "dev", "test"]
+        assert dict(config["default"]) == dict(config["dev"])
 
-    @patch("saml2awsmulti.aws_login.get_aws_profiles")
-    def test_switch_no_profiles(self, mock_get_profiles, caplog):
-        runner = CliRunner()
-        mock_config = Mock()
-        mock_config.sections.return_value = ["default"]
-        mock_get_profiles.return_value = mock_config
+    @patch("saml2awsmulti.aws_login.prompt_profile_selection")
+    def test_switch_hides_expired_profiles(self, mock_prompt, tmp_path):
+        cred_file = write_credentials(
+            tmp_path / "credentials",
+            {"expired": "2000-01-01T00:00:00+00:00", "valid": "2099-01-01T00:00:00+00:00"},
+        )
+        mock_prompt.return_value = None
 
-        with caplog.at_level("INFO"):
-            result = runner.invoke(switch, [])
+        with patch("saml2awsmulti.aws_login.AWS_CRED_FILE", cred_file):
+            CliRunner().invoke(switch, [])
+
+        mock_prompt.assert_called_once_with(["valid"])
+
+    @patch("saml2awsmulti.aws_login.prompt_profile_selection")
+    def test_switch_after_file_changed(self, mock_prompt, tmp_path):
+        cred_file = write_credentials(tmp_path / "credentials", {"dev": None, "test": None})
+        get_profile_entries(cred_file)  # Build the index
+        mock_prompt.return_value = "test"
+
+        with patch("saml2awsmulti.aws_login.AWS_CRED_FILE", cred_file):
+            with patch(
+                "saml2awsmulti.aws_login.get_profile_entries",
+                return_value=get_profile_entries(cred_file),
+            ):
+                # Written by saml2aws after the index was read: offsets moved
+                write_credentials(
+                    tmp_path / "credentials", {"new": None, "dev": None, "test": None}
+                )
+                result = CliRunner().invoke(switch, [])
+
+        assert result.exit_code == 0
+        assert get_aws_profiles(cred_file)["default"]["aws_access_key_id"] == "ASIATEST"
+
+    def test_switch_no_profiles(self, tmp_path, caplog):
+        cred_file = write_credentials(tmp_path / "credentials", {"default": None})
+
+        with patch("saml2awsmulti.aws_login.AWS_CRED_FILE", cred_file):
+            with caplog.at_level("INFO"):
+                result = CliRunner().invoke(switch, [])
 
         assert result.exit_code == 0
         assert "No non default aws profile found" in caplog.text
 
-    @patch("saml2awsmulti.aws_login.get_aws_profiles")
     @patch("saml2awsmulti.aws_login.prompt_profile_selection")
-    def test_switch_nothing_selected(self, mock_prompt, mock_get_profiles, caplog):
-        runner = CliRunner()
-        mock_config = Mock()
-        mock_config.sections.return_value = ["default", "dev"]
-        mock_config.__getitem__ = Mock(return_value={})
-        mock_get_profiles.return_value = mock_config
+    def test_switch_nothing_selected(self, mock_prompt, tmp_path, caplog):
+        cred_file = write_credentials(tmp_path / "credentials", {"default": None, "dev": None})
         mock_prompt.return_value = None
 
-        with caplog.at_level("INFO"):
-            result = runner.invoke(switch, [])
+        with patch("saml2awsmulti.aws_login.AWS_CRED_FILE", cred_file):
+            with caplog.at_level("INFO"):
+                result = CliRunner().invoke(switch, [])
 
         assert result.exit_code == 0
         assert "Nothing selected. Aborted." in caplog.text
 
 
 class TestWhoamiCommand:
-    @patch("saml2awsmulti.aws_login.Session")
+    @patch("boto3.session.Session")
     def test_whoami_success(self, mock_session):
         runner = CliRunner()
         mock_client = Mock()
@@ -361,7 +1081,7 @@ class TestWhoamiCommand:
         assert output["Account"] == "123456789012"
         assert "ResponseMetadata" not in output
 
-    @patch("saml2awsmulti.aws_login.Session")
+    @patch("boto3.session.Session")
     def test_whoami_with_profile(self, mock_session):
         runner = CliRunner()
         mock_client = Mock()
@@ -377,7 +1097,7 @@ class TestWhoamiCommand:
         assert result.exit_code == 0
         mock_session.assert_called_once_with(profile_name="dev")
 
-    @patch("saml2awsmulti.aws_login.Session")
+    @patch("boto3.session.Session")
     def test_whoami_error(self, mock_session, caplog):
         runner = CliRunner()
         mock_session.side_effect = Exception("AWS credentials not found")
@@ -388,91 +1108,139 @@ class TestWhoamiCommand:
         assert result.exit_code == 0
         assert "AWS credentials not found" in caplog.text
 
+    @patch("saml2awsmulti.aws_login.get_caller_identities")
+    @patch("saml2awsmulti.aws_login.StsClientFactory")
+    def test_whoami_profiles_matching(self, mock_factory, mock_identities):
+        mock_factory.return_value.available_profiles.return_value = ["dev", "tst", "prd"]
+        mock_identities.return_value = iter(
+            [
+                {"Profile": "tst", "Account": "2", "Arn": "arn-tst", "UserId": "u", "LatencyMs": 5},
+                {"Profile": "dev", "Account": "1", "Arn": "arn-dev", "UserId": "u", "LatencyMs": 9},
+            ]
+        )
 
-class TestIsExpired:
-    def _make_config(self, expires_str=None):
-        from configparser import ConfigParser
+        result = CliRunner().invoke(whoami, ["-m", "dev", "-m", "t*", "-P", "2"])
 
-        cp = ConfigParser()
-        cp.add_section("dev")
-        if expires_str:
-            cp.set("dev", "x_security_token_expires", expires_str)
-        return cp
+        assert result.exit_code == 0
+        mock_identities.assert_called_once_with(["dev", "tst"], mock_factory.return_value, 2)
+        lines = [json.loads(line) for line in result.output.splitlines()]
+        assert [line["Profile"] for line in lines] == ["tst", "dev"]
+
+    @patch("saml2awsmulti.aws_login.get_caller_identities")
+    @patch("saml2awsmulti.aws_login.StsClientFactory")
+    def test_whoami_all_with_failure(self, mock_factory, mock_identities, caplog):
+        mock_factory.return_value.available_profiles.return_value = ["dev", "tst"]
+        mock_identities.return_value = iter(
+            [
+                {"Profile": "dev", "Account": "1", "Arn": "arn-dev", "UserId": "u", "LatencyMs": 9},
+                {"Profile": "tst", "Error": "Token expired", "LatencyMs": 3},
+            ]
+        )
 
-    def test_no_expiry_field(self):
-        cp = self._make_config()
-        assert _is_expired(cp, "dev") is False
+        with caplog.at_level("ERROR"):
+            result = CliRunner().invoke(whoami, ["--all"])
 
-    def test_expired(self):
-        cp = self._make_config("2000-01-01T00:00:00+00:00")
-        assert _is_expired(cp, "dev") is True
+        assert result.exit_code == 1
+        mock_identities.assert_called_once_with(["dev", "tst"], mock_factory.return_value, 10)
+        assert len(result.output.splitlines()) == 2
+        assert "1 of 2 profile(s) failed" in caplog.text
 
-    def test_not_expired(self):
-        cp = self._make_config("2099-01-01T00:00:00+00:00")
-        assert _is_expired(cp, "dev") is False
+    @patch("saml2awsmulti.aws_login.get_caller_identities")
+    @patch("saml2awsmulti.aws_login.StsClientFactory")
+    def test_whoami_no_matching_profile(self, mock_factory, mock_identities):
+        mock_factory.return_value.available_profiles.return_value = ["dev"]
 
-    def test_invalid_expiry_format(self, caplog):
-        cp = self._make_config("not-a-date")
-        with caplog.at_level("WARNING"):
-            result = _is_expired(cp, "dev")
-        assert result is False
-        assert "Could not parse expiry" in caplog.text
+        result = CliRunner().invoke(whoami, ["-m", "prd"])
 
+        assert result.exit_code == 0
+        mock_identities.assert_not_called()
 
-class TestCleanCommand:
-    @patch("saml2awsmulti.aws_login.write_aws_profiles")
-    @patch("saml2awsmulti.aws_login.get_aws_profiles")
-    def test_clean_removes_expired(self, mock_get, mock_write, caplog):
-        from configparser import ConfigParser
 
-        cp = ConfigParser()
-        cp.add_section("expired")
-        cp.set("expired", "x_security_token_expires", "2000-01-01T00:00:00+00:00")
-        cp.add_section("valid")
-        cp.set("valid", "x_security_token_expires", "2099-01-01T00:00:00+00:00")
-        mock_get.return_value = cp
+class TestCleanCommand:
+    def test_clean_removes_expired(self, tmp_path, caplog):
+        cred_file = write_credentials(
+            tmp_path / "credentials",
+            {"expired": "2000-01-01T00:00:00+00:00", "valid": "2099-01-01T00:00:00+00:00"},
+        )
 
-        runner = CliRunner()
-        with caplog.at_level("INFO"):
-            result = runner.invoke(clean, [])
+        with patch("saml2awsmulti.aws_login.AWS_CRED_FILE", cred_file):
+            with caplog.at_level("INFO"):
+                result = CliRunner().invoke(clean, [])
 
         assert result.exit_code == 0
-        mock_write.assert_called_once()
-        assert "expired" in caplog.text
-        assert "expired" not in cp.sections()
-        assert "valid" in cp.sections()
-
-    @patch("saml2awsmulti.aws_login.write_aws_profiles")
-    @patch("saml2awsmulti.aws_login.get_aws_profiles")
-    def test_clean_nothing_to_remove(self, mock_get, mock_write, caplog):
-        from configparser import ConfigParser
-
-        cp = ConfigParser()
-        cp.add_section("valid")
-        cp.set("valid", "x_security_token_expires", "2099-01-01T00:00:00+00:00")
-        mock_get.return_value = cp
+        assert "Removed 1 expired profile(s):\n  - expired" in caplog.text
+        assert get_aws_profiles(cred_file).sections() == ["valid"]
+        assert list(get_profile_entries(cred_file)) == ["valid"]
+
+    @patch("saml2awsmulti.aws_login.update_aws_profiles")
+    def test_clean_nothing_to_remove(self, mock_write, tmp_path, caplog):
+        cred_file = write_credentials(
+            tmp_path / "credentials", {"valid": "2099-01-01T00:00:00+00:00", "no_expiry": None}
+        )
 
-        runner = CliRunner()
-        with caplog.at_level("INFO"):
-            result = runner.invoke(clean, [])
+        with patch("saml2awsmulti.aws_login.AWS_CRED_FILE", cred_file):
+            with caplog.at_level("INFO"):
+                result = CliRunner().invoke(clean, [])
 
         assert result.exit_code == 0
         mock_write.assert_not_called()
         assert "No expired profiles found" in caplog.text
 
-    @patch("saml2awsmulti.aws_login.write_aws_profiles")
-    @patch("saml2awsmulti.aws_login.get_aws_profiles")
-    def test_clean_skips_default(self, mock_get, mock_write, caplog):
-        from configparser import ConfigParser
-
-        cp = ConfigParser()
-        cp.add_section("default")
-        cp.set("default", "x_security_token_expires", "2000-01-01T00:00:00+00:00")
-        mock_get.return_value = cp
+    @patch("saml2awsmulti.aws_login.update_aws_profiles")
+    def test_clean_skips_default(self, mock_write, tmp_path):
+        cred_file = write_credentials(
+            tmp_path / "credentials", {"default": "2000-01-01T00:00:00+00:00"}
+        )
 
-        runner = CliRunner()
-        result = runner.invoke(clean, [])
+        with patch("saml2awsmulti.aws_login.AWS_CRED_FILE", cred_file):
+            result = CliRunner().invoke(clean, [])
 
         assert result.exit_code == 0
         mock_write.assert_not_called()
-        assert "default" in cp.sections()
+
+    def test_clean_no_credentials_file(self, tmp_path, caplog):
+        with patch("saml2awsmulti.aws_login.AWS_CRED_FILE", str(tmp_path / "credentials")):
+            with caplog.at_level("INFO"):
+                result = CliRunner().invoke(clean, [])
+
+        assert result.exit_code == 0
+        assert "No expired profiles found" in caplog.text
+
+
+def test_login_result_records():
+    results = [LoginResult("dev", "arn:aws:iam::123456789012:role/dev", 1)]
+
+    records = login_result_records(results, {"prod": 4102444800.0}, ["unknown"])
+
+    assert records == [
+        {
+            "Profile": "dev",
+            "RoleArn": "arn:aws:iam::123456789012:role/dev",
+            "Status": "failed",
+            "ReturnCode": 1,
+            "Error": None,
+        },
+        {"Profile": "prod", "Status": "skipped", "Expires": "2100-01-01T00:00:00+00:00"},
+        {"Profile": "unknown", "Status": "unknown"},
+    ]
+
+
+def test_account_labels(tmp_path):
+    roles_file = tmp_path / "aws_login_roles.csv"
+    roles_file.write_text(
+        "arn:aws:iam::123456789012:role/dev,aws-dev\narn:aws:iam::210987654321:role/prd,None\n"
+    )
+    profile_rolearn_dict = {
+        "dev": "arn:aws:iam::123456789012:role/dev",
+        "prd": "arn:aws:iam::210987654321:role/prd",
+        "new": "arn:aws:iam::111111111111:role/new",
+    }
+
+    with patch("saml2awsmulti.aws_login.ALL_ROLES_FILE", str(roles_file)):
+        labels = account_labels(profile_rolearn_dict)
+
+    assert labels == {
+        "dev": "aws-dev (123456789012)",
+        "prd": "210987654321",
+        "new": "111111111111",
+    }
@@ -0,0 +1,106 @@
+import pytest
+
+from saml2awsmulti.capabilities import (
+    Saml2AwsCapabilities,
+    load_capabilities,
+    parse_capabilities,
+    save_capabilities,
+)
+
+LOGIN_HELP = """usage: saml2aws login [<flags>]
+
+Flags:
+      --help                 Show context-sensitive help.
+  -p, --profile=PROFILE      The AWS profile to save the temporary credentials
+      --[no-]skip-prompt     Skip prompting for parameters during login.
+      --session-duration=SESSION-DURATION
+      --stdin-password       Read the password from stdin.
+"""
+
+CAPABILITIES = Saml2AwsCapabilities("2.36.19", ("--skip-prompt",))
+FINGERPRINT = ("/usr/local/bin/saml2aws", 1024, 1700000000000000000)
+
+
+class TestParseCapabilities:
+    def test_parse(self):
+        capabilities = parse_capabilities("\n2.36.19\n", LOGIN_HELP)
+
+        assert capabilities.version == "2.36.19"
+        assert capabilities.login_flags == (
+            "--help",
+            "--profile",
+            "--session-duration",
+            "--skip-prompt",
+            "--stdin-password",
+        )
+        assert capabilities.stdin_password is True
+        assert capabilities.session_duration is True
+        assert capabilities.login_cache_saml is False
+
+    def test_parse_old_saml2aws(self):
+        capabilities = parse_capabilities("", "  --password=PASSWORD\n")
+
+        assert capabilities.version is None
+        assert capabilities.stdin_password is False
+        assert capabilities.login_cache_saml is False
+
+
+class TestCapabilitiesCache:
+    def test_round_trip(self, tmp_path):
+        filename = str(tmp_path / "capabilities.json")
+        save_capabilities(filename, FINGERPRINT, CAPABILITIES)
+
+        assert load_capabilities(filename, FINGERPRINT) == CAPABILITIES
+
+    def test_binary_changed(self, tmp_path):
+        filename = str(tmp_path / "capabilities.json")
+        save_capabilities(filename, FINGERPRINT, CAPABILITIES)
+
+        path, size, mtime_ns = FINGERPRINT
+        assert load_capabilities(filename, (path, size + 1, mtime_ns)) is None
+        assert load_capabilities(filename, (path, size, mtime_ns + 1)) is None
+        assert load_capabilities(filename, ("/opt/saml2aws", size, mtime_ns)) is None
+
+    def test_keeps_other_binaries(self, tmp_path):
+        filename = str(tmp_path / "capabilities.json")
+        other = ("/opt/saml2aws", 2048, 1)
+        save_capabilities(filename, FINGERPRINT, CAPABILITIES)
+        save_capabilities(filename, other, CAPABILITIES._replace(version="2.37.0"))
+
+        assert load_capabilities(filename, FINGERPRINT) == CAPABILITIES
+        assert load_capabilities(filename, other).version == "2.37.0"
+
+    def test_failed_probe_not_saved(self, tmp_path):
+        filename = tmp_path / "capabilities.json"
+        save_capabilities(str(filename), FINGERPRINT, Saml2AwsCapabilities(None, ()))
+
+        assert not filename.exists()
+
+    def test_invalid_cache_ignored(self, tmp_path):
+        filename = tmp_path / "capabilities.json"
+        filename.write_text("{not json")
+
+        assert load_capabilities(str(filename), FINGERPRINT) is None
+
+    @pytest.mark.parametrize(
+        "content",
+        [
+            "[]",
+            '{"/usr/local/bin/saml2aws": "2.36.19"}',
+            '{"/usr/local/bin/saml2aws": {"size": 1024, "mtime_ns": 1700000000000000000}}',
+            '{"/usr/local/bin/saml2aws": {"size": 1024, "mtime_ns": 1700000000000000000, '
+            '"login_flags": null}}',
+        ],
+    )
+    def test_malformed_cache_is_probed_again(self, tmp_path, content):
+        filename = tmp_path / "capabilities.json"
+        filename.write_text(content)
+
+        assert load_capabilities(str(filename), FINGERPRINT) is None
+        save_capabilities(str(filename), FINGERPRINT, CAPABILITIES)
+        assert load_capabilities(str(filename), FINGERPRINT) == CAPABILITIES
+
+    def test_no_cache_file(self, tmp_path):
+        assert load_capabilities(None, FINGERPRINT) is None
+        save_capabilities(None, FINGERPRINT, CAPABILITIES)
+        assert load_capabilities(str(tmp_path / "missing.json"), FINGERPRINT) is None
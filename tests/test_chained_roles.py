@@ -0,0 +1,257 @@
+import threading
+from configparser import ConfigParser
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock, patch
+
+import botocore.session
+import pytest
+from botocore.credentials import AssumeRoleCredentialFetcher
+from botocore.utils import JSONFileCache
+
+from saml2awsmulti.chained_roles import (
+    ChainedRoleGraph,
+    assume_role_args,
+    cli_cache_key,
+    prewarm_chained_roles,
+)
+
+CONFIG = """
+[profile base-admin]
+region = eu-west-1
+
+[profile ops]
+source_profile = base-admin
+role_arn = arn:aws:iam::111111111111:role/ops
+
+[profile ops-audit]
+source_profile = ops
+role_arn = arn:aws:iam::222222222222:role/audit
+external_id = audit-ext
+
+[profile ops-audit-readonly]
+source_profile = ops-audit
+role_arn = arn:aws:iam::333333333333:role/readonly
+duration_seconds = 1800
+
+[profile billing]
+source_profile = base-finance
+role_arn = arn:aws:iam::444444444444:role/billing
+
+[profile loop-a]
+source_profile = loop-b
+role_arn = arn:aws:iam::555555555555:role/a
+
+[profile loop-b]
+source_profile = loop-a
+role_arn = arn:aws:iam::555555555555:role/b
+
+[profile after-loop]
+source_profile = loop-a
+role_arn = arn:aws:iam::555555555555:role/c
+
+[profile not-chained]
+role_arn = arn:aws:iam::666666666666:role/web
+credential_source = Ec2InstanceMetadata
+"""
+
+
+def _graph(text=CONFIG):
+    config = ConfigParser()
+    config.read_string(text)
+    return ChainedRoleGraph(config)
+
+
+class TestChainedRoleGraph:
+    def test_children(self):
+        graph = _graph()
+
+        assert graph.children["base-admin"] == ["ops"]
+        assert graph.children["ops"] == ["ops-audit"]
+        assert "not-chained" not in graph.roles
+
+    def test_multi_hop_chains(self):
+        graph = _graph()
+
+        assert graph.depth("ops") == 1
+        assert graph.depth("ops-audit-readonly") == 3
+        assert graph.chain("ops-audit-readonly") == [
+            "base-admin",
+            "ops",
+            "ops-audit",
+            "ops-audit-readonly",
+        ]
+        assert graph.chain("billing") == ["base-finance", "billing"]
+
+    def test_descendants(self):
+        graph = _graph()
+
+        assert graph.descendants("base-admin") == ["ops", "ops-audit", "ops-audit-readonly"]
+        assert graph.descendants("ops-audit") == ["ops-audit-readonly"]
+        assert graph.descendants("unknown") == []
+
+    def test_cycles_are_unresolvable(self):
+        graph = _graph()
+
+        assert graph.cycles == [["loop-a", "loop-b", "loop-a"]]
+        for profile in ["loop-a", "loop-b", "after-loop"]:
+            assert graph.depth(profile) is None
+            assert graph.chain(profile) is None
+        assert graph.descendants("loop-a") == []
+        assert graph.resolvable() == ["ops", "ops-audit", "ops-audit-readonly", "billing"]
+
+    def test_self_reference(self):
+        graph = _graph("[profile me]\nsource_profile = me\nrole_arn = arn:aws:iam::1:role/me\n")
+
+        assert graph.cycles == [["me", "me"]]
+        assert graph.resolvable() == []
+
+
+@pytest.mark.parametrize(
+    "role",
+    [
+        {"role_arn": "arn:aws:iam::111111111111:role/ops"},
+        {"role_arn": "arn:aws:iam::111111111111:role/ops", "role_session_name": "me"},
+        {
+            "role_arn": "arn:aws:iam::111111111111:role/ops",
+            "external_id": "ext",
+            "duration_seconds": "1800",
+        },
+    ],
+)
+def test_cli_cache_key_matches_botocore(role):
+    args = assume_role_args(role)
+    extra_args = {key: value for key, value in args.items() if key != "RoleArn"}
+
+    fetcher = AssumeRoleCredentialFetcher(
+        Mock(), Mock(), role["role_arn"], extra_args=extra_args, cache={}
+    )
+
+    assert cli_cache_key(args) == fetcher._cache_key
+
+
+class FakeStsClientFactory:
+    """Answer AssumeRole with credentials named after the role, recording which credentials
+    each call was made with."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, profile):
+        return self._client(f"profile:{profile}")
+
+    def with_credentials(self, credentials):
+        return self._client(credentials["AccessKeyId"])
+
+    def _client(self, caller):
+        def assume_role(RoleArn, RoleSessionName, **kwargs):
+            role_name = RoleArn.split("/")[-1]
+            with self.lock:
+                self.calls.append((caller, role_name, kwargs))
+            if role_name in self.failing:
+                raise ValueError(f"AccessDenied for {role_name}")
+            return {
+                "Credentials": {
+                    "AccessKeyId": f"ASIA{role_name.upper()}",
+                    "SecretAccessKey": "secret",
+                    "SessionToken": "token",
+                    "Expiration": datetime.now(timezone.utc) + timedelta(hours=1),
+                },
+                "AssumedRoleUser": {"Arn": RoleArn.replace(":iam:", ":sts:") + "/session"},
+            }
+
+        return Mock(assume_role=assume_role)
+
+
+class TestPrewarmChainedRoles:
+    def test_assumes_in_dependency_order(self, tmp_path):
+        graph = _graph()
+        factory = FakeStsClientFactory()
+        cache = JSONFileCache(str(tmp_path))
+
+        results = prewarm_chained_roles(graph, ["ops-audit-readonly", "billing"], factory, cache)
+
+        assert {profile: result["Status"] for profile, result in results.items()} == {
+            "ops": "assumed",
+            "ops-audit": "assumed",
+            "ops-audit-readonly": "assumed",
+            "billing": "assumed",
+        }
+        assert sorted(factory.calls) == [
+            ("ASIAAUDIT", "readonly", {"DurationSeconds": 1800}),
+            ("ASIAOPS", "audit", {"ExternalId": "audit-ext"}),
+            ("profile:base-admin", "ops", {}),
+            ("profile:base-finance", "billing", {}),
+        ]
+        response = cache[cli_cache_key(assume_role_args(graph.roles["ops-audit"]))]
+        assert response["Credentials"]["AccessKeyId"] == "ASIAAUDIT"
+        assert response["Credentials"]["AccountId"] == "222222222222"
+
+    def test_reuses_valid_cached_credentials(self, tmp_path):
+        graph = _graph()
+        cache = JSONFileCache(str(tmp_path))
+        prewarm_chained_roles(graph, ["ops-audit"], FakeStsClientFactory(), cache)
+        factory = FakeStsClientFactory()
+
+        results = prewarm_chained_roles(graph, ["ops-audit-readonly"], factory, cache)
+
+        assert [result["Status"] for result in results.values()] == ["cached", "cached", "assumed"]
+        assert factory.calls == [("ASIAAUDIT", "readonly", {"DurationSeconds": 1800})]
+
+        # Credentials expiring within 15 minutes are assumed again, like botocore does
+        later = datetime.now(timezone.utc) + timedelta(minutes=50)
+        factory = FakeStsClientFactory()
+        prewarm_chained_roles(graph, ["ops"], factory, cache, now=later)
+        assert factory.calls == [("profile:base-admin", "ops", {})]
+
+    def test_failure_skips_descendants(self, tmp_path):
+        graph = _graph()
+        factory = FakeStsClientFactory(failing=["ops"])
+
+        results = prewarm_chained_roles(
+            graph, graph.resolvable(), factory, JSONFileCache(str(tmp_path))
+        )
+
+        assert results["ops"] == {"Status": "failed", "Error": "AccessDenied for ops"}
+        assert results["ops-audit-readonly"] == {
+            "Status": "failed",
+            "Error": "source profile ops failed",
+        }
+        assert results["billing"]["Status"] == "assumed"
+        assert len(factory.calls) == 2
+
+    def test_mfa_profiles_are_not_assumed(self, tmp_path):
+        graph = _graph(
+            "[profile mfa]\nsource_profile = base\nrole_arn = arn:aws:iam::1:role/mfa\n"
+            "mfa_serial = arn:aws:iam::1:mfa/me\n"
+        )
+        factory = FakeStsClientFactory()
+
+        results = prewarm_chained_roles(graph, ["mfa"], factory, JSONFileCache(str(tmp_path)))
+
+        assert results["mfa"]["Status"] == "failed"
+        assert "MFA" in results["mfa"]["Error"]
+        assert factory.calls == []
+
+
+def test_botocore_uses_prewarmed_credentials(tmp_path, monkeypatch):
+    (tmp_path / "config").write_text(CONFIG)
+    (tmp_path / "credentials").write_text(
+        "[base-admin]\naws_access_key_id = ASIABASE\naws_secret_access_key = secret\n"
+    )
+    monkeypatch.setenv("AWS_CONFIG_FILE", str(tmp_path / "config"))
+    monkeypatch.setenv("AWS_SHARED_CREDENTIALS_FILE", str(tmp_path / "credentials"))
+    cache_dir = str(tmp_path / "cli" / "cache")
+    prewarm_chained_roles(
+        _graph(), ["ops-audit-readonly"], FakeStsClientFactory(), JSONFileCache(cache_dir)
+    )
+
+    # Set up the session like the AWS CLI does; no STS call may be made
+    session = botocore.session.Session(profile="ops-audit-readonly")
+    provider = session.get_component("credential_provider").get_provider("assume-role")
+    provider.cache = JSONFileCache(cache_dir)
+    with patch("botocore.client.BaseClient._make_api_call", side_effect=AssertionError):
+        credentials = session.get_credentials().get_frozen_credentials()
+
+    assert credentials.access_key == "ASIAREADONLY"
@@ -0,0 +1,213 @@
+import json
+import os
+import stat
+from datetime import datetime, timezone
+from unittest.mock import Mock, patch
+
+import pytest
+from click.testing import CliRunner
+
+from saml2awsmulti.aws_login import config_export, credential_process
+from saml2awsmulti.credential_process import (
+    CredentialCache,
+    cache_key,
+    credential_process_command,
+    fetch_role_credentials,
+    get_role_credentials,
+    to_credential_process_output,
+)
+from saml2awsmulti.file_io import get_aws_profiles
+from saml2awsmulti.saml2aws_helper import Saml2AwsHelper
+
+NOW = datetime(2030, 1, 1, tzinfo=timezone.utc).timestamp()
+ROLE_ARN = "arn:aws:iam::123456789012:role/dev"
+
+
+def _credentials(expires_in):
+    return {
+        "Version": 1,
+        "AccessKeyId": "ASIADEV",
+        "SecretAccessKey": "secret",
+        "SessionToken": "token",
+        "Expiration": datetime.fromtimestamp(NOW + expires_in, timezone.utc).isoformat(),
+    }
+
+
+def _helper():
+    helper = Saml2AwsHelper("config_file", None, False)
+    helper._uname, helper._upass = "testuser", "testpass"
+    return helper
+
+
+class TestCredentialCache:
+    def test_memory_and_disk(self, tmp_path):
+        cache_dir = tmp_path / "cache"
+        CredentialCache(str(cache_dir), clock=lambda: NOW).put("key", _credentials(3600))
+
+        assert CredentialCache(str(cache_dir), clock=lambda: NOW).get("key") == _credentials(3600)
+        assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
+        assert stat.S_IMODE(os.stat(cache_dir / "key.json").st_mode) == 0o600
+
+    def test_about_to_expire(self, tmp_path):
+        cache = CredentialCache(str(tmp_path), min_remaining=900, clock=lambda: NOW)
+        cache.put("key", _credentials(899))
+
+        assert cache.get("key") is None
+
+    def test_missing_or_invalid(self, tmp_path):
+        (tmp_path / "invalid.json").write_text("{not json")
+        cache = CredentialCache(str(tmp_path), clock=lambda: NOW)
+
+        assert cache.get("missing") is None
+        assert cache.get("invalid") is None
+
+
+class TestGetRoleCredentials:
+    def test_to_credential_process_output(self):
+        section = {
+            "aws_access_key_id": "ASIADEV",
+            "aws_secret_access_key": "secret",
+            "aws_session_token": "token",
+            "x_security_token_expires": "2030-01-01T11:00:00+10:00",
+        }
+
+        assert to_credential_process_output(section) == {
+            "Version": 1,
+            "AccessKeyId": "ASIADEV",
+            "SecretAccessKey": "secret",
+            "SessionToken": "token",
+            "Expiration": "2030-01-01T01:00:00+00:00",
+        }
+
+    def test_fetch_does_not_touch_shared_credentials(self, fake_saml2aws, tmp_path, monkeypatch):
+        monkeypatch.setenv("HOME", str(tmp_path))
+        fake_saml2aws(expires="2099-01-01T00:00:00Z")
+
+        credentials = fetch_role_credentials(_helper(), ROLE_ARN)
+
+        assert credentials["SecretAccessKey"] == "secret-credential-process"
+        assert credentials["Expiration"] == "2099-01-01T00:00:00+00:00"
+        assert not (tmp_path / ".aws" / "credentials").exists()
+
+    def test_fetch_failure(self, fake_saml2aws):
+        fake_saml2aws(login_returncodes={"credential-process": 1})
+
+        with pytest.raises(ValueError, match="return code 1"):
+            fetch_role_credentials(_helper(), ROLE_ARN)
+
+    @patch("saml2awsmulti.credential_process.fetch_role_credentials")
+    def test_served_from_cache_until_expiry(self, mock_fetch, tmp_path):
+        now = [NOW]
+        cache = CredentialCache(str(tmp_path), clock=lambda: now[0])
+        mock_fetch.return_value = _credentials(3600)
+
+        get_role_credentials(Mock(), ROLE_ARN, cache)
+        get_role_credentials(Mock(), ROLE_ARN, cache)
+        assert mock_fetch.call_count == 1
+
+        now[0] += 3600 - 899
+        get_role_credentials(Mock(), ROLE_ARN, cache)
+        assert mock_fetch.call_count == 2
+
+    def test_cache_key_includes_session_duration(self):
+        assert cache_key(ROLE_ARN) != cache_key(ROLE_ARN, "7200")
+
+
+class TestCredentialProcessCommand:
+    @patch("shutil.which", return_value="/usr/local/bin/awslogin")
+    def test_command(self, mock_which):
+        assert credential_process_command(ROLE_ARN, 3600) == (
+            "/usr/local/bin/awslogin credential-process --role "
+            "arn:aws:iam::123456789012:role/dev --session-duration 3600"
+        )
+
+    @patch("saml2awsmulti.aws_login.get_role_credentials")
+    def test_cli_prints_json_only(self, mock_get, tmp_path):
+        mock_get.return_value = _credentials(3600)
+
+        with patch("saml2awsmulti.aws_login.CREDENTIAL_PROCESS_CACHE_DIR", str(tmp_path)):
+            result = CliRunner().invoke(credential_process, ["--role", ROLE_ARN])
+
+        assert result.exit_code == 0
+        assert json.loads(result.stdout) == _credentials(3600)
+
+    @patch("saml2awsmulti.aws_login.get_role_credentials")
+    def test_cli_failure(self, mock_get, tmp_path):
+        mock_get.side_effect = ValueError("saml2aws login failed (return code 1)")
+
+        with patch("saml2awsmulti.aws_login.CREDENTIAL_PROCESS_CACHE_DIR", str(tmp_path)):
+            result = CliRunner().invoke(credential_process, ["--role", ROLE_ARN])
+
+        assert result.exit_code == 1
+        assert result.stdout == ""
+
+
+class TestConfigExport:
+    @patch("shutil.which", return_value="/usr/local/bin/awslogin")
+    def test_config_export(self, mock_which, tmp_path):
+        roles_file = tmp_path / "aws_login_roles.csv"
+        roles_file.write_text(
+            "arn:aws:iam::123456789012:role/dev,aws-01\n"
+            "arn:aws:iam::213456789012:role/test,aws-02\n"
+            "arn:aws:iam::313456789012:role/sandbox,aws-03\n"
+        )
+        config_file = tmp_path / "config"
+        config_file.write_text("# my settings\n[profile dev]\nregion = ap-southeast-2\n")
+
+        with (
+            patch("saml2awsmulti.aws_login.ALL_ROLES_FILE", str(roles_file)),
+            patch("saml2awsmulti.aws_login.AWS_CONF_FILE", str(config_file)),
+        ):
+            result = CliRunner().invoke(config_export, ["-x", "sandbox"])
+
+        assert result.exit_code == 0
+        config = get_aws_profiles(str(config_file))
+        assert config.sections() == ["profile dev", "profile test"]
+        assert config["profile dev"]["region"] == "ap-southeast-2"
+        assert config["profile test"]["credential_process"] == (
+            "/usr/local/bin/awslogin credential-process --role "
+            "arn:aws:iam::213456789012:role/test"
+        )
+        assert config_file.read_text().startswith("# my settings\n")
+
+    def test_config_export_invalid_regex(self, tmp_path):
+        roles_file = tmp_path / "aws_login_roles.csv"
+        roles_file.write_text("arn:aws:iam::123456789012:role/dev,aws-01\n")
+        config_file = tmp_path / "config"
+
+        with (
+            patch("saml2awsmulti.aws_login.ALL_ROLES_FILE", str(roles_file)),
+            patch("saml2awsmulti.aws_login.AWS_CONF_FILE", str(config_file)),
+        ):
+            result = CliRunner().invoke(config_export, ["-l", "re:("])
+
+        assert result.exit_code == 2
+        assert "invalid regular expression in 're:('" in result.output
+        assert not config_file.exists()
+
+    @patch("shutil.which", return_value="/usr/local/bin/awslogin")
+    def test_config_export_keeps_nested_settings(self, mock_which, tmp_path):
+        roles_file = tmp_path / "aws_login_roles.csv"
+        roles_file.write_text("arn:aws:iam::123456789012:role/dev,aws-01\n")
+        config_file = tmp_path / "config"
+        config_file.write_text(
+            "[profile dev]\n"
+            "region = ap-southeast-2\n"
+            "s3 =\n"
+            "    max_concurrent_requests = 20\n"
+            "    multipart_threshold = 64MB\n"
+        )
+
+        with (
+            patch("saml2awsmulti.aws_login.ALL_ROLES_FILE", str(roles_file)),
+            patch("saml2awsmulti.aws_login.AWS_CONF_FILE", str(config_file)),
+        ):
+            result = CliRunner().invoke(config_export, [])
+
+        assert result.exit_code == 0
+        config = get_aws_profiles(str(config_file))
+        assert set(config["profile dev"]) == {"region", "s3", "credential_process"}
+        assert config["profile dev"]["s3"] == (
+            "\nmax_concurrent_requests = 20\nmultipart_threshold = 64MB"
+        )
+        assert "s3 =\n    max_concurrent_requests = 20\n" in config_file.read_text()
@@ -0,0 +1,195 @@
+import os
+from unittest.mock import patch
+
+from saml2awsmulti import credentials_index
+from saml2awsmulti.credentials_index import (
+    ProfileEntry,
+    get_profile_entries,
+    index_filename,
+    is_expired,
+    load_index,
+    parse_expires,
+    read_profile,
+    scan_profiles,
+    split_fresh_profiles,
+)
+from saml2awsmulti.file_io import update_aws_profiles
+
+CREDENTIALS = (
+    b"[default]\n"
+    b"aws_access_key_id = a\n"
+    b"\n"
+    b"[dev]\n"
+    b"aws_access_key_id = b\n"
+    b"x_security_token_expires = 2000-01-01T00:00:00+00:00\n"
+    b"\n"
+    b"[test]\n"
+    b"aws_access_key_id = c\n"
+    b"x_security_token_expires = 2099-01-01T00:00:00Z\n"
+)
+
+
+def _cred_file(tmp_path, content=CREDENTIALS):
+    cred_file = tmp_path / "credentials"
+    cred_file.write_bytes(content)
+    return str(cred_file)
+
+
+class TestParseExpires:
+    def test_no_expiry(self):
+        assert parse_expires(None, "dev") is None
+        assert is_expired(ProfileEntry(0, None)) is False
+
+    def test_expired(self):
+        assert is_expired(ProfileEntry(0, parse_expires("2000-01-01T00:00:00+00:00", "dev")))
+
+    def test_not_expired(self):
+        assert not is_expired(ProfileEntry(0, parse_expires("2099-01-01T00:00:00+00:00", "dev")))
+
+    def test_invalid_expiry_format(self, caplog):
+        with caplog.at_level("WARNING"):
+            assert parse_expires("not-a-date", "dev") is None
+        assert "Could not parse expiry for profile 'dev': not-a-date" in caplog.text
+
+
+class TestScanProfiles:
+    def test_offsets_and_expiry(self):
+        entries = scan_profiles(CREDENTIALS.splitlines(keepends=True))
+
+        assert list(entries) == ["default", "dev", "test"]
+        assert entries["default"] == ProfileEntry(0, None)
+        assert entries["dev"].offset == CREDENTIALS.index(b"[dev]")
+        assert entries["dev"].expires == 946684800.0
+        assert entries["test"].offset == CREDENTIALS.index(b"[test]")
+        assert entries["test"].expires == 4070908800.0
+
+    def test_empty(self):
+        assert scan_profiles([]) == {}
+
+
+class TestGetProfileEntries:
+    def test_builds_and_reuses_index(self, tmp_path):
+        cred_file = _cred_file(tmp_path)
+        assert load_index(cred_file) is None
+
+        entries = get_profile_entries(cred_file)
+
+        assert os.path.exists(index_filename(cred_file))
+        assert load_index(cred_file) == entries
+
+    def test_rebuilds_stale_index(self, tmp_path):
+        cred_file = _cred_file(tmp_path)
+        get_profile_entries(cred_file)
+
+        # e.g. saml2aws login appending a profile
+        with open(cred_file, "ab") as f:
+            f.write(b"\n[new]\naws_access_key_id = d\n")
+
+        assert load_index(cred_file) is None
+        assert list(get_profile_entries(cred_file)) == ["default", "dev", "test", "new"]
+
+    def test_write_during_scan_leaves_index_stale(self, tmp_path):
+        cred_file = _cred_file(tmp_path)
+        scan = credentials_index.scan_profiles
+
+        def scan_while_saml2aws_writes(f):
+            entries = scan(f)
+            with open(cred_file, "ab") as f:
+                f.write(b"\n[new]\naws_access_key_id = d\n")
+            return entries
+
+        with patch.object(credentials_index, "scan_profiles", scan_while_saml2aws_writes):
+            assert list(get_profile_entries(cred_file)) == ["default", "dev", "test"]
+
+        assert load_index(cred_file) is None
+        assert list(get_profile_entries(cred_file)) == ["default", "dev", "test", "new"]
+
+    def test_write_after_update_leaves_index_stale(self, tmp_path):
+        cred_file = _cred_file(tmp_path)
+        replace = os.replace
+
+        def replace_then_saml2aws_writes(src, dst):
+            replace(src, dst)
+            if dst == os.path.realpath(cred_file):
+                with open(cred_file, "ab") as f:
+                    f.write(b"\n[new]\naws_access_key_id = d\n")
+
+        with patch("saml2awsmulti.file_io.os.replace", replace_then_saml2aws_writes):
+            update_aws_profiles(cred_file, {"dev": None})
+
+        assert load_index(cred_file) is None
+        assert list(get_profile_entries(cred_file)) == ["default", "test", "new"]
+
+    def test_index_is_written_atomically(self, tmp_path):
+        cred_file = _cred_file(tmp_path)
+
+        get_profile_entries(cred_file)
+
+        assert sorted(os.listdir(tmp_path)) == ["credentials", "credentials.index.json"]
+        assert os.stat(index_filename(cred_file)).st_mode & 0o777 == 0o600
+
+    def test_invalid_index_ignored(self, tmp_path):
+        cred_file = _cred_file(tmp_path)
+        with open(index_filename(cred_file), "w") as f:
+            f.write("{not json")
+
+        assert list(get_profile_entries(cred_file)) == ["default", "dev", "test"]
+
+    def test_no_credentials_file(self, tmp_path):
+        assert get_profile_entries(str(tmp_path / "credentials")) == {}
+
+    def test_update_aws_profiles_keeps_index_current(self, tmp_path):
+        cred_file = _cred_file(tmp_path)
+        get_profile_entries(cred_file)
+
+        update_aws_profiles(cred_file, {"dev": None, "new": {"aws_access_key_id": "d"}})
+
+        entries = load_index(cred_file)
+        assert list(entries) == ["default", "test", "new"]
+        with open(cred_file, "rb") as f:
+            assert entries == scan_profiles(f)
+
+
+class TestReadProfile:
+    def test_read_profile(self, tmp_path):
+        cred_file = _cred_file(tmp_path)
+        entries = get_profile_entries(cred_file)
+
+        assert read_profile(cred_file, "dev", entries["dev"]) == {
+            "aws_access_key_id": "b",
+            "x_security_token_expires": "2000-01-01T00:00:00+00:00",
+        }
+        assert read_profile(cred_file, "test", entries["test"])["aws_access_key_id"] == "c"
+
+    def test_moved_section(self, tmp_path):
+        cred_file = _cred_file(tmp_path)
+        entries = get_profile_entries(cred_file)
+        _cred_file(tmp_path, b"[other]\n" + CREDENTIALS)
+
+        assert read_profile(cred_file, "dev", entries["dev"]) is None
+
+
+class TestSplitFreshProfiles:
+    def test_split(self):
+        now = 1_000_000
+        entries = {
+            "fresh": ProfileEntry(0, now + 3600),
+            "expiring": ProfileEntry(10, now + 600),
+            "expired": ProfileEntry(20, now - 1),
+            "no_expiry": ProfileEntry(30, None),
+        }
+        profiles = ["missing", "expiring", "fresh", "expired", "no_expiry"]
+
+        stale, fresh = split_fresh_profiles(entries, profiles, 900, now=now)
+
+        assert stale == ["missing", "expiring", "expired", "no_expiry"]
+        assert fresh == {"fresh": now + 3600}
+
+    def test_zero_min_remaining(self):
+        now = 1_000_000
+        entries = {"dev": ProfileEntry(0, now + 1), "test": ProfileEntry(10, now - 1)}
+
+        assert split_fresh_profiles(entries, ["dev", "test"], 0, now=now) == (
+            ["test"],
+            {"dev": now + 1},
+        )
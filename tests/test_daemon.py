@@ -0,0 +1,280 @@
+import json
+from datetime import datetime, timezone
+from unittest.mock import Mock, patch
+
+from click.testing import CliRunner
+
+from saml2awsmulti.aws_login import daemon
+from saml2awsmulti.daemon import CredentialRefreshDaemon, ExpiryScheduler
+from saml2awsmulti.file_io import update_aws_profiles
+from saml2awsmulti.login_executor import LoginResult, run_logins
+from saml2awsmulti.saml2aws_helper import Saml2AwsHelper
+
+START = 1_900_000_000.0  # 2030-03-17
+
+
+class FakeClock:
+    def __init__(self, now=START):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def _write_expiries(cred_file, expiries):
+    update_aws_profiles(
+        str(cred_file),
+        {
+            profile: {"aws_access_key_id": "ASIA", "x_security_token_expires": _iso(expires)}
+            for profile, expires in expiries.items()
+        },
+    )
+
+
+class FakeRefresh:
+    """Log in by writing credentials valid for `lifetime` seconds from the clock's time."""
+
+    def __init__(self, cred_file, clock, lifetime=3600, failing=(), error=None):
+        self.cred_file = cred_file
+        self.clock = clock
+        self.lifetime = lifetime
+        self.failing = set(failing)
+        self.error = error
+        self.batches = []
+
+    def __call__(self, profiles):
+        self.batches.append((self.clock(), list(profiles)))
+        ok = [p for p in profiles if p not in self.failing]
+        _write_expiries(self.cred_file, {p: self.clock() + self.lifetime for p in ok})
+        return [
+            LoginResult(p, None, 1, self.error) if p in self.failing else LoginResult(p, None, 0)
+            for p in profiles
+        ]
+
+
+class TestExpiryScheduler:
+    def test_pops_in_expiry_order(self):
+        scheduler = ExpiryScheduler()
+        scheduler.schedule("c", 30)
+        scheduler.schedule("a", 10)
+        scheduler.schedule("b", 20)
+
+        assert scheduler.next_due() == 10
+        assert scheduler.pop_due(20) == ["a", "b"]
+        assert scheduler.pop_due(25) == []
+        assert len(scheduler) == 1
+
+    def test_reschedule_supersedes(self):
+        scheduler = ExpiryScheduler()
+        scheduler.schedule("a", 10)
+        scheduler.schedule("b", 20)
+        scheduler.schedule("a", 30)
+
+        assert scheduler.next_due() == 20
+        assert scheduler.pop_due(100) == ["b", "a"]
+        assert scheduler.next_due() is None
+        assert len(scheduler) == 0
+
+
+class TestCredentialRefreshDaemon:
+    def test_refreshes_before_expiry(self, tmp_path):
+        cred_file = tmp_path / "credentials"
+        clock = FakeClock()
+        _write_expiries(cred_file, {"dev": START + 3600, "test": START + 7200})
+        refresh = FakeRefresh(cred_file, clock)
+
+        refresh_daemon = CredentialRefreshDaemon(
+            refresh, ["dev", "test"], str(cred_file), 600, 0, clock=clock, sleep=clock.sleep
+        )
+        refresh_daemon.run(until=START + 7200)
+
+        assert refresh.batches == [
+            (START + 3000, ["dev"]),
+            (START + 6000, ["dev"]),
+            (START + 6600, ["test"]),
+        ]
+        assert all(s <= 60 for s in clock.sleeps)
+
+    def test_coalesces_profiles_due_close_together(self, tmp_path):
+        cred_file = tmp_path / "credentials"
+        clock = FakeClock()
+        _write_expiries(
+            cred_file, {"dev": START + 1000, "test": START + 1200, "prod": START + 5000}
+        )
+        refresh = FakeRefresh(cred_file, clock)
+
+        refresh_daemon = CredentialRefreshDaemon(
+            refresh,
+            ["dev", "test", "prod"],
+            str(cred_file),
+            600,
+            300,
+            clock=clock,
+            sleep=clock.sleep,
+        )
+        refresh_daemon.run(until=START + 1000)
+
+        assert refresh.batches == [(START + 400, ["dev", "test"])]
+        assert refresh_daemon.next_due() == START + 400 + 3600 - 600
+
+    def test_missing_profile_refreshed_immediately(self, tmp_path):
+        cred_file = tmp_path / "credentials"
+        clock = FakeClock()
+        refresh = FakeRefresh(cred_file, clock)
+
+        refresh_daemon = CredentialRefreshDaemon(
+            refresh, ["dev"], str(cred_file), clock=clock, sleep=clock.sleep
+        )
+        refresh_daemon.run_once()
+
+        assert refresh.batches == [(START, ["dev"])]
+
+    def test_transient_failure_retried_with_backoff(self, tmp_path):
+        cred_file = tmp_path / "credentials"
+        clock = FakeClock()
+        refresh = FakeRefresh(
+            cred_file,
+            clock,
+            failing=["dev"],
+            error="Error authenticating to IdP.: 429 Too Many Requests",
+        )
+
+        refresh_daemon = CredentialRefreshDaemon(
+            refresh,
+            ["dev"],
+            str(cred_file),
+            retry_delay=60,
+            max_retry_delay=300,
+            clock=clock,
+            sleep=clock.sleep,
+        )
+        refresh_daemon.run(until=START + 1000)
+
+        offsets = [START, START + 60, START + 180, START + 420, START + 720]
+        assert [b[0] for b in refresh.batches] == offsets
+
+        # A successful refresh resets the backoff
+        refresh.failing.clear()
+        refresh_daemon.run(until=START + 1100)
+        refresh.failing.add("dev")
+        clock.now = refresh_daemon.next_due()
+        refresh_daemon.run_once()
+        assert refresh_daemon.next_due() == clock.now + 60
+
+    def test_failed_profile_dropped(self, tmp_path):
+        cred_file = tmp_path / "credentials"
+        clock = FakeClock()
+        refresh = FakeRefresh(cred_file, clock, failing=["dev"], error="Error logging in")
+
+        refresh_daemon = CredentialRefreshDaemon(
+            refresh, ["dev", "test"], str(cred_file), clock=clock, sleep=clock.sleep
+        )
+        refresh_daemon.run(until=START + 7200)
+
+        assert refresh.batches[0] == (START, ["dev", "test"])
+        assert all(batch == ["test"] for _, batch in refresh.batches[1:])
+
+    def test_refresh_exception_stops(self, tmp_path, caplog):
+        clock = FakeClock()
+        refresh = Mock(side_effect=ValueError("Failed to retrieve roles with saml2aws."))
+
+        refresh_daemon = CredentialRefreshDaemon(
+            refresh, ["dev"], str(tmp_path / "credentials"), clock=clock, sleep=clock.sleep
+        )
+        refresh_daemon.run(until=START + 7200)
+
+        assert refresh.call_count == 1
+        assert refresh_daemon.next_due() is None
+        assert "Every refresh failed; stopping" in caplog.text
+
+    def test_rejected_password_is_not_retried(self, fake_saml2aws, tmp_path):
+        cred_file = tmp_path / "credentials"
+        calls_log = tmp_path / "calls.jsonl"
+        fake_saml2aws(calls_log=str(calls_log), failure_rate=1)
+        clock = FakeClock()
+        helper = Saml2AwsHelper("config_file", None, False)
+        helper._uname, helper._upass = "testuser", "wrongpass"
+        profile_rolearn_dict = {
+            "dev": "arn:aws:iam::123456789012:role/dev",
+            "test": "arn:aws:iam::213456789012:role/test",
+        }
+
+        refresh_daemon = CredentialRefreshDaemon(
+            lambda batch: run_logins(helper, profile_rolearn_dict, batch, str(cred_file)),
+            ["dev", "test"],
+            str(cred_file),
+            clock=clock,
+            sleep=clock.sleep,
+        )
+        refresh_daemon.run(until=START + 86400)
+
+        calls = [json.loads(line) for line in calls_log.read_text().splitlines()]
+        # One failed IdP login per profile, then the daemon stops
+        assert [c["args"][0] for c in calls].count("login") == 2
+        assert refresh_daemon.next_due() is None
+
+    def test_short_lived_credentials_do_not_busy_loop(self, tmp_path):
+        cred_file = tmp_path / "credentials"
+        clock = FakeClock()
+        refresh = FakeRefresh(cred_file, clock, lifetime=300)
+
+        refresh_daemon = CredentialRefreshDaemon(
+            refresh, ["dev"], str(cred_file), 600, clock=clock, sleep=clock.sleep
+        )
+        refresh_daemon.run(until=START + 100)
+
+        assert len(refresh.batches) == 2
+
+    def test_with_fake_saml2aws(self, fake_saml2aws, tmp_path):
+        cred_file = tmp_path / "credentials"
+        calls_log = tmp_path / "calls.jsonl"
+        fake_saml2aws(calls_log=str(calls_log), expires=_iso(START + 3600))
+        clock = FakeClock()
+        helper = Saml2AwsHelper("config_file", None, False)
+        helper._uname, helper._upass = "testuser", "testpass"
+        profile_rolearn_dict = {
+            "dev": "arn:aws:iam::123456789012:role/dev",
+            "test": "arn:aws:iam::213456789012:role/test",
+        }
+
+        refresh_daemon = CredentialRefreshDaemon(
+            lambda batch: run_logins(helper, profile_rolearn_dict, batch, str(cred_file), 2),
+            ["dev", "test"],
+            str(cred_file),
+            clock=clock,
+            sleep=clock.sleep,
+        )
+        results = refresh_daemon.run_once()
+
+        assert [r.returncode for r in results] == [0, 0]
+        assert len(calls_log.read_text().splitlines()) == 2
+        assert refresh_daemon.next_due() == START + 3000
+
+
+class TestDaemonCommand:
+    @patch("saml2awsmulti.aws_login.CredentialRefreshDaemon")
+    @patch("saml2awsmulti.aws_login.Saml2AwsHelper")
+    @patch("saml2awsmulti.aws_login.load_cached_profile_rolearn_dict")
+    @patch("saml2awsmulti.aws_login.exists", return_value=True)
+    def test_daemon(self, mock_exists, mock_load, mock_helper, mock_daemon, caplog):
+        mock_load.return_value = {"dev": "arn:aws:iam::123456789012:role/dev"}
+        mock_daemon.return_value.run.side_effect = KeyboardInterrupt
+
+        with caplog.at_level("INFO"):
+            result = CliRunner().invoke(daemon, ["-p", "dev", "-p", "unknown"])
+
+        assert result.exit_code == 0
+        assert "Skipped unknown: not found in the cached roles" in caplog.text
+        mock_helper.return_value.prepare.assert_called_once()
+        assert mock_daemon.call_args.args[1] == ["dev"]
+        assert mock_daemon.call_args.kwargs["refresh_margin"] == 600
+        assert "Stopped." in caplog.text
@@ -1,12 +1,17 @@
 import os
 import tempfile
+import threading
 from configparser import ConfigParser
 
+import pytest
+
 from saml2awsmulti.file_io import (
+    atomic_write,
     get_aws_profiles,
     load_saml2aws_config,
     read_csv,
     read_lines_from_file,
+    update_aws_profiles,
     write_aws_profiles,
     write_csv,
 )
@@ -320,3 +325,119 @@ class TestWriteAwsProfiles:
                 assert content == ""
         finally:
             os.unlink(temp_file)
+
+
+CREDENTIALS = """# Managed by awslogin
+
+[default]
+aws_access_key_id = a
+
+# Development account
+[dev]
+# rotated daily
+aws_access_key_id = b
+x_security_token_expires = 2000-01-01T00:00:00+00:00
+
+[test]
+aws_access_key_id = c
+"""
+
+
+class TestUpdateAwsProfiles:
+    @pytest.fixture
+    def cred_file(self, tmp_path):
+        cred_file = tmp_path / "credentials"
+        cred_file.write_text(CREDENTIALS)
+        cred_file.chmod(0o600)
+        return cred_file
+
+    def test_replace_section_keeps_rest_of_file(self, cred_file):
+        update_aws_profiles(str(cred_file), {"dev": {"aws_access_key_id": "B"}})
+
+        assert cred_file.read_text() == CREDENTIALS.replace(
+            "aws_access_key_id = b\nx_security_token_expires = 2000-01-01T00:00:00+00:00\n",
+            "aws_access_key_id = B\n",
+        )
+
+    def test_remove_section_with_its_comments(self, cred_file):
+        update_aws_profiles(str(cred_file), {"dev": None})
+
+        assert cred_file.read_text() == (
+            "# Managed by awslogin\n\n"
+            "[default]\naws_access_key_id = a\n\n"
+            "[test]\naws_access_key_id = c\n"
+        )
+
+    def test_add_section_at_the_end(self, cred_file):
+        update_aws_profiles(str(cred_file), {"new": {"aws_access_key_id": "d"}})
+
+        assert cred_file.read_text() == CREDENTIALS + "\n[new]\naws_access_key_id = d\n\n"
+        assert get_aws_profiles(str(cred_file)).sections() == ["default", "dev", "test", "new"]
+
+    def test_no_change_does_not_rewrite(self, cred_file):
+        mtime_ns = cred_file.stat().st_mtime_ns
+
+        update_aws_profiles(str(cred_file), {"missing": None})
+
+        assert cred_file.stat().st_mtime_ns == mtime_ns
+
+    def test_keeps_file_mode(self, cred_file):
+        cred_file.chmod(0o640)
+
+        update_aws_profiles(str(cred_file), {"dev": None})
+
+        assert cred_file.stat().st_mode & 0o777 == 0o640
+
+    def test_new_file_is_private(self, tmp_path):
+        cred_file = tmp_path / "aws" / "credentials"
+
+        update_aws_profiles(str(cred_file), {"dev": {"aws_access_key_id": "b"}})
+
+        assert cred_file.read_text() == "[dev]\naws_access_key_id = b\n\n"
+        assert cred_file.stat().st_mode & 0o777 == 0o600
+
+    def test_concurrent_updates(self, cred_file):
+        threads = [
+            threading.Thread(
+                target=update_aws_profiles,
+                args=(str(cred_file), {f"p{i}": {"aws_access_key_id": str(i)}}),
+            )
+            for i in range(20)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        sections = get_aws_profiles(str(cred_file)).sections()
+        assert sorted(sections) == sorted(["default", "dev", "test"] + [f"p{i}" for i in range(20)])
+
+
+class TestAtomicWrite:
+    def test_failed_write_keeps_original(self, tmp_path):
+        filename = tmp_path / "credentials"
+        filename.write_text("original")
+
+        with pytest.raises(RuntimeError):
+            with atomic_write(str(filename)) as f:
+                f.write("partial")
+                raise RuntimeError("boom")
+
+        assert filename.read_text() == "original"
+        assert os.listdir(tmp_path) == ["credentials"]
+
+    def test_symlink_target_is_replaced(self, tmp_path):
+        (tmp_path / "dotfiles").mkdir()
+        target = tmp_path / "dotfiles" / "credentials"
+        target.write_text("original")
+        target.chmod(0o640)
+        link = tmp_path / "credentials"
+        link.symlink_to(target)
+
+        with atomic_write(str(link)) as f:
+            f.write("updated")
+
+        assert link.is_symlink()
+        assert target.read_text() == "updated"
+        assert target.stat().st_mode & 0o777 == 0o640
+        assert sorted(os.listdir(tmp_path / "dotfiles")) == ["credentials"]
@@ -0,0 +1,53 @@
+from saml2awsmulti.fuzzy_filter import FuzzyFilter
+
+TEXTS = [
+    "dev-admin aws-dev (123456789012)",
+    "prd-admin aws-prd (210987654321)",
+    "prd-readonly aws-prd (210987654321)",
+    "sandbox aws-sbx (313456789012)",
+]
+
+
+def _search(fuzzy_filter, query):
+    return [TEXTS[i] for i in fuzzy_filter.search(query)]
+
+
+class TestFuzzyFilter:
+    def test_empty_query_matches_all(self):
+        assert _search(FuzzyFilter(TEXTS), "") == TEXTS
+
+    def test_subsequence(self):
+        fuzzy_filter = FuzzyFilter(TEXTS)
+
+        assert _search(fuzzy_filter, "prdro") == [TEXTS[2]]
+        assert _search(fuzzy_filter, "dvadm") == [TEXTS[0]]
+        assert _search(fuzzy_filter, "zzz") == []
+        assert _search(fuzzy_filter, "adm!") == []
+
+    def test_case_insensitive(self):
+        assert _search(FuzzyFilter(TEXTS), "PRD-Read") == [TEXTS[2]]
+
+    def test_substring_matches_rank_first(self):
+        fuzzy_filter = FuzzyFilter(["a-x-b", "xab", "ab"])
+
+        assert fuzzy_filter.search("ab") == [1, 2, 0]
+
+    def test_account_alias_and_id(self):
+        fuzzy_filter = FuzzyFilter(TEXTS)
+
+        assert _search(fuzzy_filter, "aws-prd") == [TEXTS[1], TEXTS[2]]
+        assert _search(fuzzy_filter, "2109") == [TEXTS[1], TEXTS[2]]
+
+    def test_narrowing_and_backspace(self):
+        # Typing narrows the previous matches; the results must not depend on the history
+        fuzzy_filter = FuzzyFilter(TEXTS)
+
+        for query in ["p", "pr", "prd", "prd-r", "prd-", "pr", "d", "dev", ""]:
+            assert fuzzy_filter.search(query) == FuzzyFilter(TEXTS).search(query), query
+
+    def test_many_texts(self):
+        texts = [f"role-{i}" for i in range(10_000)]
+        fuzzy_filter = FuzzyFilter(texts)
+
+        assert fuzzy_filter.search("role-9999") == [9999]
+        assert fuzzy_filter.search("e-999")[:11] == [999] + list(range(9990, 10_000))
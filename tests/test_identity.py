@@ -0,0 +1,93 @@
+import pytest
+from botocore.stub import Stubber
+
+from saml2awsmulti.identity import StsClientFactory, get_caller_identities
+
+
+def _identity(profile):
+    return {
+        "UserId": f"AROA:{profile}",
+        "Account": "123456789012",
+        "Arn": f"arn:aws:sts::123456789012:assumed-role/{profile}/user",
+    }
+
+
+class StubbedStsClientFactory(StsClientFactory):
+    """Answer GetCallerIdentity with _identity(profile), or an error for `failing` profiles."""
+
+    def __init__(self, failing=()):
+        super().__init__(region="us-east-1")
+        self.failing = set(failing)
+        self.stubbers = []
+
+    def __call__(self, profile):
+        sts_client = super().__call__(profile)
+        stubber = Stubber(sts_client)
+        if profile in self.failing:
+            stubber.add_client_error("get_caller_identity", "ExpiredToken", "Token expired")
+        else:
+            stubber.add_response("get_caller_identity", _identity(profile), {})
+        stubber.activate()
+        self.stubbers.append(stubber)
+        return sts_client
+
+
+@pytest.fixture
+def aws_profiles(tmp_path, monkeypatch):
+    cred_file = tmp_path / "credentials"
+    cred_file.write_text(
+        "".join(
+            f"[{profile}]\naws_access_key_id = AKIA{profile}\naws_secret_access_key = secret\n"
+            for profile in ("dev", "tst", "prd")
+        )
+    )
+    monkeypatch.setenv("AWS_SHARED_CREDENTIALS_FILE", str(cred_file))
+    monkeypatch.setenv("AWS_CONFIG_FILE", str(tmp_path / "config"))
+    return ["dev", "tst", "prd"]
+
+
+class TestStsClientFactory:
+    def test_available_profiles(self, aws_profiles):
+        assert StsClientFactory().available_profiles() == aws_profiles
+
+    def test_sessions_share_loader(self, aws_profiles):
+        factory = StsClientFactory(region="us-east-1")
+
+        dev, tst = factory("dev"), factory("tst")
+
+        assert dev._loader is tst._loader
+        assert dev._get_credentials().access_key == "AKIAdev"
+        assert tst._get_credentials().access_key == "AKIAtst"
+
+
+class TestGetCallerIdentities:
+    def test_all_succeed(self, aws_profiles):
+        factory = StubbedStsClientFactory()
+
+        identities = list(get_caller_identities(aws_profiles, factory, max_workers=3))
+
+        assert sorted(identity["Profile"] for identity in identities) == sorted(aws_profiles)
+        for identity in identities:
+            latency = identity.pop("LatencyMs")
+            assert latency >= 0
+            assert identity == {"Profile": identity["Profile"], **_identity(identity["Profile"])}
+        for stubber in factory.stubbers:
+            stubber.assert_no_pending_responses()
+
+    def test_failure(self, aws_profiles):
+        factory = StubbedStsClientFactory(failing=["tst"])
+
+        identities = {
+            identity["Profile"]: identity
+            for identity in get_caller_identities(aws_profiles, factory)
+        }
+
+        assert "Token expired" in identities["tst"]["Error"]
+        assert "Arn" not in identities["tst"]
+        assert identities["dev"]["Arn"] == _identity("dev")["Arn"]
+
+    def test_unknown_profile(self, aws_profiles):
+        identities = list(get_caller_identities(["unknown"], StubbedStsClientFactory()))
+
+        assert identities[0]["Profile"] == "unknown"
+        assert "unknown" in identities[0]["Error"]
@@ -0,0 +1,143 @@
+import os
+import tempfile
+import threading
+from unittest.mock import Mock
+
+from saml2awsmulti.file_io import get_aws_profiles, update_aws_profiles
+from saml2awsmulti.login_executor import LoginResult, log_login_summary, run_logins
+
+PROFILE_ROLEARN_DICT = {
+    "dev": "arn:aws:iam::123456789012:role/dev",
+    "test": "arn:aws:iam::213456789012:role/test",
+    "prod": "arn:aws:iam::313456789012:role/prod",
+}
+
+
+def _fake_login(role_arn, profile_name, credentials_file=None, concurrency=None):
+    """Mimic saml2aws writing a profile into the (private) credentials file."""
+    with open(credentials_file, "w") as f:
+        f.write(f"[{profile_name}]\naws_access_key_id = key-{profile_name}\n")
+    return 0
+
+
+class TestRunLogins:
+    def test_sequential(self, tmp_path):
+        helper = Mock()
+        helper.run_saml2aws_login.side_effect = _fake_login
+        cred_file = str(tmp_path / "credentials")
+
+        results = run_logins(helper, PROFILE_ROLEARN_DICT, ["dev", "test"], cred_file, parallel=1)
+
+        assert results == [
+            LoginResult("dev", PROFILE_ROLEARN_DICT["dev"], 0),
+            LoginResult("test", PROFILE_ROLEARN_DICT["test"], 0),
+        ]
+        assert get_aws_profiles(cred_file).sections() == ["dev", "test"]
+        helper.prepare.assert_not_called()
+
+    def test_sequential_does_not_lose_concurrent_updates(self, tmp_path):
+        cred_file = str(tmp_path / "credentials")
+        update_aws_profiles(cred_file, {"old": {"aws_access_key_id": "old"}})
+
+        def login(role_arn, profile_name, credentials_file=None, concurrency=None):
+            # e.g. `awslogin clean` rewriting the credentials file while saml2aws runs
+            update_aws_profiles(cred_file, {"old": None, "other": {"aws_access_key_id": "o"}})
+            return _fake_login(role_arn, profile_name, credentials_file)
+
+        helper = Mock()
+        helper.run_saml2aws_login.side_effect = login
+
+        run_logins(helper, PROFILE_ROLEARN_DICT, ["dev"], cred_file)
+
+        assert helper.run_saml2aws_login.call_args.kwargs["credentials_file"] != cred_file
+        assert get_aws_profiles(cred_file).sections() == ["other", "dev"]
+
+    def test_parallel_merges_private_credentials(self):
+        helper = Mock()
+        helper.run_saml2aws_login.side_effect = _fake_login
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cred_file = os.path.join(temp_dir, "credentials")
+            with open(cred_file, "w") as f:
+                f.write("[default]\naws_access_key_id = default_key\n")
+
+            results = run_logins(
+                helper, PROFILE_ROLEARN_DICT, ["dev", "test", "prod"], cred_file, parallel=3
+            )
+
+            config = get_aws_profiles(cred_file)
+            assert config["default"]["aws_access_key_id"] == "default_key"
+            for profile in ["dev", "test", "prod"]:
+                assert config[profile]["aws_access_key_id"] == f"key-{profile}"
+
+        helper.prepare.assert_called_once()
+        assert [r.profile_name for r in results] == ["dev", "test", "prod"]
+        assert all(r.returncode == 0 for r in results)
+        private_files = {c.kwargs["credentials_file"] for c in helper.run_saml2aws_login.mock_calls}
+        assert len(private_files) == 3
+
+    def test_parallel_runs_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def login(role_arn, profile_name, credentials_file=None, concurrency=None):
+            barrier.wait()  # Only passes if both logins are in flight at the same time
+            return _fake_login(role_arn, profile_name, credentials_file)
+
+        helper = Mock()
+        helper.run_saml2aws_login.side_effect = login
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            results = run_logins(
+                helper,
+                PROFILE_ROLEARN_DICT,
+                ["dev", "test"],
+                os.path.join(temp_dir, "credentials"),
+                parallel=2,
+            )
+
+        assert all(r.returncode == 0 for r in results)
+
+    def test_parallel_failure_not_merged(self):
+        def login(role_arn, profile_name, credentials_file=None, concurrency=None):
+            if profile_name == "test":
+                return 1
+            if profile_name == "prod":
+                raise RuntimeError("boom")
+            return _fake_login(role_arn, profile_name, credentials_file)
+
+        helper = Mock()
+        helper.run_saml2aws_login.side_effect = login
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cred_file = os.path.join(temp_dir, "credentials")
+            results = run_logins(
+                helper, PROFILE_ROLEARN_DICT, ["dev", "test", "prod"], cred_file, parallel=2
+            )
+            config = get_aws_profiles(cred_file)
+
+        assert config.sections() == ["dev"]
+        assert [r.returncode for r in results] == [0, 1, None]
+        assert results[2].error == "boom"
+
+
+class TestLogLoginSummary:
+    def test_summary(self, caplog):
+        results = [
+            LoginResult("dev", PROFILE_ROLEARN_DICT["dev"], 0),
+            LoginResult("test", PROFILE_ROLEARN_DICT["test"], 1),
+        ]
+
+        with caplog.at_level("INFO"):
+            log_login_summary(results)
+
+        assert "Logged in 1/2 role(s)" in caplog.text
+        assert "test: failed (return code 1)" in caplog.text
+
+    def test_summary_skipped(self, caplog):
+        with caplog.at_level("INFO"):
+            log_login_summary(
+                [LoginResult("dev", PROFILE_ROLEARN_DICT["dev"], 0)], ["test", "prod"]
+            )
+
+        assert "Logged in 1/1 role(s)" in caplog.text
+        assert "Skipped 2 role(s) with fresh credentials: test, prod" in caplog.text
@@ -0,0 +1,72 @@
+import click
+import pytest
+
+from saml2awsmulti.matcher import KeywordMatcher
+
+
+class TestKeywordMatcher:
+    def test_no_keywords(self):
+        matcher = KeywordMatcher([])
+        assert not matcher
+        assert matcher.is_literal is True
+        assert matcher.matches("dev") is False
+
+    @pytest.mark.parametrize(
+        "name, expected",
+        [
+            ("dev", True),
+            ("team-dev-admin", True),
+            ("test", True),
+            ("tst", False),
+            ("prod", False),
+            ("DEV", False),
+        ],
+    )
+    def test_substring_keywords(self, name, expected):
+        matcher = KeywordMatcher(["dev", "test", "tes"])
+        assert matcher.is_literal is True
+        assert matcher.matches(name) is expected
+
+    def test_keywords_sharing_prefix(self):
+        # "dev" ends inside "devops"; both must still match on their own
+        matcher = KeywordMatcher(["devops", "dev", "deploy"])
+        assert matcher.matches("x-dev") is True
+        assert matcher.matches("x-depl") is False
+        assert matcher.matches("x-deploy") is True
+
+    def test_special_characters_are_literal(self):
+        matcher = KeywordMatcher(["a.b", "c+d"])
+        assert matcher.matches("xa.by") is True
+        assert matcher.matches("xaxby") is False
+        assert matcher.matches("c+d") is True
+
+    def test_empty_keyword_matches_everything(self):
+        assert KeywordMatcher([""]).matches("anything") is True
+
+    def test_glob_keywords(self):
+        matcher = KeywordMatcher(["*-dev", "admin-?"])
+        assert matcher.is_literal is False
+        assert matcher.matches("team-dev") is True
+        assert matcher.matches("team-dev-admin") is False
+        assert matcher.matches("admin-1") is True
+        assert matcher.matches("admin-12") is False
+
+    def test_regex_keywords(self):
+        matcher = KeywordMatcher(["re:^(dev|tst)-[0-9]+$"])
+        assert matcher.is_literal is False
+        assert matcher.matches("dev-01") is True
+        assert matcher.matches("prd-01") is False
+
+    def test_invalid_regex_keyword(self):
+        with pytest.raises(click.BadParameter, match="invalid regular expression in 're:\\('"):
+            KeywordMatcher(["dev", "re:("])
+
+    def test_mixed_keywords(self):
+        matcher = KeywordMatcher(["prod", "*-dev", "re:^tst"])
+        assert matcher.literals == ["prod"]
+        assert [matcher.matches(n) for n in ["a-prod-b", "x-dev", "tst-1", "dev-x"]] == [
+            True,
+            True,
+            True,
+            False,
+        ]
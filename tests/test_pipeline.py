@@ -0,0 +1,87 @@
+import threading
+from unittest.mock import Mock, patch
+
+from saml2awsmulti.pipeline import (
+    WarmupResult,
+    get_warmup_result,
+    reconcile_selection,
+    start_warmup,
+)
+
+ROLES = [
+    ("arn:aws:iam::123456789012:role/dev", "aws-01"),
+    ("arn:aws:iam::213456789012:role/test", "aws-02"),
+]
+
+
+class TestStartWarmup:
+    def test_runs_in_background(self):
+        release = threading.Event()
+        helper = Mock()
+        helper.run_saml2aws_list_roles.side_effect = lambda: release.wait(5) and ROLES
+
+        future = start_warmup(helper, refresh_roles=True)
+
+        # The caller is not blocked while saml2aws is still running
+        assert not future.done()
+        release.set()
+        result = get_warmup_result(future)
+        helper.prepare.assert_called_once()
+        assert result.rolearn_alias_list == ROLES
+        assert result.saml_assertion is None
+
+    def test_fetch_saml_assertion(self):
+        helper = Mock()
+        helper.run_saml2aws_list_roles.return_value = ROLES
+        helper.run_saml2aws_get_saml_assertion.return_value = "assertion"
+
+        result = get_warmup_result(start_warmup(helper, True, ROLES[0][0]))
+
+        assert result.rolearn_alias_list == ROLES
+        assert result.saml_assertion == "assertion"
+        helper.run_saml2aws_get_saml_assertion.assert_called_once_with(ROLES[0][0])
+
+    def test_probe_only(self):
+        helper = Mock()
+
+        result = get_warmup_result(start_warmup(helper, False))
+
+        helper.prepare.assert_called_once()
+        assert result == WarmupResult(None, None, result.fetched_at)
+
+    def test_failure(self, caplog):
+        helper = Mock()
+        helper.run_saml2aws_list_roles.side_effect = ValueError("Failed to retrieve roles")
+
+        with caplog.at_level("WARNING"):
+            result = get_warmup_result(start_warmup(helper, True))
+
+        assert result == WarmupResult(None, None, None)
+        assert "Failed to retrieve roles" in caplog.text
+
+
+class TestGetWarmupResult:
+    @patch("saml2awsmulti.pipeline.time.monotonic")
+    def test_drops_stale_saml_assertion(self, mock_monotonic):
+        mock_monotonic.return_value = 1000
+        future = Mock()
+        future.result.return_value = WarmupResult(ROLES, "assertion", 100)
+
+        result = get_warmup_result(future)
+
+        assert result.saml_assertion is None
+        assert result.rolearn_alias_list == ROLES
+
+
+class TestReconcileSelection:
+    def test_reconcile(self, caplog):
+        cached = {"dev": "arn:aws:iam::123456789012:role/dev", "old": "arn:old"}
+        refreshed = {"dev": "arn:aws:iam::123456789012:role/dev", "new": "arn:new"}
+
+        with caplog.at_level("INFO"):
+            profile_rolearn_dict, selected = reconcile_selection(cached, ["dev", "old"], refreshed)
+
+        assert profile_rolearn_dict == refreshed
+        assert selected == ["dev"]
+        assert "Skipped old: role no longer available" in caplog.text
+        assert "Found 1 new role(s)" in caplog.text
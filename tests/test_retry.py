@@ -0,0 +1,168 @@
+import json
+import logging
+import random
+import threading
+
+import pytest
+
+from saml2awsmulti.login_executor import run_logins
+from saml2awsmulti.retry import AdaptiveConcurrency, RetryPolicy, is_transient_failure
+from saml2awsmulti.saml2aws_helper import Saml2AwsHelper
+
+ROLES = {f"role-{i}": f"arn:aws:iam::{100000000000 + i}:role/role-{i}" for i in range(8)}
+
+
+@pytest.mark.parametrize(
+    "returncode, output, expected",
+    [
+        (0, "429 Too Many Requests", False),
+        (1, "Error authenticating to IdP.: 429 Too Many Requests", True),
+        (1, "Okta error E0000047: API call exceeded rate limit due to too many requests", True),
+        (1, "Post https://adfs.example.com: net/http: TLS handshake timeout", True),
+        (1, "503 Service Unavailable", True),
+        (1, "Error retrieving STS credentials: HTTP/1.1 502 Bad Gateway", True),
+        (1, 'Post "https://idp.example.com/sso": dial tcp 10.0.0.1:443: i/o timeout', True),
+        (1, "Failed to assume role arn:aws:iam::123450212345:role/502-admins", False),
+        (1, "Error logging in: account 502 not found", False),
+        (1, "Error authenticating to IdP.: timed out waiting for Okta MFA push", False),
+        (1, "Duo MFA: push verification timeout", False),
+        (1, "Waiting for approval...\nError logging in: timeout", False),
+        (75, "", True),
+        (1, "Error authenticating to IdP.: Invalid username or password", False),
+        (1, "Error logging in", False),
+        (-9, "i/o timeout", False),
+        (None, "", False),
+    ],
+)
+def test_is_transient_failure(returncode, output, expected):
+    assert is_transient_failure(returncode, output) is expected
+
+
+class TestRetryPolicy:
+    def test_should_retry(self):
+        policy = RetryPolicy(max_attempts=3)
+
+        assert policy.should_retry(1, 1, "429 Too Many Requests")
+        assert policy.should_retry(2, 1, "429 Too Many Requests")
+        assert not policy.should_retry(3, 1, "429 Too Many Requests")
+        assert not policy.should_retry(1, 1, "Invalid username or password")
+
+    def test_backoff_is_jittered_exponential_and_capped(self):
+        policy = RetryPolicy(base_delay=1.0, max_delay=5.0, rng=random.Random(42))
+
+        for attempt, ceiling in [(1, 1.0), (2, 2.0), (3, 4.0), (4, 5.0), (10, 5.0)]:
+            delays = [policy.backoff(attempt) for _ in range(100)]
+            assert all(0 <= delay <= ceiling for delay in delays)
+            assert max(delays) > ceiling / 2
+
+
+class TestAdaptiveConcurrency:
+    def _run(self, concurrency, transient_failure):
+        with concurrency.slot() as slot:
+            slot.transient_failure = transient_failure
+
+    def test_failure_halves_the_limit_once_per_burst(self):
+        concurrency = AdaptiveConcurrency(8)
+        with concurrency.slot() as first, concurrency.slot() as second:
+            first.transient_failure = second.transient_failure = True
+
+        # The first failure was already in flight when the second one halved the limit
+        assert concurrency.limit == 4
+
+        self._run(concurrency, True)
+        assert concurrency.limit == 2
+        self._run(concurrency, True)
+        self._run(concurrency, True)
+        assert concurrency.limit == 1
+
+    def test_successes_raise_the_limit_up_to_the_initial_limit(self):
+        concurrency = AdaptiveConcurrency(4)
+        self._run(concurrency, True)
+        assert concurrency.limit == 2
+
+        for _ in range(2):
+            self._run(concurrency, False)
+        assert concurrency.limit == 3
+        for _ in range(3):
+            self._run(concurrency, False)
+        assert concurrency.limit == 4
+        for _ in range(20):
+            self._run(concurrency, False)
+        assert concurrency.limit == 4
+
+    def test_slots_wait_for_the_limit(self):
+        concurrency = AdaptiveConcurrency(2)
+        in_flight, peak = [0], [0]
+        lock = threading.Lock()
+        release = threading.Event()
+
+        def login():
+            with concurrency.slot():
+                with lock:
+                    in_flight[0] += 1
+                    peak[0] = max(peak[0], in_flight[0])
+                release.wait(5)
+                with lock:
+                    in_flight[0] -= 1
+
+        threads = [threading.Thread(target=login) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        assert peak[0] == 2
+
+
+@pytest.fixture
+def helper(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_SHARED_CREDENTIALS_FILE", str(tmp_path / "credentials"))
+    helper = Saml2AwsHelper("config_file", None, False, retry_policy=RetryPolicy(base_delay=0.01))
+    helper._uname, helper._upass = "testuser", "testpass"
+    return helper
+
+
+def _login_calls(calls_log):
+    with open(calls_log) as f:
+        return [json.loads(line)["args"] for line in f if '"login"' in line]
+
+
+class TestThrottledLogins:
+    def test_throttled_login_is_retried(self, fake_saml2aws, helper, tmp_path, caplog):
+        calls_log = tmp_path / "calls.log"
+        fake_saml2aws(
+            calls_log=str(calls_log), state_dir=str(tmp_path), throttled_logins={"dev": 2}
+        )
+
+        assert helper.run_saml2aws_login(ROLES["role-0"], "dev") == 0
+        assert len(_login_calls(calls_log)) == 3
+        assert "retrying in" in caplog.text
+
+    def test_gives_up_after_max_attempts(self, fake_saml2aws, helper, tmp_path):
+        calls_log = tmp_path / "calls.log"
+        fake_saml2aws(
+            calls_log=str(calls_log), state_dir=str(tmp_path), throttled_logins={"dev": 5}
+        )
+
+        assert helper.run_saml2aws_login(ROLES["role-0"], "dev") == 1
+        assert len(_login_calls(calls_log)) == 3
+
+    def test_permanent_failure_is_not_retried(self, fake_saml2aws, helper, tmp_path):
+        calls_log = tmp_path / "calls.log"
+        fake_saml2aws(calls_log=str(calls_log), login_returncodes={"dev": 1})
+
+        assert helper.run_saml2aws_login(ROLES["role-0"], "dev") == 1
+        assert len(_login_calls(calls_log)) == 1
+
+    def test_parallel_logins_adapt_to_throttling(self, fake_saml2aws, helper, tmp_path, caplog):
+        fake_saml2aws(state_dir=str(tmp_path), max_concurrent_logins=2, login_delay=0.1)
+        helper.retry_policy = RetryPolicy(max_attempts=10, base_delay=0.05)
+        caplog.set_level(logging.DEBUG)
+
+        results = run_logins(
+            helper, ROLES, list(ROLES), str(tmp_path / "credentials"), parallel=len(ROLES)
+        )
+
+        assert [r.returncode for r in results] == [0] * len(ROLES)
+        assert "Concurrency limit 8 -> 4 after transient failure" in caplog.text
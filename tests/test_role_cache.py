@@ -0,0 +1,105 @@
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from saml2awsmulti.role_cache import (
+    diff_roles,
+    is_roles_cache_stale,
+    log_roles_diff,
+    read_roles_cache_metadata,
+    write_roles_cache_metadata,
+)
+
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+class TestRolesCacheMetadata:
+    def test_write_and_read(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            meta_file = os.path.join(temp_dir, "subdir", "meta.json")
+
+            write_roles_cache_metadata(meta_file, "default", "testuser", fetched_at=NOW)
+
+            assert read_roles_cache_metadata(meta_file) == {
+                "fetched_at": "2026-01-01T00:00:00+00:00",
+                "idp_account": "default",
+                "username": "testuser",
+            }
+
+    def test_read_nonexistent(self):
+        assert read_roles_cache_metadata("nonexistent_file.json") == {}
+
+    def test_read_invalid(self, caplog):
+        with tempfile.NamedTemporaryFile(mode="w", delete=False) as f:
+            f.write("not json")
+            temp_file = f.name
+
+        try:
+            with caplog.at_level("WARNING"):
+                assert read_roles_cache_metadata(temp_file) == {}
+            assert "Ignored invalid roles cache metadata" in caplog.text
+        finally:
+            os.unlink(temp_file)
+
+
+class TestIsRolesCacheStale:
+    def _metadata(self, age_hours, idp_account="default", username="testuser"):
+        return {
+            "fetched_at": (NOW - timedelta(hours=age_hours)).isoformat(),
+            "idp_account": idp_account,
+            "username": username,
+        }
+
+    def test_ttl_disabled(self):
+        assert is_roles_cache_stale({}, 0, "default", "testuser", now=NOW) is False
+
+    def test_fresh(self):
+        metadata = self._metadata(1)
+        assert is_roles_cache_stale(metadata, 2 * 3600, "default", "testuser", now=NOW) is False
+
+    def test_expired(self):
+        metadata = self._metadata(3)
+        assert is_roles_cache_stale(metadata, 2 * 3600, "default", "testuser", now=NOW) is True
+
+    def test_no_metadata(self):
+        assert is_roles_cache_stale({}, 3600, "default", "testuser", now=NOW) is True
+
+    def test_other_idp_account(self):
+        metadata = self._metadata(1, idp_account="other")
+        assert is_roles_cache_stale(metadata, 2 * 3600, "default", "testuser", now=NOW) is True
+
+    def test_other_username(self):
+        metadata = self._metadata(1, username="someone")
+        assert is_roles_cache_stale(metadata, 2 * 3600, "default", "testuser", now=NOW) is True
+
+    def test_unknown_username(self):
+        metadata = self._metadata(1, username="someone")
+        assert is_roles_cache_stale(metadata, 2 * 3600, "default", None, now=NOW) is False
+
+
+class TestDiffRoles:
+    def test_diff(self, caplog):
+        old = [
+            ["arn:aws:iam::123456789012:role/dev", "aws-01"],
+            ["arn:aws:iam::213456789012:role/test", "aws-02"],
+        ]
+        new = [
+            ("arn:aws:iam::123456789012:role/dev", "aws-01-renamed"),
+            ("arn:aws:iam::313456789012:role/prod", "aws-03"),
+        ]
+
+        diff = diff_roles(old, new)
+
+        assert diff.added == ["arn:aws:iam::313456789012:role/prod"]
+        assert diff.removed == ["arn:aws:iam::213456789012:role/test"]
+        assert diff.alias_changed == [
+            ("arn:aws:iam::123456789012:role/dev", "aws-01", "aws-01-renamed")
+        ]
+
+        with caplog.at_level("INFO"):
+            log_roles_diff(diff)
+        assert "1 added, 1 removed, 1 account alias change(s)" in caplog.text
+
+    def test_no_changes(self):
+        roles = [("arn:aws:iam::123456789012:role/dev", "aws-01")]
+        assert diff_roles(roles, roles) == ([], [], [])
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from saml2awsmulti.role_store import SqliteRoleStore
+
+ROLES = [
+    ("arn:aws:iam::123456789012:role/dev", "aws-01"),
+    ("arn:aws:iam::123456789012:role/team/dev-admin", "aws-01"),
+    ("arn:aws:iam::213456789012:role/test", "aws-02"),
+    ("arn:aws:iam::313456789012:role/prod*", "aws-03"),
+]
+
+
+@pytest.fixture(params=[True, False], ids=["fts", "scan"])
+def store(request, tmp_path):
+    role_store = SqliteRoleStore(str(tmp_path / "roles.db"))
+    # Exercise both the trigram index and the fallback for SQLite builds without it
+    role_store._fts = role_store._fts and request.param
+    role_store.replace_roles(ROLES)
+    yield role_store
+    role_store.close()
+
+
+class TestSqliteRoleStore:
+    def test_iter_roles_keeps_order(self, store):
+        assert list(store.iter_roles()) == ROLES
+        assert store.count() == 4
+
+    def test_query_profiles_all(self, store):
+        result = store.query_profiles("RoleName", [])
+        assert list(result) == ["dev", "team-dev-admin", "test", "prod*"]
+        assert result["test"] == "arn:aws:iam::213456789012:role/test"
+
+    def test_query_profiles_keywords(self, store):
+        # "dev" uses the trigram index, "es" is too short for it
+        result = store.query_profiles("RoleName", ["dev", "es"])
+        assert list(result) == ["dev", "team-dev-admin", "test"]
+
+    def test_query_profiles_keywords_case_sensitive(self, store):
+        assert list(store.query_profiles("RoleName", ["DEV"])) == []
+
+    def test_query_profiles_keyword_with_glob_characters(self, store):
+        assert list(store.query_profiles("RoleName", ["od*"])) == ["prod*"]
+        assert list(store.query_profiles("RoleName", ["d*v"])) == []
+
+    def test_query_profiles_account_alias_format(self, store):
+        result = store.query_profiles("RoleName-AccountAlias", ["aws-02"])
+        assert list(result) == ["test-aws-02"]
+
+    def test_query_profiles_by_role_arn(self, store):
+        result = store.query_profiles_by_role_arn("RoleName", ["123456789012"])
+        assert result == ["dev", "team-dev-admin"]
+        assert store.query_profiles_by_role_arn("RoleName", []) == []
+
+    def test_replace_roles(self, store):
+        store.replace_roles(ROLES[:1])
+        assert list(store.query_profiles("RoleName", ["dev"])) == ["dev"]
+
+
+class TestMigrateFromCsv:
+    def test_migrate_from_csv(self, tmp_path):
+        csv_file = str(tmp_path / "roles.csv")
+        with open(csv_file, "w") as f:
+            f.write("# comment\narn:aws:iam::123456789012:role/dev, aws-01\n")
+        role_store = SqliteRoleStore(str(tmp_path / "subdir" / "roles.db"))
+
+        assert role_store.needs_migration(csv_file) is True
+        role_store.migrate_from_csv(csv_file)
+
+        assert role_store.needs_migration(csv_file) is False
+        assert list(role_store.iter_roles()) == [("arn:aws:iam::123456789012:role/dev", "aws-01")]
+
+        with open(csv_file, "a") as f:
+            f.write("arn:aws:iam::213456789012:role/test, aws-02\n")
+        os.utime(csv_file, ns=(0, 0))
+        assert role_store.needs_migration(csv_file) is True
+        role_store.close()
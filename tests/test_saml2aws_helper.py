@@ -1,8 +1,39 @@
-from unittest.mock import Mock, patch
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, Mock, patch
 
 import pytest
 
-from saml2awsmulti.saml2aws_helper import Saml2AwsHelper
+from saml2awsmulti.capabilities import Saml2AwsCapabilities
+from saml2awsmulti.login_executor import log_login_summary, run_logins
+from saml2awsmulti.saml2aws_helper import Saml2AwsHelper, parse_list_roles_lines
+from tests.fake_saml2aws import make_saml_assertion
+
+
+def _list_roles_process(stdout):
+    """A mock saml2aws list-roles process streaming `stdout`."""
+    process = MagicMock()
+    process.__enter__.return_value = process
+    process.stdout = io.BytesIO(stdout)
+    process.returncode = 0
+    return process
+
+
+def make_capabilities(stdin_password=True, session_duration=True, cache_saml=True):
+    login_flags = ["--browser-autofill", "--password", "--role", "--skip-prompt"]
+    if stdin_password:
+        login_flags.append("--stdin-password")
+    if session_duration:
+        login_flags.append("--session-duration")
+    if cache_saml:
+        login_flags += ["--cache-file", "--cache-saml"]
+    return Saml2AwsCapabilities("2.36.19", tuple(login_flags))
 
 
 class TestSaml2AwsHelper:
@@ -13,7 +44,7 @@ class TestSaml2AwsHelper:
         assert helper._browser_autofill is True
         assert helper._uname is None
         assert helper._upass is None
-        assert helper._stdin_password_supported is None
+        assert helper._capabilities is None
 
     @patch("saml2awsmulti.saml2aws_helper.load_saml2aws_config")
     @patch("builtins.input")
@@ -30,6 +61,22 @@ class TestSaml2AwsHelper:
         mock_input.assert_not_called()
         mock_getpass.assert_called_once()
 
+    @patch("saml2awsmulti.saml2aws_helper.load_saml2aws_config")
+    @patch("builtins.input")
+    @patch("getpass.getpass")
+    def test_get_credentials_from_environment(
+        self, mock_getpass, mock_input, mock_load_config, monkeypatch
+    ):
+        mock_load_config.return_value = {"username": "testuser"}
+        monkeypatch.setenv("SAML2AWS_USERNAME", "ci-user")
+        monkeypatch.setenv("SAML2AWS_PASSWORD", "ci-pass")
+
+        helper = Saml2AwsHelper("config_file", None, False)
+
+        assert helper.get_credentials() == ("ci-user", "ci-pass")
+        mock_input.assert_not_called()
+        mock_getpass.assert_not_called()
+
     @patch("saml2awsmulti.saml2aws_helper.load_saml2aws_config")
     @patch("builtins.input")
     @patch("getpass.getpass")
@@ -71,17 +118,14 @@ class TestSaml2AwsHelper:
         mock_getpass.return_value = "testpass"
 
         # Mock subprocess output
-        mock_process = Mock()
-        mock_process.communicate.return_value = (
+        mock_process = _list_roles_process(
             b"Account: aws-01 (123456789012)\narn:aws:iam::123456789012:role/dev\n"
-            b"Account: aws-02 (213456789012)\narn:aws:iam::213456789012:role/test\n",
-            None,
+            b"Account: aws-02 (213456789012)\narn:aws:iam::213456789012:role/test\n"
         )
-        mock_process.returncode = 0
         mock_popen.return_value = mock_process
 
         helper = Saml2AwsHelper("config_file", None, False)
-        helper._stdin_password_supported = True
+        helper._capabilities = make_capabilities()
         result = helper.run_saml2aws_list_roles()
 
         expected = [
@@ -91,7 +135,7 @@ class TestSaml2AwsHelper:
         assert result == expected
         mock_popen.assert_called_once()
         # Password must be sent via stdin, not in the command
-        mock_process.communicate.assert_called_once_with(input=b"testpass\n")
+        mock_process.stdin.write.assert_called_once_with(b"testpass\n")
         cmd_args = mock_popen.call_args[0][0]
         assert "--stdin-password" in cmd_args
         assert not any("password" in arg.lower() and "stdin" not in arg for arg in cmd_args)
@@ -106,16 +150,13 @@ class TestSaml2AwsHelper:
         mock_getpass.return_value = "testpass"
 
         # Mock subprocess output with no account alias
-        mock_process = Mock()
-        mock_process.communicate.return_value = (
-            b"Account: 123456789012\narn:aws:iam::123456789012:role/dev\n",
-            None,
+        mock_process = _list_roles_process(
+            b"Account: 123456789012\narn:aws:iam::123456789012:role/dev\n"
         )
-        mock_process.returncode = 0
         mock_popen.return_value = mock_process
 
         helper = Saml2AwsHelper("config_file", None, False)
-        helper._stdin_password_supported = True
+        helper._capabilities = make_capabilities()
         result = helper.run_saml2aws_list_roles()
 
         expected = [("arn:aws:iam::123456789012:role/dev", "None")]
@@ -129,13 +170,11 @@ class TestSaml2AwsHelper:
         mock_getpass.return_value = "testpass"
 
         # Mock subprocess output with no roles
-        mock_process = Mock()
-        mock_process.communicate.return_value = (b"Account: aws-01 (123456789012)\n", None)
-        mock_process.returncode = 0
+        mock_process = _list_roles_process(b"Account: aws-01 (123456789012)\n")
         mock_popen.return_value = mock_process
 
         helper = Saml2AwsHelper("config_file", None, False)
-        helper._stdin_password_supported = True
+        helper._capabilities = make_capabilities()
 
         with pytest.raises(ValueError, match="Failed to retrieve roles with saml2aws"):
             helper.run_saml2aws_list_roles()
@@ -150,16 +189,13 @@ class TestSaml2AwsHelper:
         mock_getpass.return_value = "testpass"
 
         # ARN appears before its Account line — account ID is used as alias fallback
-        mock_process = Mock()
-        mock_process.communicate.return_value = (
-            b"Account: malformed line\narn:aws:iam::123456789012:role/dev\n",
-            None,
+        mock_process = _list_roles_process(
+            b"Account: malformed line\narn:aws:iam::123456789012:role/dev\n"
         )
-        mock_process.returncode = 0
         mock_popen.return_value = mock_process
 
         helper = Saml2AwsHelper("config_file", None, False)
-        helper._stdin_password_supported = True
+        helper._capabilities = make_capabilities()
 
         result = helper.run_saml2aws_list_roles()
 
@@ -174,22 +210,18 @@ class TestSaml2AwsHelper:
         mock_load_config.return_value = {"username": "testuser"}
         mock_getpass.return_value = "testpass"
 
-        # A malformed account line with too many parts triggers the except block
-        # (ValueError: too many values to unpack). A subsequent valid account and
+        # A malformed account line is logged and skipped. A subsequent valid account and
         # ARN line allow normal completion.
-        mock_process = Mock()
-        mock_process.communicate.return_value = (
+        mock_process = _list_roles_process(
             b"Account: ALIAS (123) extra\n"
             b"Account: aws-01 (123456789012)\n"
-            b"arn:aws:iam::123456789012:role/dev\n",
-            None,
+            b"arn:aws:iam::123456789012:role/dev\n"
         )
-        mock_process.returncode = 0
         mock_popen.return_value = mock_process
 
         with caplog.at_level("ERROR"):
             helper = Saml2AwsHelper("config_file", None, False)
-            helper._stdin_password_supported = True
+            helper._capabilities = make_capabilities()
             result = helper.run_saml2aws_list_roles()
 
         assert result == [("arn:aws:iam::123456789012:role/dev", "aws-01")]
@@ -208,7 +240,7 @@ class TestSaml2AwsHelper:
         mock_popen.return_value = mock_process
 
         helper = Saml2AwsHelper("config_file", None, False)
-        helper._stdin_password_supported = True
+        helper._capabilities = make_capabilities()
         result = helper.run_saml2aws_login("arn:aws:iam::123456789012:role/dev", "dev")
 
         assert result == 0
@@ -229,7 +261,7 @@ class TestSaml2AwsHelper:
         mock_popen.return_value = mock_process
 
         helper = Saml2AwsHelper("config_file", "7200", False)
-        helper._stdin_password_supported = True
+        helper._capabilities = make_capabilities()
         helper.run_saml2aws_login("arn:aws:iam::123456789012:role/dev", "dev")
 
         # Check that session duration was included in command
@@ -251,7 +283,7 @@ class TestSaml2AwsHelper:
         mock_popen.return_value = mock_process
 
         helper = Saml2AwsHelper("config_file", None, True)
-        helper._stdin_password_supported = True
+        helper._capabilities = make_capabilities()
         helper.run_saml2aws_login("arn:aws:iam::123456789012:role/dev", "dev")
 
         # Check that browser autofill was included in command
@@ -271,7 +303,7 @@ class TestSaml2AwsHelper:
         mock_popen.return_value = mock_process
 
         helper = Saml2AwsHelper("config_file", None, False)
-        helper._stdin_password_supported = True
+        helper._capabilities = make_capabilities()
         result = helper.run_saml2aws_login("arn:aws:iam::123456789012:role/dev", "dev")
 
         assert result == 1
@@ -289,7 +321,7 @@ class TestSaml2AwsHelper:
         mock_popen.return_value = mock_process
 
         helper = Saml2AwsHelper("config_file", "3600", True)
-        helper._stdin_password_supported = True
+        helper._capabilities = make_capabilities()
         helper.run_saml2aws_login("arn:aws:iam::123456789012:role/dev", "dev")
 
         # Verify the command is a list (no shell=True) and contains expected args
@@ -308,7 +340,7 @@ class TestSaml2AwsHelper:
         # Password must NOT appear in the command args
         assert not any("testpass" in arg for arg in call_args)
         # Password sent via stdin
-        mock_process.communicate.assert_called_once_with(input=b"testpass\n")
+        mock_process.communicate.assert_called_once_with(input=b"testpass\n", timeout=None)
 
     @patch("subprocess.run")
     def test_supports_stdin_password_true(self, mock_run):
@@ -317,9 +349,7 @@ class TestSaml2AwsHelper:
         )
         helper = Saml2AwsHelper("config_file", None, False)
         assert helper._supports_stdin_password() is True
-        mock_run.assert_called_once_with(
-            ["saml2aws", "login", "--help"], capture_output=True, text=True
-        )
+        mock_run.assert_any_call(["saml2aws", "login", "--help"], capture_output=True, text=True)
 
     @patch("subprocess.run")
     def test_supports_stdin_password_false(self, mock_run):
@@ -333,7 +363,55 @@ class TestSaml2AwsHelper:
         helper = Saml2AwsHelper("config_file", None, False)
         helper._supports_stdin_password()
         helper._supports_stdin_password()
-        mock_run.assert_called_once()
+        assert mock_run.call_count == 2  # One probe: --version, login --help
+
+    @patch("saml2awsmulti.saml2aws_helper.load_saml2aws_config")
+    @patch("getpass.getpass")
+    def test_login_without_session_duration_support(self, mock_getpass, mock_load_config):
+        mock_load_config.return_value = {"username": "testuser"}
+        mock_getpass.return_value = "testpass"
+        helper = Saml2AwsHelper("config_file", "3600", False)
+        helper._capabilities = make_capabilities(session_duration=False)
+
+        cmd, _ = helper._build_login_cmd("arn:aws:iam::123456789012:role/dev", "dev")
+
+        assert not any(arg.startswith("--session-duration") for arg in cmd)
+
+    @patch("saml2awsmulti.saml2aws_helper.load_saml2aws_config")
+    @patch("getpass.getpass")
+    def test_saml_assertion_cache_saml_unsupported(self, mock_getpass, mock_load_config):
+        mock_load_config.return_value = {"username": "testuser"}
+        mock_getpass.return_value = "testpass"
+        helper = Saml2AwsHelper("config_file", None, False)
+        helper._capabilities = make_capabilities(cache_saml=False)
+
+        with pytest.raises(ValueError, match="does not support login --cache-saml"):
+            helper.run_saml2aws_get_saml_assertion("arn:aws:iam::123456789012:role/dev")
+
+    def test_capabilities_persisted_until_binary_changes(self, fake_saml2aws, tmp_path):
+        fake_saml2aws(version="2.36.19")
+        capabilities_file = str(tmp_path / "capabilities.json")
+
+        with patch("subprocess.run", wraps=subprocess.run) as mock_run:
+            first = Saml2AwsHelper("config_file", None, False, capabilities_file)
+            capabilities = first.get_capabilities()
+            assert mock_run.call_count == 2
+
+            second = Saml2AwsHelper("config_file", None, False, capabilities_file)
+            assert second.get_capabilities() == capabilities
+            assert mock_run.call_count == 2
+
+            binary = shutil.which("saml2aws")
+            with open(binary, "a") as f:
+                f.write("# upgraded\n")
+            third = Saml2AwsHelper("config_file", None, False, capabilities_file)
+            third.get_capabilities()
+            assert mock_run.call_count == 4
+
+        assert capabilities.version == "2.36.19"
+        assert capabilities.stdin_password is True
+        assert capabilities.login_cache_saml is True
+        assert "--skip-prompt" in capabilities.login_flags
 
     @patch("saml2awsmulti.saml2aws_helper.load_saml2aws_config")
     @patch("getpass.getpass")
@@ -344,16 +422,13 @@ class TestSaml2AwsHelper:
         mock_load_config.return_value = {"username": "testuser"}
         mock_getpass.return_value = "testpass"
 
-        mock_process = Mock()
-        mock_process.communicate.return_value = (
-            b"Account: aws-01 (123456789012)\narn:aws:iam::123456789012:role/dev\n",
-            None,
+        mock_process = _list_roles_process(
+            b"Account: aws-01 (123456789012)\narn:aws:iam::123456789012:role/dev\n"
         )
-        mock_process.returncode = 0
         mock_popen.return_value = mock_process
 
         helper = Saml2AwsHelper("config_file", None, False)
-        helper._stdin_password_supported = False
+        helper._capabilities = make_capabilities(stdin_password=False)
         result = helper.run_saml2aws_list_roles()
 
         assert result == [("arn:aws:iam::123456789012:role/dev", "aws-01")]
@@ -361,7 +436,8 @@ class TestSaml2AwsHelper:
         assert "--stdin-password" not in cmd_args
         assert "--password=testpass" in cmd_args
         # Password passed via args, not stdin
-        mock_process.communicate.assert_called_once_with()
+        assert mock_popen.call_args.kwargs["stdin"] is None
+        mock_process.stdin.write.assert_not_called()
 
     @patch("saml2awsmulti.saml2aws_helper.load_saml2aws_config")
     @patch("getpass.getpass")
@@ -378,7 +454,7 @@ class TestSaml2AwsHelper:
         mock_popen.return_value = mock_process
 
         helper = Saml2AwsHelper("config_file", "3600", True)
-        helper._stdin_password_supported = False
+        helper._capabilities = make_capabilities(stdin_password=False)
         helper.run_saml2aws_login("arn:aws:iam::123456789012:role/dev", "dev")
 
         cmd_args = mock_popen.call_args[0][0]
@@ -387,4 +463,311 @@ class TestSaml2AwsHelper:
         assert "--session-duration=3600" in cmd_args
         assert "--browser-autofill" in cmd_args
         # Password passed via args, not stdin
-        mock_process.communicate.assert_called_once_with()
+        mock_process.communicate.assert_called_once_with(input=None, timeout=None)
+
+    @patch("saml2awsmulti.saml2aws_helper.load_saml2aws_config")
+    @patch("getpass.getpass")
+    @patch("subprocess.Popen")
+    def test_run_saml2aws_login_private_credentials_file(
+        self, mock_popen, mock_getpass, mock_load_config
+    ):
+        mock_load_config.return_value = {"username": "testuser"}
+        mock_getpass.return_value = "testpass"
+
+        mock_process = Mock()
+        mock_process.communicate.return_value = (b"Login successful\n", None)
+        mock_process.returncode = 0
+        mock_popen.return_value = mock_process
+
+        helper = Saml2AwsHelper("config_file", None, False)
+        helper._capabilities = make_capabilities()
+        helper.run_saml2aws_login(
+            "arn:aws:iam::123456789012:role/dev", "dev", credentials_file="/tmp/private"
+        )
+
+        env = mock_popen.call_args.kwargs["env"]
+        assert env["AWS_SHARED_CREDENTIALS_FILE"] == "/tmp/private"
+
+    @patch("saml2awsmulti.saml2aws_helper.load_saml2aws_config")
+    @patch("getpass.getpass")
+    @patch("subprocess.run")
+    def test_prepare(self, mock_run, mock_getpass, mock_load_config):
+        mock_load_config.return_value = {"username": "testuser"}
+        mock_getpass.return_value = "testpass"
+        mock_run.return_value = Mock(stdout="--stdin-password\n", stderr="")
+
+        helper = Saml2AwsHelper("config_file", None, False)
+        helper.prepare()
+
+        assert helper._uname == "testuser"
+        assert helper._capabilities.stdin_password is True
+
+
+def _read_calls(calls_log):
+    with open(calls_log) as f:
+        return [json.loads(line) for line in f]
+
+
+def _logged_in_helper():
+    helper = Saml2AwsHelper("config_file", None, False)
+    helper._uname, helper._upass = "testuser", "testpass"
+    return helper
+
+
+class TestSamlCache:
+    ROLES = {
+        "dev": "arn:aws:iam::123456789012:role/dev",
+        "test": "arn:aws:iam::213456789012:role/test",
+        "prod": "arn:aws:iam::313456789012:role/prod",
+    }
+
+    @pytest.fixture(autouse=True)
+    def aws_cred_file(self, tmp_path, monkeypatch):
+        # Serial logins let saml2aws write to the default credentials file
+        monkeypatch.setenv("AWS_SHARED_CREDENTIALS_FILE", str(tmp_path / "credentials"))
+
+    def _assertion(self, expires_in):
+        not_on_or_after = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
+        return make_saml_assertion({}, not_on_or_after.isoformat())
+
+    def _login_all(self, helper, tmp_path, parallel=1):
+        with helper.saml_cache():
+            return run_logins(
+                helper, self.ROLES, list(self.ROLES), str(tmp_path / "credentials"), parallel
+            )
+
+    @pytest.mark.parametrize("parallel", [1, 3])
+    def test_first_login_primes_the_cache(self, fake_saml2aws, tmp_path, parallel):
+        calls_log = tmp_path / "calls.log"
+        fake_saml2aws(calls_log=str(calls_log), assertion=self._assertion(300))
+
+        results = self._login_all(_logged_in_helper(), tmp_path, parallel)
+
+        assert [r.returncode for r in results] == [0, 0, 0]
+        calls = _read_calls(calls_log)
+        assert sorted(call["cache_hit"] for call in calls) == [False, True, True]
+        assert all("--cache-saml" in call["args"] for call in calls)
+        # The cache file is removed with the batch
+        cache_file = next(a for a in calls[0]["args"] if a.startswith("--cache-file="))
+        assert not (tmp_path / cache_file.split("=", 1)[1]).exists()
+
+    def test_expired_assertion_authenticates_again(self, fake_saml2aws, tmp_path):
+        calls_log = tmp_path / "calls.log"
+        fake_saml2aws(calls_log=str(calls_log), assertion=self._assertion(10))
+
+        self._login_all(_logged_in_helper(), tmp_path)
+
+        assert [call["cache_hit"] for call in _read_calls(calls_log)] == [False, False, False]
+
+    def test_rejected_assertion_falls_back_to_full_authentication(self, fake_saml2aws, tmp_path):
+        calls_log = tmp_path / "calls.log"
+        fake_saml2aws(
+            calls_log=str(calls_log), assertion=self._assertion(300), reject_cached_saml=True
+        )
+
+        results = self._login_all(_logged_in_helper(), tmp_path)
+
+        assert [r.returncode for r in results] == [0, 0, 0]
+        calls = _read_calls(calls_log)
+        # dev primes the cache; test and prod fail with it, then log in without it
+        assert [call["cache_hit"] for call in calls] == [False, True, False, True, False]
+        assert "--cache-saml" not in calls[2]["args"]
+
+    def test_unsupported(self, fake_saml2aws, tmp_path, caplog):
+        calls_log = tmp_path / "calls.log"
+        fake_saml2aws(calls_log=str(calls_log), cache_saml=False)
+
+        with caplog.at_level("WARNING"):
+            self._login_all(_logged_in_helper(), tmp_path)
+
+        assert "does not support login --cache-saml" in caplog.text
+        assert not any("--cache-saml" in call["args"] for call in _read_calls(calls_log))
+
+
+class TestListRolesStreaming:
+    ROLES = [
+        ["arn:aws:iam::123456789012:role/dev", "aws-01"],
+        ["arn:aws:iam::123456789012:role/admin", "aws-01"],
+        ["arn:aws:iam::213456789012:role/test", "aws-02"],
+    ]
+
+    def test_parse_lines_lazily(self):
+        def lines():
+            yield b"Account: aws-01 (123456789012)\n"
+            yield b"arn:aws:iam::123456789012:role/dev\n"
+            raise AssertionError("read past the first role")
+
+        roles = parse_list_roles_lines(lines())
+
+        assert next(roles) == ("arn:aws:iam::123456789012:role/dev", "aws-01")
+
+    def test_parse_lines(self):
+        lines = [
+            b"Account: aws-01 (123456789012)\r\n",
+            b"arn:aws:iam::123456789012:role/dev  \n",
+            b"\n",
+            b"Account: 213456789012\n",
+            b"arn:aws-us-gov:iam::213456789012:role/path/test\n",
+            b"arn:aws:iam::313456789012:role/prod\n",
+        ]
+
+        assert list(parse_list_roles_lines(lines)) == [
+            ("arn:aws:iam::123456789012:role/dev", "aws-01"),
+            ("arn:aws-us-gov:iam::213456789012:role/path/test", "None"),
+            ("arn:aws:iam::313456789012:role/prod", "313456789012"),
+        ]
+
+    def test_iter_saml2aws_list_roles(self, fake_saml2aws, tmp_path):
+        calls_log = tmp_path / "calls.log"
+        fake_saml2aws(roles=self.ROLES, calls_log=str(calls_log))
+
+        roles = _logged_in_helper().iter_saml2aws_list_roles()
+
+        assert list(roles) == [tuple(role) for role in self.ROLES]
+        assert _read_calls(calls_log)[0]["stdin_password"] == "testpass"
+
+    def test_iter_saml2aws_list_roles_no_roles(self, fake_saml2aws):
+        fake_saml2aws(roles=[])
+
+        with pytest.raises(ValueError, match="Failed to retrieve roles with saml2aws"):
+            list(_logged_in_helper().iter_saml2aws_list_roles())
+
+
+def _is_running(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Killed children of the killed saml2aws may linger as zombies until reaped
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+class TestGetSamlAssertion:
+    ROLE_ARN = "arn:aws:iam::123456789012:role/dev"
+
+    def test_assertion_from_login_cache(self, fake_saml2aws, tmp_path, monkeypatch):
+        cred_file = tmp_path / "credentials"
+        monkeypatch.setenv("AWS_SHARED_CREDENTIALS_FILE", str(cred_file))
+        calls_log = tmp_path / "calls.log"
+        fake_saml2aws(calls_log=str(calls_log), assertion="assertion")
+
+        assert _logged_in_helper().run_saml2aws_get_saml_assertion(self.ROLE_ARN) == "assertion"
+
+        login_call = _read_calls(calls_log)[-1]["args"]
+        assert login_call[:2] == ["login", f"--role={self.ROLE_ARN}"]
+        assert "--cache-saml" in login_call
+        # The credentials of that login are thrown away
+        assert not cred_file.exists()
+
+    def test_cache_file_not_written(self, fake_saml2aws):
+        fake_saml2aws(cache_saml_noop=True)
+
+        with pytest.raises(ValueError, match="saml2aws login --cache-saml did not write it"):
+            _logged_in_helper().run_saml2aws_get_saml_assertion(self.ROLE_ARN)
+
+    def test_login_failure(self, fake_saml2aws):
+        fake_saml2aws(login_returncodes={"saml2aws-multi": 1})
+
+        with pytest.raises(ValueError, match="saml2aws login exited with 1"):
+            _logged_in_helper().run_saml2aws_get_saml_assertion(self.ROLE_ARN)
+
+
+class TestTimeouts:
+    ROLES = TestSamlCache.ROLES
+
+    @pytest.fixture(autouse=True)
+    def aws_cred_file(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("AWS_SHARED_CREDENTIALS_FILE", str(tmp_path / "credentials"))
+
+    @pytest.mark.skipif(not os.path.isdir("/proc"), reason="needs /proc")
+    def test_login_timeout_kills_the_process_group(self, fake_saml2aws, tmp_path):
+        fake_saml2aws(state_dir=str(tmp_path), hang_logins=["dev"])
+        helper = _logged_in_helper()
+        helper.call_timeout = 1
+
+        start = time.monotonic()
+        with pytest.raises(TimeoutError, match="saml2aws login timed out after 1s"):
+            helper.run_saml2aws_login(self.ROLES["dev"], "dev")
+
+        assert time.monotonic() - start < 10
+        child_pid = int((tmp_path / "child-dev.pid").read_text())
+        # SIGKILL is delivered asynchronously; the child may take a moment to die
+        deadline = time.monotonic() + 5
+        while _is_running(child_pid) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert not _is_running(child_pid)
+
+    @pytest.mark.parametrize("parallel", [1, 3])
+    def test_other_logins_continue(self, fake_saml2aws, tmp_path, caplog, parallel):
+        fake_saml2aws(hang_logins=["test"])
+        helper = _logged_in_helper()
+        helper.call_timeout = 1
+
+        results = run_logins(
+            helper, self.ROLES, list(self.ROLES), str(tmp_path / "credentials"), parallel
+        )
+
+        assert [r.returncode for r in results] == [0, None, 0]
+        assert results[1].error == "saml2aws login timed out after 1s"
+        log_login_summary(results)
+        assert "test: saml2aws login timed out after 1s" in caplog.text
+
+    def test_batch_deadline(self, fake_saml2aws, tmp_path):
+        fake_saml2aws(hang_logins=list(self.ROLES))
+        helper = _logged_in_helper()
+
+        start = time.monotonic()
+        with helper.batch_deadline(1):
+            results = run_logins(
+                helper, self.ROLES, list(self.ROLES), str(tmp_path / "credentials")
+            )
+
+        assert time.monotonic() - start < 10
+        assert [r.returncode for r in results] == [None, None, None]
+        assert all("timed out" in r.error for r in results)
+        assert helper._timeout("login") is None
+
+    def test_timeout_capped_by_batch_deadline(self):
+        helper = _logged_in_helper()
+        helper.call_timeout = 30
+
+        assert helper._timeout("login") == 30
+        with helper.batch_deadline(10):
+            assert 9 < helper._timeout("login") <= 10
+        with helper.batch_deadline(60):
+            assert helper._timeout("login") == 30
+
+    def test_nothing_started_after_batch_deadline(self, fake_saml2aws, tmp_path):
+        calls_log = tmp_path / "calls.log"
+        fake_saml2aws(calls_log=str(calls_log))
+        helper = _logged_in_helper()
+
+        with helper.batch_deadline(0):
+            with pytest.raises(TimeoutError, match="saml2aws login not started"):
+                helper._login(self.ROLES["dev"], "dev", None)
+            with pytest.raises(TimeoutError, match="saml2aws list-roles not started"):
+                helper.run_saml2aws_list_roles()
+
+        # Only the capability probe may have run saml2aws
+        calls = calls_log.read_text().splitlines() if calls_log.exists() else []
+        probes = [json.loads(call)["args"] for call in calls]
+        assert all("--help" in args or "--version" in args for args in probes)
+
+    def test_list_roles_failing_fast_is_not_a_timeout(self, fake_saml2aws):
+        fake_saml2aws(roles=TestListRolesStreaming.ROLES, list_roles_returncode=1)
+        helper = _logged_in_helper()
+        helper.call_timeout = 30
+
+        with pytest.raises(ValueError, match="Failed to retrieve roles with saml2aws."):
+            helper.run_saml2aws_list_roles()
+
+    def test_list_roles_timeout(self, fake_saml2aws, caplog):
+        fake_saml2aws(roles=TestListRolesStreaming.ROLES, hang_list_roles=True)
+        helper = _logged_in_helper()
+        helper.call_timeout = 1
+        caplog.set_level(logging.DEBUG)
+
+        roles = helper.iter_saml2aws_list_roles()
+        assert next(roles) == tuple(TestListRolesStreaming.ROLES[0])
+        with pytest.raises(TimeoutError, match="saml2aws list-roles timed out after 1s"):
+            list(roles)
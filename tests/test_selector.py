@@ -1,12 +1,20 @@
 from unittest.mock import patch
 
+import InquirerPy.inquirer  # noqa: F401 - selector imports it lazily; load it to patch it
 import pytest
+from prompt_toolkit.input import create_pipe_input
+from prompt_toolkit.output import DummyOutput
 
-from saml2awsmulti.selector import prompt_profile_selection, prompt_roles_selection
+from saml2awsmulti.selector import (
+    fuzzy_roles_application,
+    prompt_profile_selection,
+    prompt_roles_fuzzy_selection,
+    prompt_roles_selection,
+)
 
 
 class TestPromptProfileSelection:
-    @patch("saml2awsmulti.selector.inquirer")
+    @patch("InquirerPy.inquirer")
     def test_prompt_profile_selection_success(self, mock_inquirer):
         mock_inquirer.select.return_value.execute.return_value = "dev"
         options = ["dev", "test", "prod"]
@@ -28,7 +36,7 @@ class TestPromptProfileSelection:
         with pytest.raises(ValueError, match="No profiles retrieved for selection"):
             prompt_profile_selection(None)
 
-    @patch("saml2awsmulti.selector.inquirer")
+    @patch("InquirerPy.inquirer")
     def test_prompt_profile_selection_single_option(self, mock_inquirer):
         mock_inquirer.select.return_value.execute.return_value = "dev"
         options = ["dev"]
@@ -38,7 +46,7 @@ class TestPromptProfileSelection:
         assert result == "dev"
         mock_inquirer.select.assert_called_once()
 
-    @patch("saml2awsmulti.selector.inquirer")
+    @patch("InquirerPy.inquirer")
     def test_prompt_profile_selection_cancel(self, mock_inquirer):
         mock_inquirer.select.return_value.execute.return_value = None
         options = ["dev", "test", "prod"]
@@ -49,7 +57,7 @@ class TestPromptProfileSelection:
 
 
 class TestPromptRolesSelection:
-    @patch("saml2awsmulti.selector.inquirer")
+    @patch("InquirerPy.inquirer")
     def test_prompt_roles_selection_success(self, mock_inquirer):
         mock_inquirer.checkbox.return_value.execute.return_value = ["dev", "test"]
         options = ["dev", "test", "prod"]
@@ -60,7 +68,7 @@ class TestPromptRolesSelection:
         assert result == ["dev", "test"]
         mock_inquirer.checkbox.assert_called_once()
 
-    @patch("saml2awsmulti.selector.inquirer")
+    @patch("InquirerPy.inquirer")
     def test_prompt_roles_selection_with_choices(self, mock_inquirer):
         mock_inquirer.checkbox.return_value.execute.return_value = ["dev"]
         options = ["dev", "test", "prod"]
@@ -80,7 +88,7 @@ class TestPromptRolesSelection:
         assert choices[1].enabled is False
         assert choices[2].enabled is False
 
-    @patch("saml2awsmulti.selector.inquirer")
+    @patch("InquirerPy.inquirer")
     def test_prompt_roles_selection_no_last_selected(self, mock_inquirer):
         mock_inquirer.checkbox.return_value.execute.return_value = ["test"]
         options = ["dev", "test", "prod"]
@@ -97,7 +105,7 @@ class TestPromptRolesSelection:
         for choice in choices:
             assert choice.enabled is False
 
-    @patch("saml2awsmulti.selector.inquirer")
+    @patch("InquirerPy.inquirer")
     def test_prompt_roles_selection_multiple_last_selected(self, mock_inquirer):
         mock_inquirer.checkbox.return_value.execute.return_value = ["dev", "prod"]
         options = ["dev", "test", "prod"]
@@ -123,7 +131,7 @@ class TestPromptRolesSelection:
         with pytest.raises(ValueError, match="No roles retrieved for selection"):
             prompt_roles_selection(None, [])
 
-    @patch("saml2awsmulti.selector.inquirer")
+    @patch("InquirerPy.inquirer")
     def test_prompt_roles_selection_cancel(self, mock_inquirer):
         mock_inquirer.checkbox.return_value.execute.return_value = []
         options = ["dev", "test", "prod"]
@@ -133,7 +141,7 @@ class TestPromptRolesSelection:
 
         assert result == []
 
-    @patch("saml2awsmulti.selector.inquirer")
+    @patch("InquirerPy.inquirer")
     def test_prompt_roles_selection_transformer(self, mock_inquirer):
         mock_inquirer.checkbox.return_value.execute.return_value = ["dev", "test"]
         options = ["dev", "test", "prod"]
@@ -155,7 +163,7 @@ class TestPromptRolesSelection:
         result = transformer([])
         assert result == "0 role(s) selected"
 
-    @patch("saml2awsmulti.selector.inquirer")
+    @patch("InquirerPy.inquirer")
     def test_prompt_roles_selection_cycle_enabled(self, mock_inquirer):
         mock_inquirer.checkbox.return_value.execute.return_value = ["dev"]
         options = ["dev", "test", "prod"]
@@ -167,7 +175,7 @@ class TestPromptRolesSelection:
         call_args = mock_inquirer.checkbox.call_args
         assert call_args[1]["cycle"] is True
 
-    @patch("saml2awsmulti.selector.inquirer")
+    @patch("InquirerPy.inquirer")
     def test_prompt_roles_selection_message(self, mock_inquirer):
         mock_inquirer.checkbox.return_value.execute.return_value = ["dev"]
         options = ["dev", "test", "prod"]
@@ -178,3 +186,59 @@ class TestPromptRolesSelection:
         # Verify the message
         call_args = mock_inquirer.checkbox.call_args
         assert call_args[1]["message"] == "Please choose the role"
+
+
+DOWN = "\x1b[B"
+CTRL_A = "\x01"
+CTRL_C = "\x03"
+
+
+class TestPromptRolesFuzzySelection:
+    OPTIONS = ["dev-admin", "prd-admin", "prd-readonly", "sandbox"]
+    LABELS = {"prd-admin": "aws-prd (210987654321)", "prd-readonly": "aws-prd (210987654321)"}
+
+    def _run(self, keys, options=OPTIONS, last_selected=(), labels=LABELS):
+        with create_pipe_input() as pipe_input:
+            app = fuzzy_roles_application(
+                options, last_selected, labels, input=pipe_input, output=DummyOutput()
+            )
+            pipe_input.send_text(keys)
+            return app.run()
+
+    def test_accept_pre_selected(self):
+        assert self._run("\r", last_selected=["sandbox", "dev-admin", "gone"]) == [
+            "dev-admin",
+            "sandbox",
+        ]
+
+    def test_filter_and_toggle(self):
+        # Filtered to prd-admin and prd-readonly; Tab toggles one and moves down
+        assert self._run("prd\t\t\r") == ["prd-admin", "prd-readonly"]
+        assert self._run(f"prd{DOWN}\t\r") == ["prd-readonly"]
+        assert self._run("dev\t\r", last_selected=["dev-admin"]) == []
+
+    def test_filter_by_label(self):
+        assert self._run("2109\t\r") == ["prd-admin"]
+
+    def test_toggle_all_matches(self):
+        assert self._run(f"adm{CTRL_A}\r") == ["dev-admin", "prd-admin"]
+        assert self._run(f"adm{CTRL_A}\r", last_selected=["dev-admin", "prd-admin"]) == []
+
+    def test_cancel(self):
+        with pytest.raises(KeyboardInterrupt):
+            self._run(CTRL_C)
+
+    def test_renders_only_visible_rows(self):
+        options = [f"role-{i}" for i in range(20_000)]
+        with create_pipe_input() as pipe_input:
+            output = DummyOutput()  # 40 rows
+            app = fuzzy_roles_application(options, [], input=pipe_input, output=output)
+            render_matches = app.layout.container.children[1].content.text
+
+            rows = [text for _, text in render_matches() if text.startswith("role-")]
+
+        assert rows == options[: output.get_size().rows - 2]
+
+    def test_empty_options(self):
+        with pytest.raises(ValueError, match="No roles retrieved for selection"):
+            prompt_roles_fuzzy_selection([], [])
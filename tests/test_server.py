@@ -0,0 +1,138 @@
+import http.client
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import pytest
+from botocore.credentials import ContainerProvider
+
+from saml2awsmulti.credential_process import CredentialCache
+from saml2awsmulti.server import CredentialsServer, ProfileCredentialsProvider
+
+TOKEN = "s3cr3t"
+PROFILES = OrderedDict(
+    [
+        ("dev", "arn:aws:iam::123456789012:role/dev"),
+        ("prod", "arn:aws:iam::210987654321:role/prod"),
+    ]
+)
+
+
+def _credentials(role_arn):
+    return {
+        "Version": 1,
+        "AccessKeyId": f"ASIA{role_arn.rsplit('/', 1)[-1].upper()}",
+        "SecretAccessKey": "secret",
+        "SessionToken": "token",
+        "Expiration": datetime(2099, 1, 1, tzinfo=timezone.utc).isoformat(),
+    }
+
+
+@pytest.fixture
+def fetch():
+    with patch("saml2awsmulti.server.fetch_role_credentials") as mock_fetch:
+        mock_fetch.side_effect = lambda helper, role_arn: _credentials(role_arn)
+        yield mock_fetch
+
+
+@pytest.fixture
+def server(fetch):
+    provider = ProfileCredentialsProvider(None, PROFILES, CredentialCache(None))
+    server = CredentialsServer(provider, TOKEN)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _get(server, path, token=TOKEN):
+    host, port = server.server_address[:2]
+    conn = http.client.HTTPConnection(host, port, timeout=5)
+    try:
+        conn.request("GET", path, headers={"Authorization": token} if token else {})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+
+class TestCredentialsServer:
+    def test_invalid_token(self, server, fetch):
+        assert _get(server, "/profiles/dev", token="wrong")[0] == 401
+        assert _get(server, "/profiles/dev", token=None)[0] == 401
+        fetch.assert_not_called()
+
+    def test_list_profiles(self, server):
+        assert _get(server, "/profiles") == (200, ["dev", "prod"])
+
+    def test_get_credentials(self, server, fetch):
+        status, body = _get(server, "/profiles/dev")
+
+        assert status == 200
+        assert body == {
+            "AccessKeyId": "ASIADEV",
+            "SecretAccessKey": "secret",
+            "Token": "token",
+            "Expiration": "2099-01-01T00:00:00+00:00",
+        }
+        # Served from the cache the second time
+        assert _get(server, "/profiles/dev") == (200, body)
+        fetch.assert_called_once()
+
+    def test_unknown_profile(self, server):
+        assert _get(server, "/profiles/unknown")[0] == 404
+        assert _get(server, "/other")[0] == 404
+
+    def test_login_failure(self, server, fetch):
+        fetch.side_effect = ValueError("saml2aws login failed (return code 1)")
+
+        assert _get(server, "/profiles/dev")[0] == 502
+
+    def test_botocore_container_provider(self, server):
+        provider = ContainerProvider(
+            environ={
+                "AWS_CONTAINER_CREDENTIALS_FULL_URI": f"{server.url}/prod",
+                "AWS_CONTAINER_AUTHORIZATION_TOKEN": TOKEN,
+            }
+        )
+        credentials = provider.load().get_frozen_credentials()
+
+        assert credentials.access_key == "ASIAPROD"
+        assert credentials.secret_key == "secret"
+        assert credentials.token == "token"
+
+
+class TestProfileCredentialsProvider:
+    def test_concurrent_misses_login_once(self, fetch):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_fetch(helper, role_arn):
+            started.set()
+            release.wait(5)
+            return _credentials(role_arn)
+
+        fetch.side_effect = slow_fetch
+        provider = ProfileCredentialsProvider(None, PROFILES, CredentialCache(None))
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(provider.get("dev"))) for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        started.wait(5)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        fetch.assert_called_once()
+        assert results == [_credentials(PROFILES["dev"])] * 4
+
+    def test_unknown_profile(self, fetch):
+        provider = ProfileCredentialsProvider(None, PROFILES, CredentialCache(None))
+
+        assert provider.get("unknown") is None
+        fetch.assert_not_called()
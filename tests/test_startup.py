@@ -0,0 +1,107 @@
+"""
+Keep `awslogin` quick to start: heavy dependencies must only be imported on the code paths that
+need them (boto3 for whoami and --use-sts, InquirerPy for the prompts, asyncio for
+AsyncSaml2AwsHelper).
+"""
+
+import os
+import subprocess
+import sys
+from os.path import dirname
+
+import pytest
+
+# Cumulative import time of saml2awsmulti.aws_login, in microseconds. It is ~40ms on a laptop,
+# while importing boto3 and InquirerPy alone takes over 300ms; the budget leaves room for slow
+# CI runners.
+STARTUP_BUDGET_US = 250_000
+
+LAZY_MODULES = ["asyncio", "boto3", "botocore", "http.server", "InquirerPy", "prompt_toolkit"]
+REPO_ROOT = dirname(dirname(__file__))
+
+
+def _import_times(code, env=None):
+    """Run code with -X importtime; return {module: cumulative import time in microseconds}."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=REPO_ROOT,
+    )
+    assert result.returncode == 0, result.stderr
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, module = line.split("|")
+        if cumulative.strip().isdigit():
+            times[module.strip()] = int(cumulative)
+    return times
+
+
+def test_import_time_budget():
+    times = _import_times("import saml2awsmulti.aws_login")
+
+    assert times["saml2awsmulti.aws_login"] < STARTUP_BUDGET_US
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["--help"],
+        ["clean"],
+        ["chained"],
+        ["switch", "--help"],
+        ["whoami", "--help"],
+    ],
+)
+def test_commands_do_not_import_heavy_dependencies(args, tmp_path):
+    code = (
+        "from saml2awsmulti.aws_login import main_cli\n"
+        f"main_cli({args!r}, standalone_mode=False)\n"
+    )
+    times = _import_times(code, env={"HOME": str(tmp_path), "PATH": ""})
+
+    assert [m for m in LAZY_MODULES if m in times] == []
+
+
+def test_shell_completion_does_not_import_heavy_dependencies(tmp_path):
+    env = {
+        "HOME": str(tmp_path),
+        "PATH": "",
+        "_AWSLOGIN_COMPLETE": "bash_complete",
+        "COMP_WORDS": "awslogin cl",
+        "COMP_CWORD": "1",
+    }
+    times = _import_times(
+        "from saml2awsmulti.aws_login import main_cli\nmain_cli(prog_name='awslogin')\n", env
+    )
+
+    assert [m for m in LAZY_MODULES if m in times] == []
+
+
+def test_non_interactive_login_does_not_import_heavy_dependencies(fake_saml2aws, tmp_path):
+    user_data = tmp_path / ".saml2aws-multi"
+    user_data.mkdir()
+    (user_data / "aws_login_roles.csv").write_text("arn:aws:iam::123456789012:role/dev,aws-01\n")
+    (user_data / "aws_login_last_selected.txt").write_text("dev")
+    (tmp_path / ".saml2aws").write_text("[default]\nusername = user\n")
+    cred_file = tmp_path / ".aws" / "credentials"
+    cred_file.parent.mkdir()
+    env = {
+        "HOME": str(tmp_path),
+        "PATH": os.environ["PATH"],
+        "FAKE_SAML2AWS_CONFIG": os.environ["FAKE_SAML2AWS_CONFIG"],
+        "AWS_SHARED_CREDENTIALS_FILE": str(cred_file),
+        "SAML2AWS_PASSWORD": "password",
+    }
+    code = (
+        "from saml2awsmulti.aws_login import main_cli\n"
+        "main_cli(['--last'], standalone_mode=False)\n"
+    )
+
+    times = _import_times(code, env)
+
+    assert "[dev]" in cred_file.read_text()
+    assert [m for m in LAZY_MODULES if m in times] == []
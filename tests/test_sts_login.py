@@ -0,0 +1,168 @@
+import os
+from datetime import datetime, timezone
+from unittest.mock import Mock, patch
+
+import pytest
+from botocore.stub import Stubber
+
+from saml2awsmulti.file_io import get_aws_profiles
+from saml2awsmulti.saml2aws_helper import Saml2AwsHelper
+from saml2awsmulti.sts_login import (
+    assume_roles_with_saml,
+    create_sts_client,
+    get_assertion_expiry,
+    get_role_principal_arns,
+    run_sts_logins,
+)
+from tests.fake_saml2aws import make_saml_assertion
+
+PRINCIPAL_ARN = "arn:aws:iam::123456789012:saml-provider/idp"
+PROFILE_ROLEARN_DICT = {
+    "dev": "arn:aws:iam::123456789012:role/dev",
+    "test": "arn:aws:iam::213456789012:role/test",
+}
+EXPIRATION = datetime(2099, 1, 1, tzinfo=timezone.utc)
+
+
+def _assume_role_response(profile):
+    return {
+        "Credentials": {
+            "AccessKeyId": f"ASIA{profile.upper():0<16}",
+            "SecretAccessKey": "secret",
+            "SessionToken": "token",
+            "Expiration": EXPIRATION,
+        },
+        "AssumedRoleUser": {
+            "AssumedRoleId": "AROA:user",
+            "Arn": f"arn:aws:sts::123456789012:assumed-role/{profile}/user",
+        },
+    }
+
+
+def _stubbed_sts_client(profiles, assertion, duration=None):
+    sts_client = create_sts_client()
+    stubber = Stubber(sts_client)
+    for profile in profiles:
+        expected_params = {
+            "RoleArn": PROFILE_ROLEARN_DICT[profile],
+            "PrincipalArn": PRINCIPAL_ARN,
+            "SAMLAssertion": assertion,
+        }
+        if duration:
+            expected_params["DurationSeconds"] = duration
+        stubber.add_response(
+            "assume_role_with_saml", _assume_role_response(profile), expected_params
+        )
+    stubber.activate()
+    return sts_client, stubber
+
+
+class TestGetRolePrincipalArns:
+    def test_role_then_principal(self):
+        assertion = make_saml_assertion({PROFILE_ROLEARN_DICT["dev"]: PRINCIPAL_ARN})
+        assert get_role_principal_arns(assertion) == {PROFILE_ROLEARN_DICT["dev"]: PRINCIPAL_ARN}
+
+    def test_principal_then_role(self):
+        # Some IdPs put the principal ARN first
+        assertion = make_saml_assertion({PRINCIPAL_ARN: PROFILE_ROLEARN_DICT["dev"]})
+        assert get_role_principal_arns(assertion) == {PROFILE_ROLEARN_DICT["dev"]: PRINCIPAL_ARN}
+
+
+class TestGetAssertionExpiry:
+    def test_not_on_or_after(self):
+        assertion = make_saml_assertion({}, "2030-01-01T00:05:00.123Z")
+        assert (
+            get_assertion_expiry(assertion)
+            == datetime(2030, 1, 1, 0, 5, 0, 123000, tzinfo=timezone.utc).timestamp()
+        )
+
+    def test_no_expiry(self):
+        assert get_assertion_expiry(make_saml_assertion({})) is None
+
+    def test_invalid(self):
+        assert get_assertion_expiry("not base64!") is None
+
+
+class TestAssumeRolesWithSaml:
+    def test_success(self):
+        # Single worker so the stubbed responses are consumed in order
+        assertion = make_saml_assertion(
+            {arn: PRINCIPAL_ARN for arn in PROFILE_ROLEARN_DICT.values()}
+        )
+        sts_client, stubber = _stubbed_sts_client(["dev", "test"], assertion, duration=3600)
+
+        results, credentials = assume_roles_with_saml(
+            sts_client, assertion, PROFILE_ROLEARN_DICT, ["dev", "test"], "3600", max_workers=1
+        )
+
+        stubber.assert_no_pending_responses()
+        assert [r.returncode for r in results] == [0, 0]
+        assert credentials["dev"]["aws_access_key_id"] == "ASIADEV0000000000000"
+        assert credentials["test"]["aws_session_token"] == "token"
+        assert credentials["test"]["x_security_token_expires"] == "2099-01-01T00:00:00+00:00"
+
+    def test_role_missing_from_assertion(self, caplog):
+        assertion = make_saml_assertion({PROFILE_ROLEARN_DICT["dev"]: PRINCIPAL_ARN})
+        sts_client, _ = _stubbed_sts_client(["dev"], assertion)
+
+        with caplog.at_level("ERROR"):
+            results, credentials = assume_roles_with_saml(
+                sts_client, assertion, PROFILE_ROLEARN_DICT, ["dev", "test"], max_workers=1
+            )
+
+        assert [r.returncode for r in results] == [0, 1]
+        assert list(credentials) == ["dev"]
+        assert "test: role not found in the SAML assertion" in caplog.text
+
+    def test_sts_error(self):
+        assertion = make_saml_assertion({PROFILE_ROLEARN_DICT["dev"]: PRINCIPAL_ARN})
+        sts_client = Mock()
+        sts_client.assume_role_with_saml.side_effect = Exception("AccessDenied")
+
+        results, credentials = assume_roles_with_saml(
+            sts_client, assertion, PROFILE_ROLEARN_DICT, ["dev"]
+        )
+
+        assert results[0].returncode == 1
+        assert credentials == {}
+
+
+class TestRunStsLogins:
+    @patch("saml2awsmulti.saml2aws_helper.load_saml2aws_config")
+    @patch("getpass.getpass")
+    def test_with_fake_saml2aws(self, mock_getpass, mock_load_config, fake_saml2aws, tmp_path):
+        mock_load_config.return_value = {"username": "testuser"}
+        mock_getpass.return_value = "testpass"
+        assertion = make_saml_assertion(
+            {arn: PRINCIPAL_ARN for arn in PROFILE_ROLEARN_DICT.values()}
+        )
+        fake_saml2aws(
+            roles=[[arn, "aws-01"] for arn in PROFILE_ROLEARN_DICT.values()], assertion=assertion
+        )
+        sts_client, stubber = _stubbed_sts_client(["dev", "test"], assertion)
+        cred_file = os.path.join(tmp_path, "credentials")
+
+        results = run_sts_logins(
+            Saml2AwsHelper("config_file", None, False),
+            PROFILE_ROLEARN_DICT,
+            ["dev", "test"],
+            cred_file,
+            max_workers=1,
+            sts_client=sts_client,
+        )
+
+        stubber.assert_no_pending_responses()
+        assert all(r.returncode == 0 for r in results)
+        config = get_aws_profiles(cred_file)
+        assert config.sections() == ["dev", "test"]
+        assert config["dev"]["x_principal_arn"].endswith("assumed-role/dev/user")
+
+    def test_no_assertion(self):
+        helper = Mock()
+        helper.run_saml2aws_get_saml_assertion.side_effect = ValueError("no assertion")
+        sts_client = Mock()
+
+        with pytest.raises(ValueError, match="no assertion"):
+            run_sts_logins(helper, PROFILE_ROLEARN_DICT, ["dev"], "unused", sts_client=sts_client)
+
+        sts_client.assume_role_with_saml.assert_not_called()
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+from saml2awsmulti.timings import (
+    Span,
+    disable_timings,
+    enable_timings,
+    format_report,
+    span,
+    write_json_lines,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    clock = FakeClock()
+    yield clock
+    disable_timings()
+
+
+class TestSpans:
+    def test_disabled_is_a_shared_no_op(self):
+        assert span("login") is span("list_roles", profile="dev")
+        with span("login"):
+            pass
+        assert disable_timings() == []
+
+    def test_records_spans(self, clock):
+        enable_timings(clock)
+        clock.now += 1
+        with span("login", profile="dev"):
+            clock.now += 0.25
+
+        spans = disable_timings()
+
+        assert spans == [Span("login", 1.0, 0.25, "MainThread", {"profile": "dev"})]
+        assert span("login") is span("login")
+
+    def test_records_failed_block(self, clock):
+        enable_timings(clock)
+        with pytest.raises(ValueError):
+            with span("list_roles"):
+                clock.now += 2
+                raise ValueError("Failed to retrieve roles with saml2aws.")
+
+        assert [s.duration for s in disable_timings()] == [2]
+
+
+class TestReport:
+    SPANS = [
+        Span("login", 0.5, 0.2, "MainThread", {"profile": "dev"}),
+        Span("password", 0.1, 0.3, "MainThread", {}),
+        Span("login", 0.7, 0.4, "MainThread", {"profile": "test"}),
+    ]
+
+    def test_format_report(self):
+        lines = format_report(self.SPANS).splitlines()
+
+        assert lines[0].split() == [
+            "Phase",
+            "Count",
+            "Total",
+            "(ms)",
+            "Mean",
+            "(ms)",
+            "Max",
+            "(ms)",
+        ]
+        assert lines[1].split() == ["password", "1", "300.0", "300.0", "300.0"]
+        assert lines[2].split() == ["login", "2", "600.0", "300.0", "400.0"]
+
+    def test_write_json_lines(self, tmp_path):
+        filename = tmp_path / "timings.jsonl"
+
+        write_json_lines(str(filename), self.SPANS[:2])
+
+        records = [json.loads(line) for line in filename.read_text().splitlines()]
+        assert records == [
+            {
+                "name": "login",
+                "start_ms": 500.0,
+                "duration_ms": 200.0,
+                "thread": "MainThread",
+                "profile": "dev",
+            },
+            {"name": "password", "start_ms": 100.0, "duration_ms": 300.0, "thread": "MainThread"},
+        ]